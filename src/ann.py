@@ -0,0 +1,174 @@
+import os
+import argparse
+from time import perf_counter
+
+import numpy as np
+
+from src.local_index import ExactIndex, load_vectors, merge_top_k, normalize_rows
+
+
+def spherical_kmeans(
+    vectors: np.ndarray, n_clusters: int, iterations: int = 10, seed: int = 0
+) -> np.ndarray:
+    """K-means on the unit sphere (cosine similarity), returns normalized centroids."""
+    rng = np.random.default_rng(seed)
+    vectors = normalize_rows(vectors)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)]
+    for _ in range(iterations):
+        assignment = assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = np.bincount(assignment, minlength=n_clusters) == 0
+        # Re-seed empty clusters with random points
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+def assign(vectors, centroids: np.ndarray, block_size: int = 65536) -> np.ndarray:
+    """Index of the closest centroid of each row, computed block by block."""
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block_size):
+        block = np.asarray(vectors[start : start + block_size], dtype=np.float32)
+        assignment[start : start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignment
+
+
+class IVFIndex:
+    """
+    Inverted-file (IVF) index over the rows of a local index.
+
+    The corpus is partitioned into `nlist` clusters; a query only scores the rows of its
+    `nprobe` closest clusters. The candidates are scored against the full-precision rows
+    of the memory-mapped matrix, so the final ranking is exact within the probed lists.
+    Files (memory-mapped at load time):
+      - `ivf_centroids.npy`: `(nlist, dim)` normalized centroids
+      - `ivf_ids.npy`: row ids sorted by cluster
+      - `ivf_offsets.npy`: start of each cluster in `ivf_ids.npy` (`nlist + 1` entries)
+    """
+
+    def __init__(self, vectors, centroids, ids, offsets, nprobe: int = 16):
+        self.vectors = vectors
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.ids = ids
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(
+        cls,
+        path: str,
+        nlist: int | None = None,
+        sample_size: int = 100000,
+        iterations: int = 10,
+        seed: int = 0,
+    ):
+        vectors = load_vectors(path)
+        nlist = nlist or max(1, int(4 * np.sqrt(len(vectors))))
+        nlist = min(nlist, len(vectors))
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(len(vectors), min(sample_size, len(vectors)), replace=False)
+        centroids = spherical_kmeans(
+            vectors[np.sort(sample)], min(nlist, len(sample)), iterations, seed
+        )
+        assignment = assign(vectors, centroids)
+        ids = np.argsort(assignment, kind="stable").astype(np.int64)
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=len(centroids)), out=offsets[1:])
+        np.save(os.path.join(path, "ivf_centroids.npy"), centroids)
+        np.save(os.path.join(path, "ivf_ids.npy"), ids)
+        np.save(os.path.join(path, "ivf_offsets.npy"), offsets)
+        return cls(vectors, centroids, ids, offsets)
+
+    @classmethod
+    def load(cls, path: str, nprobe: int = 16):
+        return cls(
+            load_vectors(path),
+            np.load(os.path.join(path, "ivf_centroids.npy")),
+            np.load(os.path.join(path, "ivf_ids.npy"), mmap_mode="r"),
+            np.load(os.path.join(path, "ivf_offsets.npy")),
+            nprobe=nprobe,
+        )
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, queries, k: int, nprobe: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Same contract as `ExactIndex.search`; rows with fewer than k candidates are
+        padded with id -1 and score -inf.
+        """
+        queries = normalize_rows(queries)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        result_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        result_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for row, (query, lists) in enumerate(zip(queries, probes)):
+            candidates = np.concatenate(
+                [self.ids[self.offsets[c] : self.offsets[c + 1]] for c in lists]
+            )
+            if not len(candidates):
+                continue
+            # Sorted ids turn the memory-mapped gather into mostly sequential reads
+            candidates.sort()
+            scores = np.asarray(self.vectors[candidates], dtype=np.float32) @ query
+            ids, scores = merge_top_k(candidates[None, :], scores[None, :], k)
+            result_ids[row, : ids.shape[1]] = ids[0]
+            result_scores[row, : scores.shape[1]] = scores[0]
+        return result_ids, result_scores
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    hits = sum(len(set(t) & set(f[f >= 0])) for t, f in zip(truth.tolist(), found))
+    return hits / truth.size if truth.size else 0.0
+
+
+def sample_queries(vectors, n: int, noise: float = 0.05, seed: int = 0) -> np.ndarray:
+    """Queries near stored stories: random rows with some gaussian noise."""
+    rng = np.random.default_rng(seed)
+    rows = np.asarray(vectors[np.sort(rng.choice(len(vectors), n, replace=False))], np.float32)
+    return normalize_rows(rows + rng.normal(0, noise, rows.shape).astype(np.float32))
+
+
+def recall_report(path: str, nprobes: list[int], k: int = 100, n_queries: int = 100) -> list[dict]:
+    """Recall@k and latency of the IVF index for each `nprobe`, against exact search."""
+    exact = ExactIndex.load(path)
+    ivf = IVFIndex.load(path)
+    queries = sample_queries(exact.vectors, min(n_queries, len(exact)))
+    start = perf_counter()
+    truth = np.concatenate([exact.search(q[None, :], k)[0] for q in queries])
+    exact_ms = 1000 * (perf_counter() - start) / len(queries)
+    report = [{"index": "exact", "recall": 1.0, "ms_per_query": exact_ms}]
+    for nprobe in nprobes:
+        start = perf_counter()
+        found = np.concatenate([ivf.search(q[None, :], k, nprobe=nprobe)[0] for q in queries])
+        ms = 1000 * (perf_counter() - start) / len(queries)
+        report.append(
+            {"index": f"ivf nprobe={nprobe}", "recall": recall_at_k(truth, found), "ms_per_query": ms}
+        )
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or evaluate the IVF index of a local index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build")
+    build_parser.add_argument("--index", default=os.getenv("LOCAL_INDEX_PATH", "index"))
+    build_parser.add_argument("--nlist", type=int, default=None)
+    build_parser.add_argument("--sample-size", type=int, default=100000)
+    build_parser.add_argument("--iterations", type=int, default=10)
+    recall_parser = subparsers.add_parser("recall")
+    recall_parser.add_argument("--index", default=os.getenv("LOCAL_INDEX_PATH", "index"))
+    recall_parser.add_argument("--nprobe", default="1,4,16,64")
+    recall_parser.add_argument("--k", type=int, default=100)
+    recall_parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = perf_counter()
+        index = IVFIndex.build(args.index, args.nlist, args.sample_size, args.iterations)
+        print(f"Built {len(index.centroids)} lists over {len(index)} rows in {perf_counter() - start:.1f}s")
+    else:
+        nprobes = [int(n) for n in args.nprobe.split(",")]
+        for line in recall_report(args.index, nprobes, args.k, args.queries):
+            print(f"{line['index']:>20}  recall@{args.k}={line['recall']:.3f}  {line['ms_per_query']:.2f} ms/query")
@@ -90,7 +90,9 @@ async def handle_llm_search(client: httpx.AsyncClient, handler: StdOutHandler):
         timeout=120.0,
     ) as response:
 
-        results = []
+        results = {}
+        ranking = None
+        stories = {}
 
         async for line in response.aiter_lines():
             if not line:
@@ -109,15 +111,27 @@ async def handle_llm_search(client: httpx.AsyncClient, handler: StdOutHandler):
                 handler.on_new_chunk(data["chunk"])
             elif "results" in data and "query" in data:
                 handler.on_new_results(data["query"], data["results"])
-                results.append(data["results"])
+                # The server may top up the results of a query in a later event
+                results.setdefault(data["query"], []).extend(data["results"])
+                stories.update((story["hn_id"], story) for story in data["results"])
+            elif "ranking" in data:
+                # Final top-k fused on the server
+                stories.update((story["hn_id"], story) for story in data["stories"])
+                ranking = data["ranking"]
+            elif "timings" in data:
+                # Server-side stage timings, not shown
+                continue
             elif "done" in data:
                 break
             else:
                 handler.error(Exception(f"Invalid data: {data}"))
                 return
             
-        number_of_results = sum(len(r) for r in results)
-        st.session_state.results = interleave_lists(results)
+        if ranking is not None:
+            st.session_state.results = [stories[hn_id] for hn_id in ranking]
+            return
+        number_of_results = sum(len(r) for r in results.values())
+        st.session_state.results = interleave_lists(list(results.values()))
         st.session_state.duplicate_results = (
             number_of_results - len(st.session_state.results)
         )
@@ -0,0 +1,354 @@
+import asyncio
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+
+import numpy as np
+from weaviate.classes.data import DataObject
+from weaviate.classes.query import Filter, MetadataQuery, Sort
+from weaviate.util import generate_uuid5
+
+from src.local_index import ExactIndex, IndexWriter, load_vectors, merge_top_k, normalize_rows
+from src.metadata import MetadataStore, load_metadata
+from src.ann import IVFIndex
+from src.quantization import QuantizedIndex
+from src.sharding import ShardedIndex
+
+
+def story_from_properties(properties: dict) -> dict:
+    """Serialized story of the properties of a Weaviate object."""
+    return {
+        "title": properties.get("text", ""),
+        "url": properties.get("url", ""),
+        "hn_id": properties.get("hn_id", ""),
+    }
+
+
+def story_object(story: dict, vector) -> DataObject:
+    """
+    Weaviate object of a story, with the properties written by `WeaviateVectorStore`.
+    Its UUID is derived from the `hn_id`, so inserting a story twice overwrites it.
+    """
+    return DataObject(
+        properties={"text": story["title"], "url": story["url"], "hn_id": story["hn_id"]},
+        uuid=generate_uuid5(story["hn_id"]),
+        vector=[float(x) for x in vector],
+    )
+
+
+def with_scores(hits: list[tuple[dict, float]]) -> list[dict]:
+    """Serialized stories of a backend result list, each carrying its score."""
+    return [{**story, "score": score} for story, score in hits]
+
+
+class SearchBackend(ABC):
+    """
+    Vector search engine behind `search_stories`.
+    """
+
+    @abstractmethod
+    async def is_ready(self) -> bool:
+        pass
+
+    @abstractmethod
+    async def search(
+        self, queries: list[str], vectors: list[list[float]], k: int, offset: int = 0
+    ) -> list[list[tuple[dict, float]]]:
+        """
+        Returns, for each query, the serialized stories of its results ranked from `offset`
+        to `offset + k` with their scores (higher is more relevant).
+        """
+        pass
+
+    @abstractmethod
+    async def fetch(self, hn_ids: list[int]) -> list[dict]:
+        """Returns the serialized stories with the given `hn_id`s, in the same order."""
+        pass
+
+    @abstractmethod
+    async def upsert(self, vectors: list[list[float]], stories: list[dict]) -> int:
+        """Adds the stories that are not indexed yet and returns how many were added."""
+        pass
+
+    @abstractmethod
+    async def delete(self, hn_ids: list[int]):
+        pass
+
+    @abstractmethod
+    async def max_hn_id(self) -> int:
+        """Highest `hn_id` in the index (0 if it is empty)."""
+        pass
+
+    async def connect(self):
+        """Opens the connections of the backend, before its first query."""
+        pass
+
+    async def close(self):
+        pass
+
+
+class WeaviateBackend(SearchBackend):
+    """
+    Hybrid search on Weaviate Cloud with the async client, so queries run on the event
+    loop instead of blocking it or a worker thread.
+
+    With a local metadata store, the queries only ask Weaviate for the `hn_id` and the
+    score of each hit, and the stories are read from the store; the few `hn_id`s it
+    does not know are fetched from Weaviate.
+    """
+
+    def __init__(self, client, index_name: str, metadata: MetadataStore | None = None):
+        self.client = client
+        self.index_name = index_name
+        self.metadata = metadata
+        self.collection = client.collections.get(index_name)
+
+    async def connect(self):
+        await self.client.connect()
+
+    async def is_ready(self) -> bool:
+        return await self.client.is_ready()
+
+    async def _hybrid(self, query, vector, k, offset, properties):
+        response = await self.collection.query.hybrid(
+            query=query,
+            vector=vector,
+            limit=k,
+            offset=offset,
+            return_properties=properties,
+            return_metadata=MetadataQuery(score=True),
+        )
+        return response.objects
+
+    async def _search_with_metadata(self, queries, vectors, k, offset):
+        responses = await asyncio.gather(
+            *(self._hybrid(query, vector, k, offset, ["hn_id"]) for query, vector in zip(queries, vectors))
+        )
+        hits = [[(obj.properties["hn_id"], obj.metadata.score) for obj in objects] for objects in responses]
+        hn_ids = list({hn_id for query_hits in hits for hn_id, _ in query_hits})
+        stories = {story["hn_id"]: story for story in await self.fetch(hn_ids)}
+        return [
+            [(stories[hn_id], score) for hn_id, score in query_hits if hn_id in stories]
+            for query_hits in hits
+        ]
+
+    async def search(self, queries, vectors, k, offset=0):
+        if self.metadata is not None:
+            return await self._search_with_metadata(queries, vectors, k, offset)
+        responses = await asyncio.gather(
+            *(
+                self._hybrid(query, vector, k, offset, ["text", "url", "hn_id"])
+                for query, vector in zip(queries, vectors)
+            )
+        )
+        return [
+            [(story_from_properties(obj.properties), obj.metadata.score) for obj in objects]
+            for objects in responses
+        ]
+
+    async def fetch(self, hn_ids):
+        if not hn_ids:
+            return []
+        # Stories are read from the metadata store when it has them, from Weaviate otherwise
+        by_id = {}
+        if self.metadata is not None:
+            for hn_id, row in zip(hn_ids, self.metadata.rows(hn_ids)):
+                if row is not None:
+                    by_id[hn_id] = self.metadata[row]
+        missing = [hn_id for hn_id in hn_ids if hn_id not in by_id]
+        if missing:
+            response = await self.collection.query.fetch_objects(
+                filters=Filter.by_property("hn_id").contains_any(missing), limit=len(missing)
+            )
+            for obj in response.objects:
+                story = story_from_properties(obj.properties)
+                by_id[story["hn_id"]] = story
+        return [by_id[hn_id] for hn_id in hn_ids if hn_id in by_id]
+
+    async def upsert(self, vectors, stories):
+        if not stories:
+            return 0
+        result = await self.collection.data.insert_many([story_object(s, v) for s, v in zip(stories, vectors)])
+        if result.errors:
+            raise RuntimeError(f"{len(result.errors)} stories could not be inserted")
+        if self.metadata is not None:
+            known = self.metadata.rows([story["hn_id"] for story in stories])
+            new_stories = [story for story, row in zip(stories, known) if row is None]
+            await asyncio.to_thread(self.metadata.append, new_stories)
+        return len(stories)
+
+    async def delete(self, hn_ids):
+        if hn_ids:
+            await self.collection.data.delete_many(where=Filter.by_property("hn_id").contains_any(hn_ids))
+
+    async def max_hn_id(self):
+        response = await self.collection.query.fetch_objects(
+            sort=Sort.by_property("hn_id", ascending=False), limit=1, return_properties=["hn_id"]
+        )
+        return int(response.objects[0].properties["hn_id"]) if response.objects else 0
+
+    async def close(self):
+        if self.metadata is not None:
+            self.metadata.close()
+        await self.client.close()
+
+
+class LocalBackend(SearchBackend):
+    """
+    In-process search over a local index directory (see `src.local_index`).
+    The scoring runs in a worker thread: numpy releases the GIL during matrix products,
+    and the index only yields row ids that are resolved in the metadata store.
+
+    Stories upserted after the index was built form a small "delta" segment, kept in RAM
+    and searched exactly next to the main index; they are also appended to the index
+    directory, and the rows not covered by the IVF or quantized structures are loaded
+    back as the delta on restart. Deleted stories are tombstones listed in `deleted.json`.
+    """
+
+    def __init__(self, index, metadata: MetadataStore, path: str | None = None, delta=None, deleted=()):
+        self.index = index
+        self.metadata = metadata
+        self.path = path
+        self.delta = None if delta is None or len(delta) == 0 else normalize_rows(delta)
+        self.base_count = len(metadata) - (0 if self.delta is None else len(self.delta))
+        self.deleted_rows = frozenset(self._rows(deleted))
+        self.writer = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        kind: str = "exact",
+        block_size: int = 65536,
+        nprobe: int = 16,
+        oversample: int = 10,
+        shards: int = 4,
+        workers: int | None = None,
+        metadata_path: str | None = None,
+    ):
+        if kind == "exact":
+            index = ExactIndex.load(path, block_size=block_size)
+        elif kind == "ivf":
+            index = IVFIndex.load(path, nprobe=nprobe)
+        elif kind in ("binary", "int8"):
+            index = QuantizedIndex.load(path, kind, oversample=oversample)
+        elif kind == "sharded":
+            index = ShardedIndex(path, n_shards=shards, n_workers=workers, block_size=block_size)
+        else:
+            raise ValueError(f"Unknown local index kind: {kind}")
+        metadata = load_metadata(path, metadata_path)
+        # The IVF lists only cover the rows that existed when they were built
+        indexed = len(index.ids) if kind == "ivf" else len(index)
+        delta = np.asarray(load_vectors(path)[indexed:], dtype=np.float32)
+        deleted = []
+        deleted_path = os.path.join(path, "deleted.json")
+        if os.path.exists(deleted_path):
+            with open(deleted_path) as f:
+                deleted = json.load(f)
+        return cls(index, metadata, path=path, delta=delta, deleted=deleted)
+
+    def _rows(self, hn_ids):
+        return [row for row in self.metadata.rows(hn_ids) if row is not None]
+
+    async def is_ready(self) -> bool:
+        return True
+
+    def _top(self, vectors, k, delta):
+        ids, scores = self.index.search(vectors, k)
+        if delta is not None:
+            delta_scores = normalize_rows(vectors) @ delta.T
+            delta_ids = np.broadcast_to(
+                np.arange(self.base_count, self.base_count + len(delta)), delta_scores.shape
+            )
+            ids, scores = merge_top_k(
+                np.concatenate([ids, delta_ids], axis=1),
+                np.concatenate([scores, delta_scores], axis=1),
+                k,
+            )
+        return ids, scores
+
+    def _search(self, vectors, k):
+        delta, deleted = self.delta, self.deleted_rows
+        if not deleted:
+            return (*self._top(vectors, k, delta), deleted)
+        # Over-fetch so that tombstones do not leave the result lists short: by k at first,
+        # doubled while a list is still short, and never by more than the number of tombstones
+        limit = k + len(deleted)
+        fetch = min(2 * k, limit)
+        tombstones = np.fromiter(deleted, dtype=np.int64, count=len(deleted))
+        while True:
+            ids, scores = self._top(vectors, fetch, delta)
+            live = (ids >= 0) & ~np.isin(ids, tombstones)
+            # A list with missing ids already holds every candidate of the index
+            short = (live.sum(axis=1) < k) & (ids >= 0).all(axis=1)
+            if fetch >= limit or ids.shape[1] < fetch or not short.any():
+                return ids, scores, deleted
+            fetch = min(2 * fetch, limit)
+
+    async def search(self, queries, vectors, k, offset=0):
+        ids, scores, deleted = await asyncio.to_thread(
+            self._search, np.asarray(vectors, dtype=np.float32), offset + k
+        )
+        results = []
+        for row_ids, row_scores in zip(ids.tolist(), scores.tolist()):
+            hits = [
+                (self.metadata[i], float(score))
+                for i, score in zip(row_ids, row_scores)
+                if i >= 0 and i not in deleted
+            ]
+            results.append(hits[offset : offset + k])
+        return results
+
+    async def fetch(self, hn_ids):
+        deleted = self.deleted_rows
+        return [self.metadata[row] for row in self._rows(hn_ids) if row not in deleted]
+
+    def _upsert(self, vectors, stories):
+        with self.lock:
+            known = self.metadata.rows([story["hn_id"] for story in stories])
+            new = [(vector, story) for vector, story, row in zip(vectors, stories, known) if row is None]
+            if not new:
+                return 0
+            vectors = normalize_rows([vector for vector, _ in new])
+            stories = [story for _, story in new]
+            if self.path is not None:
+                if self.writer is None:
+                    self.writer = IndexWriter(self.path)
+                self.writer.add(vectors, stories)
+                self.writer.flush()
+            # Metadata first: a search must never see a delta row without its story
+            self.metadata.append(stories)
+            self.delta = vectors if self.delta is None else np.concatenate([self.delta, vectors])
+            return len(stories)
+
+    async def upsert(self, vectors, stories):
+        if not stories:
+            return 0
+        return await asyncio.to_thread(self._upsert, vectors, stories)
+
+    def _delete(self, hn_ids):
+        with self.lock:
+            self.deleted_rows = self.deleted_rows | frozenset(self._rows(hn_ids))
+            if self.path is None:
+                return
+            deleted = sorted(self.metadata[row]["hn_id"] for row in self.deleted_rows)
+            tmp_path = os.path.join(self.path, "deleted.json.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(deleted, f)
+            os.replace(tmp_path, os.path.join(self.path, "deleted.json"))
+
+    async def delete(self, hn_ids):
+        if hn_ids:
+            await asyncio.to_thread(self._delete, hn_ids)
+
+    async def max_hn_id(self):
+        return self.metadata.max_hn_id()
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.metadata.close()
+        if hasattr(self.index, "close"):
+            self.index.close()
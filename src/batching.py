@@ -0,0 +1,120 @@
+import asyncio
+from time import perf_counter
+from langchain_core.embeddings import Embeddings
+
+from src.utils import CustomHFEmbeddings
+
+
+class BatchStats:
+    """
+    Counters describing how well the scheduler coalesces requests.
+    """
+
+    def __init__(self):
+        self.batches = 0
+        self.items = 0
+        self.max_batch_size = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.errors = 0
+
+    def record(self, size: int, waits: list[float]):
+        self.batches += 1
+        self.items += size
+        self.max_batch_size = max(self.max_batch_size, size)
+        self.total_wait += sum(waits)
+        self.max_wait = max(self.max_wait, max(waits, default=0.0))
+
+    def as_dict(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "errors": self.errors,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "avg_wait_ms": 1000 * self.total_wait / self.items if self.items else 0.0,
+            "max_wait_ms": 1000 * self.max_wait,
+        }
+
+
+class EmbeddingBatcher(Embeddings):
+    """
+    Micro-batching scheduler in front of `CustomHFEmbeddings`.
+
+    Texts embedded concurrently (subqueries of the same request or different users) are
+    collected for at most `max_wait` seconds, or until `max_batch_size` texts are pending,
+    and sent to the endpoint as a single `inputs: [...]` call. Each caller awaits its own future.
+    """
+
+    def __init__(
+        self,
+        embedder: CustomHFEmbeddings,
+        max_batch_size: int = 32,
+        max_wait: float = 0.005,
+    ):
+        super().__init__()
+        self.embedder = embedder
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.stats = BatchStats()
+        self._pending: list[tuple[str, asyncio.Future, float]] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    def embed_query(self, text):
+        return self.embedder.embed_query(text)
+
+    def embed_documents(self, texts):
+        return self.embedder.embed_documents(texts)
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+    async def aembed_documents(self, texts):
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self._pending.append((text, future, perf_counter()))
+            futures.append(future)
+            if len(self._pending) >= self.max_batch_size:
+                self._flush()
+        if self._pending and self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        while self._pending:
+            batch = self._pending[: self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size :]
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list[tuple[str, asyncio.Future, float]]):
+        now = perf_counter()
+        self.stats.record(len(batch), [now - enqueued for _, _, enqueued in batch])
+        texts = [text for text, _, _ in batch]
+        try:
+            vectors = await self.embedder.aembed_documents(texts)
+        except Exception as e:
+            self.stats.errors += 1
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+    async def aclose(self):
+        if self._pending:
+            self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.embedder.aclose()
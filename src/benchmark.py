@@ -0,0 +1,462 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+from functools import lru_cache
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from src.expansion import STOPWORDS, LocalExpander, tokenize
+from src.local_index import IndexWriter
+from src.lexical import build_lexical_index
+from src.metadata import MetadataStore, MetadataWriter
+
+
+# Deterministic stand-ins for the external services
+
+
+@lru_cache(maxsize=100000)
+def _token_vector(token: str, dim: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+
+def fake_embedding(text: str, dim: int = 64) -> np.ndarray:
+    """
+    Bag-of-words embedding: every word has a fixed random direction, so that texts
+    sharing words are similar and the search results are meaningful.
+    """
+    tokens = [token for token in tokenize(text) if token not in STOPWORDS] or [text]
+    vector = np.sum([_token_vector(token, dim) for token in tokens], axis=0)
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+
+def make_embedder_app(dim: int = 64, latency: float = 0.02, per_item_latency: float = 0.001):
+    """Embedding endpoint with the request/response format of the HF inference API."""
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+
+    async def embed(request):
+        inputs = (await request.json())["inputs"]
+        texts = [inputs] if isinstance(inputs, str) else inputs
+        await asyncio.sleep(latency + per_item_latency * len(texts))
+        return JSONResponse([fake_embedding(text, dim).tolist() for text in texts])
+
+    return Starlette(routes=[Route("/", embed, methods=["POST"])])
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Streaming chat model that answers with the keyphrases of the bio (as extracted by
+    `LocalExpander`), one word per token, after `first_token_latency` seconds and then
+    every `token_latency` seconds.
+    """
+
+    first_token_latency: float = 0.3
+    token_latency: float = 0.01
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming"
+
+    def _answer(self, messages) -> list[str]:
+        bio = messages[-1].content.rsplit("User Input:", 1)[-1]
+        return re.findall(r"\s*\S+", "\n".join(LocalExpander(None).expand(bio)))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._answer(messages)
+        time.sleep(self.first_token_latency + self.token_latency * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.first_token_latency)
+        for i, token in enumerate(self._answer(messages)):
+            if i:
+                await asyncio.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+def build_fake_index(path: str, texts: list[str], n_stories: int = 100000, dim: int = 64, seed: int = 0):
+    """Local index (and lexical index) of synthetic titles drawn from the vocabulary of the workload."""
+    rng = random.Random(seed)
+    vocabulary = sorted({token for text in texts for token in tokenize(text) if token not in STOPWORDS})
+    vocabulary += [f"word{i}" for i in range(max(1000, len(vocabulary)))]
+    writer = IndexWriter(path, dtype="float16")
+    metadata = MetadataWriter(os.path.join(path, "metadata"))
+    for start in range(0, n_stories, 10000):
+        stories = []
+        for hn_id in range(start + 1, min(n_stories, start + 10000) + 1):
+            title = " ".join(rng.choices(vocabulary, k=rng.randint(3, 8))).capitalize()
+            stories.append({"title": title, "url": f"https://example.com/{hn_id}", "hn_id": hn_id})
+        writer.add(np.stack([fake_embedding(story["title"], dim) for story in stories]), stories)
+        metadata.add(stories)
+    writer.close()
+    metadata.close()
+    build_lexical_index(MetadataStore.load(os.path.join(path, "metadata")).titles(), os.path.join(path, "lexical"))
+
+
+def load_workload(path: str, field: str = "user_input") -> list[str]:
+    texts = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                text = json.loads(line).get(field)
+                if text:
+                    texts.append(text)
+    if not texts:
+        raise ValueError(f"No `{field}` field in {path}")
+    return texts
+
+
+def serve(args):
+    """Runs the API against the fakes (LLM, embedder) and a synthetic local index."""
+    import uvicorn
+
+    texts = load_workload(args.workload, args.field)
+    index_path = args.index
+    temporary_dir = None
+    if index_path is None:
+        temporary_dir = tempfile.mkdtemp(prefix="bench_index_")
+        index_path = os.path.join(temporary_dir, "index")
+        print(f"Building a fake index of {args.stories} stories in {index_path}")
+        build_fake_index(index_path, texts, args.stories, args.dim)
+
+    embedder_server = uvicorn.Server(
+        uvicorn.Config(
+            make_embedder_app(args.dim, args.embed_ms / 1000, args.embed_item_ms / 1000),
+            host="127.0.0.1",
+            port=args.embedder_port,
+            log_level="warning",
+        )
+    )
+    threading.Thread(target=embedder_server.run, daemon=True).start()
+
+    os.environ.update(
+        {
+            "EMBEDDER_ENDPOINT_URL": f"http://127.0.0.1:{args.embedder_port}/",
+            "EMBEDDER_MODEL_ID": f"fake-{args.dim}",
+            "SEARCH_BACKEND": "local",
+            "LOCAL_INDEX_PATH": index_path,
+        }
+    )
+    if args.cold:
+        os.environ.update(
+            {"RESULT_CACHE_TTL": "0", "EXPANSION_CACHE_SIZE": "0", "EMBEDDING_CACHE_SIZE": "0"}
+        )
+    os.environ.pop("EMBEDDING_CACHE_DIR", None)
+    os.environ.pop("DELTA_SOURCE", None)
+
+    import src.main as main
+
+    # make_chain builds `prompt | ChatOpenAI(...)`: the fake model keeps the prompt in the loop
+    main.ChatOpenAI = lambda **kwargs: FakeChatModel(
+        first_token_latency=args.llm_first_token_ms / 1000, token_latency=args.llm_token_ms / 1000
+    )
+    try:
+        uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+    finally:
+        if temporary_dir is not None:
+            shutil.rmtree(temporary_dir, ignore_errors=True)
+
+
+# Load generation
+
+
+async def measure_search(client: httpx.AsyncClient, text: str, k: int) -> dict:
+    start = time.perf_counter()
+    response = await client.post("/search", json={"user_input": text, "k": k})
+    response.raise_for_status()
+    response.read()
+    latency = time.perf_counter() - start
+    return {"latency": latency, "ttfr": latency}
+
+
+async def measure_search_llm(client: httpx.AsyncClient, text: str, k: int) -> dict:
+    start = time.perf_counter()
+    record = {"ttfc": None, "ttfr": None}
+    async with client.stream("POST", "/search_llm", json={"user_input": text, "k": k}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[len("data: ") :])
+            elapsed = time.perf_counter() - start
+            if "chunk" in event and record["ttfc"] is None:
+                record["ttfc"] = elapsed
+            elif "results" in event and record["ttfr"] is None:
+                record["ttfr"] = elapsed
+            elif "error" in event:
+                raise RuntimeError(event["error"])
+            elif "done" in event:
+                break
+    record["latency"] = time.perf_counter() - start
+    return record
+
+
+MEASURES = {"search": measure_search, "search_llm": measure_search_llm}
+
+
+async def replay(
+    base_url: str,
+    texts: list[str],
+    endpoints: list[str],
+    requests: int,
+    k: int = 500,
+    concurrency: int = 8,
+    rate: float | None = None,
+    poisson: bool = False,
+    timeout: float = 120.0,
+) -> tuple[list[dict], float]:
+    """
+    Sends `requests` requests cycling over the workload (and over `endpoints`), either
+    closed-loop with `concurrency` clients, or open-loop at `rate` requests per second
+    (constant or Poisson arrivals), so that queueing shows up in the latencies.
+    """
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    records = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+
+        async def one(i):
+            endpoint = endpoints[i % len(endpoints)]
+            record = {"endpoint": endpoint}
+            try:
+                record.update(await MEASURES[endpoint](client, texts[i % len(texts)], k))
+                record["ok"] = True
+            except Exception as e:
+                record.update(ok=False, error=f"{type(e).__name__}: {e}")
+            records.append(record)
+
+        start = time.perf_counter()
+        if rate is None:
+            counter = iter(range(requests))
+
+            async def client_loop():
+                for i in counter:
+                    await one(i)
+
+            await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        else:
+            tasks = []
+            next_time = start
+            for i in range(requests):
+                next_time += random.expovariate(rate) if poisson else 1 / rate
+                await asyncio.sleep(max(0.0, next_time - time.perf_counter()))
+                tasks.append(asyncio.create_task(one(i)))
+            await asyncio.gather(*tasks)
+        wall = time.perf_counter() - start
+    return records, wall
+
+
+def percentiles(values: list[float]) -> dict | None:
+    if not values:
+        return None
+    values = 1000 * np.asarray(values)
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean()),
+    }
+
+
+def summarize(records: list[dict], wall: float) -> dict:
+    summary = {}
+    for endpoint in sorted({record["endpoint"] for record in records}):
+        ok = [r for r in records if r["endpoint"] == endpoint and r["ok"]]
+        errors = [r for r in records if r["endpoint"] == endpoint and not r["ok"]]
+        summary[endpoint] = {
+            "requests": len(ok) + len(errors),
+            "errors": len(errors),
+            "throughput_rps": len(ok) / wall if wall else 0.0,
+            "latency": percentiles([r["latency"] for r in ok]),
+            "time_to_first_chunk": percentiles([r["ttfc"] for r in ok if r.get("ttfc") is not None]),
+            "time_to_first_results": percentiles([r["ttfr"] for r in ok if r.get("ttfr") is not None]),
+            "sample_errors": sorted({r["error"] for r in errors})[:5],
+        }
+    return summary
+
+
+def print_summary(summary: dict):
+    for endpoint, stats in summary.items():
+        print(f"{endpoint}: {stats['requests']} requests, {stats['errors']} errors, {stats['throughput_rps']:.1f} req/s")
+        for metric in ("latency", "time_to_first_chunk", "time_to_first_results"):
+            if stats[metric]:
+                values = stats[metric]
+                print(
+                    f"  {metric:<22} p50 {values['p50_ms']:8.1f} ms  p95 {values['p95_ms']:8.1f} ms"
+                    f"  p99 {values['p99_ms']:8.1f} ms"
+                )
+
+
+async def wait_until_up(
+    base_url: str, server: subprocess.Popen | None = None, log_path: str | None = None, timeout: float = 300.0
+):
+    """Waits for the server to answer, failing at once if its process (when given) exits."""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=2.0) as client:
+        while time.monotonic() < deadline:
+            if server is not None and server.poll() is not None:
+                output = ""
+                if log_path is not None:
+                    with open(log_path, errors="replace") as f:
+                        output = "".join(f.readlines()[-20:])
+                raise RuntimeError(f"The server exited with code {server.returncode} before starting:\n{output}")
+            try:
+                if (await client.get("/keep_alive")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.5)
+    raise TimeoutError(f"The server at {base_url} did not start")
+
+
+def run(args):
+    texts = load_workload(args.workload, args.field)
+    endpoints = args.endpoints.split(",")
+    server = log_path = None
+    temporary_dir = None
+    base_url = args.url
+    if base_url is None and args.index is None:
+        temporary_dir = tempfile.mkdtemp(prefix="bench_index_")
+        args.index = os.path.join(temporary_dir, "index")
+        print(f"Building a fake index of {args.stories} stories in {args.index}")
+        build_fake_index(args.index, texts, args.stories, args.dim)
+    if base_url is None:
+        # The server runs in its own process, so that the load generator does not steal its CPU
+        command = [sys.executable, "-m", "src.benchmark", "serve"] + [
+            f"--{name.replace('_', '-')}={value}"
+            for name, value in vars(args).items()
+            if name in SERVE_OPTIONS and value is not None
+        ]
+        if args.cold:
+            command.append("--cold")
+        # Its output goes to a log file, whose end is reported if it fails to start
+        with tempfile.NamedTemporaryFile(prefix="bench_server_", suffix=".log", delete=False) as log:
+            log_path = log.name
+        print(f"Server logs: {log_path}")
+        with open(log_path, "wb") as log:
+            server = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+        base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        asyncio.run(wait_until_up(base_url, server, log_path))
+        if args.warmup:
+            asyncio.run(replay(base_url, texts, endpoints, args.warmup, args.k, args.concurrency))
+        started_at = datetime.now(timezone.utc).isoformat()
+        records, wall = asyncio.run(
+            replay(
+                base_url,
+                texts,
+                endpoints,
+                args.requests,
+                k=args.k,
+                concurrency=args.concurrency,
+                rate=args.rate,
+                poisson=args.poisson,
+            )
+        )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if temporary_dir is not None:
+            shutil.rmtree(temporary_dir, ignore_errors=True)
+    summary = summarize(records, wall)
+    print_summary(summary)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(
+                {
+                    "started_at": started_at,
+                    "wall_seconds": wall,
+                    "config": {**vars(args), "func": None},
+                    "endpoints": summary,
+                },
+                f,
+                indent=2,
+            )
+        print(f"Results saved to {args.out}")
+
+
+def compare(args):
+    """Prints the relative change of each metric between two saved runs."""
+    with open(args.base) as f:
+        base = json.load(f)["endpoints"]
+    with open(args.new) as f:
+        new = json.load(f)["endpoints"]
+    for endpoint in sorted(base.keys() & new.keys()):
+        print(endpoint)
+        rows = [("throughput_rps", base[endpoint]["throughput_rps"], new[endpoint]["throughput_rps"])]
+        for metric in ("latency", "time_to_first_chunk", "time_to_first_results"):
+            if base[endpoint][metric] and new[endpoint][metric]:
+                for quantile in ("p50_ms", "p95_ms", "p99_ms"):
+                    rows.append(
+                        (f"{metric} {quantile}", base[endpoint][metric][quantile], new[endpoint][metric][quantile])
+                    )
+        for name, before, after in rows:
+            change = 100 * (after - before) / before if before else 0.0
+            print(f"  {name:<32} {before:10.1f} -> {after:10.1f}  ({change:+.1f}%)")
+
+
+SERVE_OPTIONS = {
+    "workload", "field", "index", "stories", "dim", "port", "embedder_port",
+    "embed_ms", "embed_item_ms", "llm_first_token_ms", "llm_token_ms",
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark of the API against local fakes")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_serve_options(command):
+        command.add_argument("--workload", default="requests.jsonl", help="JSONL file of requests")
+        command.add_argument("--field", default="user_input")
+        command.add_argument("--index", help="Existing local index (default: a fake one built from the workload)")
+        command.add_argument("--stories", type=int, default=100000, help="Size of the fake index")
+        command.add_argument("--dim", type=int, default=64, help="Dimension of the fake embeddings")
+        command.add_argument("--port", type=int, default=8765)
+        command.add_argument("--embedder-port", type=int, default=8766)
+        command.add_argument("--embed-ms", type=float, default=20.0, help="Latency of an embedding call")
+        command.add_argument("--embed-item-ms", type=float, default=1.0, help="Extra latency per embedded text")
+        command.add_argument("--llm-first-token-ms", type=float, default=300.0)
+        command.add_argument("--llm-token-ms", type=float, default=15.0)
+        command.add_argument("--cold", action="store_true", help="Disable the result, expansion and embedding caches")
+
+    serve_parser = commands.add_parser("serve", help="Run the API against the fakes")
+    add_serve_options(serve_parser)
+    serve_parser.set_defaults(func=serve)
+
+    run_parser = commands.add_parser("run", help="Replay a workload and report latencies")
+    add_serve_options(run_parser)
+    run_parser.add_argument("--url", help="Benchmark an already running server instead of starting one")
+    run_parser.add_argument("--endpoints", default="search_llm", help="Comma-separated: search, search_llm")
+    run_parser.add_argument("--requests", type=int, default=200)
+    run_parser.add_argument("--warmup", type=int, default=10)
+    run_parser.add_argument("--k", type=int, default=500)
+    run_parser.add_argument("--concurrency", type=int, default=8, help="Closed-loop clients")
+    run_parser.add_argument("--rate", type=float, help="Open-loop arrival rate (requests/s) instead of clients")
+    run_parser.add_argument("--poisson", action="store_true", help="Poisson arrivals in open-loop mode")
+    run_parser.add_argument("--out", help="Save the results as JSON")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="Compare two saved runs")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
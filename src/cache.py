@@ -0,0 +1,501 @@
+import os
+import json
+import asyncio
+import hashlib
+import argparse
+import threading
+import unicodedata
+from collections import OrderedDict, deque
+from time import monotonic
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_text(text: str) -> str:
+    """Normalize a text before using it as a cache key (unicode form and whitespace)."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class MemoryTier:
+    """
+    Bounded LRU of embedding vectors, stored as compact numpy arrays.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.entries: OrderedDict[bytes, np.ndarray] = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key: bytes) -> np.ndarray | None:
+        vector = self.entries.get(key)
+        if vector is not None:
+            self.entries.move_to_end(key)
+        return vector
+
+    def put(self, key: bytes, vector: np.ndarray):
+        if self.capacity <= 0:
+            return
+        self.entries[key] = vector
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class DiskTier:
+    """
+    Persistent tier backed by a memory-mapped `(capacity, dim)` matrix.
+
+    Slots are filled as a ring buffer: once `capacity` vectors are stored, the oldest slot
+    is overwritten. The key of every write is appended to `keys.bin`, so the key -> slot
+    mapping can be rebuilt when the process restarts.
+    """
+
+    KEY_SIZE = 16
+
+    def __init__(self, path: str, capacity: int, dtype: str = "float32"):
+        self.path = path
+        self.capacity = capacity
+        self.dtype = np.dtype(dtype)
+        self.vectors: np.ndarray | None = None
+        self.slots: dict[bytes, int] = {}
+        self.slot_keys: list[bytes | None] = [None] * capacity
+        self.next_slot = 0
+        self.evictions = 0
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    @property
+    def meta_path(self):
+        return os.path.join(self.path, "meta.json")
+
+    @property
+    def keys_path(self):
+        return os.path.join(self.path, "keys.bin")
+
+    @property
+    def vectors_path(self):
+        return os.path.join(self.path, "vectors.npy")
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        if meta["capacity"] != self.capacity or meta["dtype"] != self.dtype.name:
+            print(f"Embedding cache at {self.path} has a different layout, starting empty")
+            return
+        self.vectors = np.load(self.vectors_path, mmap_mode="r+")
+        with open(self.keys_path, "rb") as f:
+            keys = f.read()
+        count = len(keys) // self.KEY_SIZE
+        for i in range(count):
+            key = keys[i * self.KEY_SIZE : (i + 1) * self.KEY_SIZE]
+            self._assign(key, i % self.capacity)
+        self.next_slot = count % self.capacity
+        if count > self.capacity:
+            # Compact the key log so it doesn't grow without bounds
+            self._rewrite_keys()
+
+    def _create(self, dim: int):
+        self.vectors = np.lib.format.open_memmap(
+            self.vectors_path, mode="w+", dtype=self.dtype, shape=(self.capacity, dim)
+        )
+        with open(self.meta_path, "w") as f:
+            json.dump({"capacity": self.capacity, "dtype": self.dtype.name, "dim": dim}, f)
+        open(self.keys_path, "wb").close()
+
+    def _rewrite_keys(self):
+        # The log is replayed as "i-th key -> slot i % capacity": write one key per slot,
+        # then repeat the keys before the ring head so its position is preserved
+        keys = list(self.slot_keys)
+        with open(self.keys_path, "wb") as f:
+            f.write(b"".join(keys + keys[: self.next_slot]))
+
+    def _assign(self, key: bytes, slot: int):
+        old_key = self.slot_keys[slot]
+        if old_key == key:
+            return
+        if old_key is not None and self.slots.get(old_key) == slot:
+            del self.slots[old_key]
+            self.evictions += 1
+        self.slot_keys[slot] = key
+        self.slots[key] = slot
+
+    def get(self, key: bytes) -> np.ndarray | None:
+        slot = self.slots.get(key)
+        if slot is None or self.vectors is None:
+            return None
+        return np.array(self.vectors[slot])
+
+    def put(self, key: bytes, vector: np.ndarray):
+        if self.capacity <= 0 or key in self.slots:
+            return
+        if self.vectors is None:
+            self._create(len(vector))
+        slot = self.next_slot
+        # Unmap the evicted key before overwriting its vector, as lookups may run meanwhile
+        old_key = self.slot_keys[slot]
+        if old_key is not None and self.slots.get(old_key) == slot:
+            del self.slots[old_key]
+            self.evictions += 1
+        self.slot_keys[slot] = None
+        self.vectors[slot] = vector
+        self._assign(key, slot)
+        with open(self.keys_path, "ab") as f:
+            f.write(key)
+        self.next_slot = (slot + 1) % self.capacity
+
+    def flush(self):
+        if self.vectors is not None:
+            self.vectors.flush()
+
+    def __len__(self):
+        return len(self.slots)
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of query embeddings keyed on normalized text and model id.
+    Hits on the disk tier are promoted to the memory tier. Disk writes are buffered
+    in `pending` and done by `write_pending`, off the event loop for async callers.
+    """
+
+    def __init__(
+        self,
+        model_id: str,
+        capacity: int = 10000,
+        dtype: str = "float32",
+        disk_path: str | None = None,
+        disk_capacity: int = 100000,
+    ):
+        self.model_id = model_id
+        self.dtype = np.dtype(dtype)
+        self.memory = MemoryTier(capacity)
+        self.disk = DiskTier(disk_path, disk_capacity, dtype) if disk_path else None
+        self.pending = deque()
+        self.disk_lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, text: str) -> bytes:
+        raw = f"{self.model_id}\x00{normalize_text(text)}".encode()
+        return hashlib.blake2b(raw, digest_size=DiskTier.KEY_SIZE).digest()
+
+    def get(self, text: str) -> np.ndarray | None:
+        key = self.key(text)
+        vector = self.memory.get(key)
+        if vector is None and self.disk is not None:
+            vector = self.disk.get(key)
+            if vector is not None:
+                self.disk_hits += 1
+                self.memory.put(key, vector)
+        if vector is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return vector
+
+    def put(self, text: str, vector):
+        key = self.key(text)
+        array = np.asarray(vector, dtype=self.dtype)
+        self.memory.put(key, array)
+        if self.disk is not None:
+            self.pending.append((key, array))
+
+    def write_pending(self):
+        """Writes the buffered vectors to the disk tier (blocking file I/O)."""
+        with self.disk_lock:
+            while self.pending:
+                self.disk.put(*self.pending.popleft())
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_evictions": self.memory.evictions,
+            "disk_entries": len(self.disk) if self.disk is not None else 0,
+            "disk_evictions": self.disk.evictions if self.disk is not None else 0,
+        }
+
+    def flush(self):
+        if self.disk is not None:
+            self.write_pending()
+            with self.disk_lock:
+                self.disk.flush()
+
+
+class ResultCache:
+    """
+    TTL cache of endpoint results keyed on endpoint and normalized user input.
+    Each key keeps the entry computed with the largest k, which also serves smaller-k requests
+    (trimming is up to the caller).
+    """
+
+    def __init__(self, ttl: float = 300, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: OrderedDict[tuple, tuple[float, int, object]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(endpoint: str, text: str) -> tuple:
+        return endpoint, normalize_text(text)
+
+    def lookup(self, endpoint: str, text: str, k: int) -> tuple[int, object, bool] | None:
+        """
+        Returns `(cached_k, value, stale)` for an entry computed with at least k results.
+        Expired entries are kept until evicted, so they can still be served while the
+        search dependencies are down; only fresh entries count as hits.
+        """
+        key = self.key(endpoint, text)
+        entry = self.entries.get(key)
+        if entry is None or entry[1] < k:
+            self.misses += 1
+            return None
+        stale = entry[0] < monotonic()
+        if stale:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return entry[1], entry[2], stale
+
+    def get(self, endpoint: str, text: str, k: int) -> tuple[int, object] | None:
+        """Returns `(cached_k, value)` for a fresh entry computed with at least k results."""
+        found = self.lookup(endpoint, text, k)
+        if found is None or found[2]:
+            return None
+        return found[0], found[1]
+
+    def put(self, endpoint: str, text: str, k: int, value):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        key = self.key(endpoint, text)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] >= monotonic() and entry[1] > k:
+            return
+        self.entries[key] = (monotonic() + self.ttl, k, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+        }
+
+
+class SemanticCache:
+    """
+    Cache of LLM query expansions. Each entry stores the embedding of a bio with the
+    subqueries generated for it: a new bio reuses the expansion of an identical bio
+    or of the most similar one above the cosine `threshold`.
+    Embeddings are kept in a preallocated matrix, entries are evicted least recently used first.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 5000):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.matrix: np.ndarray | None = None
+        self.slots: dict[str, int] = {}
+        self.entries: list[tuple[str, list[str]] | None] = [None] * max_entries
+        self.last_used = np.zeros(max_entries, dtype=np.int64)
+        self.used = np.zeros(max_entries, dtype=bool)
+        self.clock = 0
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.llm_seconds = 0.0
+        self.llm_calls = 0
+
+    def _touch(self, slot: int):
+        self.clock += 1
+        self.last_used[slot] = self.clock
+
+    def lookup_exact(self, text: str) -> list[str] | None:
+        slot = self.slots.get(normalize_text(text))
+        if slot is None:
+            return None
+        self._touch(slot)
+        self.exact_hits += 1
+        return self.entries[slot][1]
+
+    def lookup(self, text: str, vector) -> tuple[list[str], float] | None:
+        """Returns the cached subqueries and the similarity of the matched bio."""
+        sub_queries = self.lookup_exact(text)
+        if sub_queries is not None:
+            return sub_queries, 1.0
+        if self.matrix is not None and self.used.any():
+            query = np.asarray(vector, dtype=np.float32)
+            query /= np.linalg.norm(query) or 1.0
+            similarities = np.where(self.used, self.matrix @ query, -np.inf)
+            slot = int(np.argmax(similarities))
+            if similarities[slot] >= self.threshold:
+                self._touch(slot)
+                self.semantic_hits += 1
+                return self.entries[slot][1], float(similarities[slot])
+        self.misses += 1
+        return None
+
+    def put(self, text: str, vector, sub_queries: list[str], llm_seconds: float = 0.0):
+        self.llm_seconds += llm_seconds
+        self.llm_calls += 1
+        if self.max_entries <= 0 or not sub_queries:
+            return
+        key = normalize_text(text)
+        vector = np.asarray(vector, dtype=np.float32)
+        if self.matrix is None:
+            self.matrix = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+        slot = self.slots.get(key)
+        if slot is None:
+            free = np.flatnonzero(~self.used)
+            slot = int(free[0]) if len(free) else int(np.argmin(self.last_used))
+            if self.entries[slot] is not None:
+                del self.slots[self.entries[slot][0]]
+        self.matrix[slot] = vector / (np.linalg.norm(vector) or 1.0)
+        self.entries[slot] = (key, list(sub_queries))
+        self.slots[key] = slot
+        self.used[slot] = True
+        self._touch(slot)
+
+    def stats(self) -> dict:
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        avg_llm_seconds = self.llm_seconds / self.llm_calls if self.llm_calls else 0.0
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": len(self.slots),
+            "avg_llm_seconds": avg_llm_seconds,
+            "estimated_seconds_saved": hits * avg_llm_seconds,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embedder (usually the `EmbeddingBatcher`) with an `EmbeddingCache`.
+    Only the cache misses are forwarded, in a single `embed_documents` call.
+    """
+
+    def __init__(self, embedder: Embeddings, cache: EmbeddingCache):
+        super().__init__()
+        self.embedder = embedder
+        self.cache = cache
+        self.writer = None
+
+    def _lookup(self, texts):
+        vectors = [self.cache.get(text) for text in texts]
+        misses = [i for i, vector in enumerate(vectors) if vector is None]
+        return vectors, misses
+
+    def _store(self, texts, vectors, misses, computed):
+        for i, vector in zip(misses, computed):
+            if vector is not None:
+                self.cache.put(texts[i], vector)
+            vectors[i] = vector
+        return [
+            vector.astype(np.float32).tolist() if isinstance(vector, np.ndarray) else vector
+            for vector in vectors
+        ]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def embed_documents(self, texts):
+        vectors, misses = self._lookup(texts)
+        computed = self.embedder.embed_documents([texts[i] for i in misses]) if misses else []
+        vectors = self._store(texts, vectors, misses, computed)
+        if self.cache.pending:
+            self.cache.write_pending()
+        return vectors
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+    async def aembed_documents(self, texts):
+        vectors, misses = self._lookup(texts)
+        computed = (
+            await self.embedder.aembed_documents([texts[i] for i in misses]) if misses else []
+        )
+        vectors = self._store(texts, vectors, misses, computed)
+        self._write_behind()
+        return vectors
+
+    def _write_behind(self):
+        # One writer thread at a time drains the buffer; entries it misses go with the next one
+        if self.cache.pending and (self.writer is None or self.writer.done()):
+            self.writer = asyncio.create_task(asyncio.to_thread(self.cache.write_pending))
+
+    async def warm(self, path: str, field: str = "user_input", batch_size: int = 32) -> int:
+        """
+        Embed every `field` of a JSONL workload file (e.g. `requests.jsonl`) that is not cached yet.
+        Returns the number of texts read.
+        """
+        texts = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                text = json.loads(line).get(field)
+                if isinstance(text, str) and text.strip():
+                    texts.append(text)
+        for start in range(0, len(texts), batch_size):
+            await self.aembed_documents(texts[start : start + batch_size])
+        await asyncio.to_thread(self.cache.flush)
+        return len(texts)
+
+    async def aclose(self):
+        if self.writer is not None:
+            await self.writer
+        await asyncio.to_thread(self.cache.flush)
+        await self.embedder.aclose()
+
+
+async def _warm_cli(args):
+    from src.utils import CustomHFEmbeddings, make_http_client
+
+    embedder = CustomHFEmbeddings(os.environ["EMBEDDER_ENDPOINT_URL"], client=make_http_client())
+    cache = EmbeddingCache(
+        model_id=args.model_id,
+        dtype=args.dtype,
+        disk_path=args.cache_dir,
+        disk_capacity=args.capacity,
+    )
+    cached = CachedEmbeddings(embedder, cache)
+    try:
+        count = await cached.warm(args.file, field=args.field)
+    finally:
+        await cached.aclose()
+    print(f"Read {count} texts from {args.file}: {cache.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm the persistent embedding cache")
+    parser.add_argument("file", help="JSONL workload file, e.g. requests.jsonl")
+    parser.add_argument("--field", default="user_input")
+    parser.add_argument("--cache-dir", default=os.getenv("EMBEDDING_CACHE_DIR", "embedding_cache"))
+    parser.add_argument("--capacity", type=int, default=int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", "100000")))
+    parser.add_argument("--dtype", default=os.getenv("EMBEDDING_CACHE_DTYPE", "float32"))
+    parser.add_argument(
+        "--model-id",
+        default=os.getenv("EMBEDDER_MODEL_ID", "sentence-transformers/all-mpnet-base-v2"),
+    )
+    asyncio.run(_warm_cli(parser.parse_args()))
@@ -0,0 +1,137 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller starts the coroutine
+    in a task, and every caller awaits its result (or its exception). A caller that is
+    cancelled (e.g. its client disconnected) stops waiting without affecting the others;
+    the call itself is cancelled once nobody waits for it anymore.
+    """
+
+    def __init__(self):
+        self.calls: dict = {}
+        self.coalesced = 0
+
+    async def do(self, key, make_call):
+        flight = self.calls.get(key)
+        if flight is None:
+            flight = self.calls[key] = {"task": asyncio.create_task(make_call()), "waiters": 0}
+            flight["task"].add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            self.coalesced += 1
+        task = flight["task"]
+        flight["waiters"] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if flight["waiters"] == 1 and not task.done():
+                self._forget(key, flight)
+                task.cancel()
+            raise
+        finally:
+            flight["waiters"] -= 1
+
+    def _forget(self, key, flight):
+        if self.calls.get(key) is flight:
+            del self.calls[key]
+
+
+class StreamFlight:
+    """
+    Events of one shared stream execution, replayed to every follower from the start.
+    `on_abandon` is called when the last follower leaves before the stream is done.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.condition = asyncio.Condition()
+        self.followers = 0
+        self.on_abandon = None
+
+    async def publish(self, event):
+        async with self.condition:
+            self.events.append(event)
+            self.condition.notify_all()
+
+    async def finish(self, error: BaseException | None = None):
+        async with self.condition:
+            self.done = True
+            self.error = error
+            self.condition.notify_all()
+
+    async def follow(self):
+        position = 0
+        self.followers += 1
+        try:
+            while True:
+                async with self.condition:
+                    await self.condition.wait_for(lambda: position < len(self.events) or self.done)
+                    events = self.events[position:]
+                    done, error = self.done, self.error
+                for event in events:
+                    yield event
+                position += len(events)
+                if done and position == len(self.events):
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            # Followers leave early when their client disconnects
+            self.followers -= 1
+            if not self.followers and not self.done and self.on_abandon is not None:
+                self.on_abandon()
+
+
+class StreamFlights:
+    """
+    Singleflight for streams: N concurrent identical requests follow one execution of the
+    stream, which runs in a background task so a disconnecting client doesn't stop it for the others.
+    The stream is cancelled when all its clients have disconnected.
+    `on_complete` receives the list of events of a stream that finished without errors.
+    """
+
+    def __init__(self):
+        self.flights: dict[object, StreamFlight] = {}
+        self.tasks: set[asyncio.Task] = set()
+        self.coalesced = 0
+        self.abandoned = 0
+
+    def join(self, key, make_stream, on_complete=None) -> StreamFlight:
+        flight = self.flights.get(key)
+        if flight is not None:
+            self.coalesced += 1
+            return flight
+        flight = self.flights[key] = StreamFlight()
+        task = asyncio.create_task(self._run(key, flight, make_stream(), on_complete))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        flight.on_abandon = lambda: self._abandon(key, flight, task)
+        return flight
+
+    def _abandon(self, key, flight: StreamFlight, task: asyncio.Task):
+        # New identical requests start a fresh stream instead of joining the cancelled one
+        self._forget(key, flight)
+        self.abandoned += 1
+        task.cancel()
+
+    def _forget(self, key, flight: StreamFlight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    async def _run(self, key, flight: StreamFlight, stream, on_complete):
+        try:
+            async for event in stream:
+                await flight.publish(event)
+        except BaseException as e:
+            await flight.finish(e)
+            if not isinstance(e, Exception):
+                raise
+        else:
+            await flight.finish()
+            if on_complete is not None:
+                on_complete(flight.events)
+        finally:
+            self._forget(key, flight)
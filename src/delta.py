@@ -0,0 +1,300 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+
+import httpx
+
+HN_API_URL = "https://hacker-news.firebaseio.com/v0"
+
+
+def story_from_item(item: dict | None) -> dict | None:
+    """
+    Serialized story of a Hacker News API item, or None if the item would not pass the
+    ingestion filters (not a story, dead or deleted, no https url, score 0).
+    """
+    if not item or item.get("type") != "story" or item.get("dead") or item.get("deleted"):
+        return None
+    title, url = item.get("title"), item.get("url")
+    if not title or not url or "https" not in url or item.get("score", 0) <= 0:
+        return None
+    return {
+        "title": title,
+        "url": url,
+        "hn_id": int(item["id"]),
+        "points": item.get("score", 0),
+        "time": item.get("time", 0),
+    }
+
+
+class ItemSource(ABC):
+    """
+    Source of Hacker News items, in the format of the official API
+    (`id`, `type`, `title`, `url`, `score`, `time`, ...).
+    """
+
+    @abstractmethod
+    async def new_items(self, after_id: int) -> list[dict]:
+        """Returns the items with an `id` greater than `after_id`, sorted by `id`."""
+        pass
+
+    @abstractmethod
+    async def items(self, ids: list[int]) -> dict[int, dict | None]:
+        """
+        Returns the current state of the given items by id (None if they are gone).
+        Items that could not be fetched are missing from the result.
+        """
+        pass
+
+    async def close(self):
+        pass
+
+
+class HNApiSource(ItemSource):
+    """
+    Official Hacker News API: new ids are read from the `newstories` list (the 500 most
+    recent stories), so each poll only fetches the items that were not seen yet.
+    An item whose fetch fails is skipped and fetched again at the next polls, up to
+    `max_attempts` times.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient | None = None,
+        base_url: str = HN_API_URL,
+        list_name: str = "newstories",
+        concurrency: int = 16,
+        max_attempts: int = 3,
+    ):
+        self.client = client or httpx.AsyncClient(timeout=10.0)
+        self.base_url = base_url
+        self.list_name = list_name
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_attempts = max_attempts
+        self.failed = {}  # Id -> failed fetches of the new items to retry
+
+    async def _get(self, path: str):
+        async with self.semaphore:
+            response = await self.client.get(f"{self.base_url}/{path}.json")
+            response.raise_for_status()
+            return response.json()
+
+    async def new_items(self, after_id):
+        ids = sorted(i for i in await self._get(self.list_name) if i > after_id)
+        if ids and after_id and ids[0] > after_id + 1 and len(ids) >= 500:
+            print(f"The {self.list_name} list does not reach back to item {after_id}: some stories were missed")
+        ids = sorted(set(ids) | set(self.failed))
+        items = await self.items(ids)
+        for i in ids:
+            if i in items:
+                self.failed.pop(i, None)
+            else:
+                self.failed[i] = self.failed.get(i, 0) + 1
+                if self.failed[i] >= self.max_attempts:
+                    print(f"Giving up on item {i} after {self.failed.pop(i)} failed fetches")
+        return [items[i] for i in ids if items.get(i) is not None]
+
+    async def items(self, ids):
+        results = await asyncio.gather(*(self._get(f"item/{i}") for i in ids), return_exceptions=True)
+        items = {}
+        for i, result in zip(ids, results):
+            if isinstance(result, Exception):
+                print(f"Failed to fetch item {i}: {type(result).__name__}")
+            else:
+                items[i] = result
+        return items
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class JsonlSource(ItemSource):
+    """Local stand-in for the API: one item per line, re-read at every poll."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _read(self) -> dict:
+        by_id = {}
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    by_id[item["id"]] = item
+        return by_id
+
+    async def new_items(self, after_id):
+        by_id = await asyncio.to_thread(self._read)
+        return [by_id[i] for i in sorted(by_id) if i > after_id]
+
+    async def items(self, ids):
+        by_id = await asyncio.to_thread(self._read)
+        return {i: by_id.get(i) for i in ids}
+
+
+class DeltaUpdater:
+    """
+    Keeps a search backend up to date with the stories published after its ingestion.
+
+    Every poll fetches the items newer than the highest ingested `hn_id`, embeds and
+    upserts those passing the ingestion filters in batches of `batch_size`, and saves
+    the new high-water mark in `state_path`. With `expire_after` (seconds), the stories
+    it added are checked again once they are that old, and deleted if they are dead by
+    then or their score is still below `min_score`.
+    """
+
+    def __init__(
+        self,
+        source: ItemSource,
+        backend,
+        embedder,
+        state_path: str = "delta_state.json",
+        batch_size: int = 16,
+        expire_after: float | None = None,
+        min_score: int = 2,
+    ):
+        self.source = source
+        self.backend = backend
+        self.embedder = embedder
+        self.state_path = state_path
+        self.batch_size = batch_size
+        self.expire_after = expire_after
+        self.min_score = min_score
+        self.state = None
+        self.added = 0
+        self.expired = 0
+        self.last_poll = None
+
+    async def _load_state(self) -> dict:
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                state = json.load(f)
+            # JSON object keys are strings
+            state["pending"] = {int(i): t for i, t in state["pending"].items()}
+            return state
+        return {"max_hn_id": await self.backend.max_hn_id(), "pending": {}}
+
+    def _save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    async def _ingest(self, items: list[dict]):
+        for start in range(0, len(items), self.batch_size):
+            batch = items[start : start + self.batch_size]
+            stories = [story_from_item(item) for item in batch]
+            accepted = [(item, story) for item, story in zip(batch, stories) if story is not None]
+            if accepted:
+                vectors = await self.embedder.aembed_documents([story["title"] for _, story in accepted])
+                write = asyncio.ensure_future(self.backend.upsert(vectors, [story for _, story in accepted]))
+                try:
+                    self.added += await asyncio.shield(write)
+                except asyncio.CancelledError:
+                    # Finish the write in progress, so that shutdown doesn't close the backend under it
+                    # (the batch is upserted again after a restart, which is idempotent)
+                    await write
+                    raise
+                if self.expire_after:
+                    for item, story in accepted:
+                        self.state["pending"][story["hn_id"]] = item.get("time", time.time())
+            # The high-water mark only moves past batches that are in the index
+            self.state["max_hn_id"] = max(self.state["max_hn_id"], max(item["id"] for item in batch))
+            self._save_state()
+
+    async def _expire(self):
+        now = time.time()
+        due = [i for i, t in self.state["pending"].items() if now - t >= self.expire_after]
+        if not due:
+            return
+        items = await self.source.items(due)
+        # Stories that could not be fetched stay pending until the next poll
+        checked = [hn_id for hn_id in due if hn_id in items]
+        stale = [
+            hn_id
+            for hn_id in checked
+            if story_from_item(items[hn_id]) is None or items[hn_id].get("score", 0) < self.min_score
+        ]
+        await self.backend.delete(stale)
+        self.expired += len(stale)
+        for hn_id in checked:
+            del self.state["pending"][hn_id]
+        self._save_state()
+
+    async def poll(self) -> int:
+        """Runs one update and returns the number of stories added."""
+        if self.state is None:
+            self.state = await self._load_state()
+        added = self.added
+        await self._ingest(await self.source.new_items(self.state["max_hn_id"]))
+        if self.expire_after:
+            await self._expire()
+        self.last_poll = time.time()
+        return self.added - added
+
+    async def run(self, interval: float):
+        while True:
+            try:
+                added = await self.poll()
+                if added:
+                    print(f"Delta update: {added} new stories (up to hn_id {self.state['max_hn_id']})")
+            except Exception as e:
+                print(f"Delta update failed: {e}")
+            await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        return {
+            "max_hn_id": None if self.state is None else self.state["max_hn_id"],
+            "added": self.added,
+            "expired": self.expired,
+            "pending_expiry": 0 if self.state is None else len(self.state["pending"]),
+            "last_poll": self.last_poll,
+        }
+
+
+def make_source(spec: str) -> ItemSource:
+    """`hn` for the Hacker News API, otherwise the path of a JSONL file of items."""
+    return HNApiSource() if spec == "hn" else JsonlSource(spec)
+
+
+async def _cli(args):
+    # Same backend and embedder settings as the server
+    from src.main import make_backend
+    from src.utils import CustomHFEmbeddings, make_http_client
+
+    backend = make_backend()
+    await backend.connect()
+    embedder = CustomHFEmbeddings(os.environ["EMBEDDER_ENDPOINT_URL"], client=make_http_client())
+    source = make_source(args.source)
+    updater = DeltaUpdater(
+        source,
+        backend,
+        embedder,
+        state_path=args.state,
+        batch_size=args.batch_size,
+        expire_after=args.expire_after or None,
+        min_score=args.min_score,
+    )
+    try:
+        if args.once:
+            print(f"{await updater.poll()} new stories")
+        else:
+            await updater.run(args.interval)
+    finally:
+        await source.close()
+        await backend.close()
+        await embedder.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add the newest Hacker News stories to the index")
+    parser.add_argument("--source", default=os.getenv("DELTA_SOURCE") or "hn", help="`hn` or a JSONL file of items")
+    parser.add_argument("--state", default=os.getenv("DELTA_STATE_PATH", "delta_state.json"))
+    parser.add_argument("--interval", type=float, default=300.0, help="Seconds between polls")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--expire-after", type=float, default=0.0, help="Seconds (0 disables expiry)")
+    parser.add_argument("--min-score", type=int, default=2)
+    parser.add_argument("--once", action="store_true", help="Poll once and exit")
+    asyncio.run(_cli(parser.parse_args()))
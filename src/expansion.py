@@ -0,0 +1,277 @@
+import os
+import re
+import csv
+import json
+import math
+import asyncio
+import argparse
+from abc import ABC, abstractmethod
+from collections import Counter
+from contextlib import nullcontext
+
+from langchain_core.messages import AIMessageChunk
+
+from src.health import error_name
+
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9+#.'\-]*[A-Za-z0-9+#]|[A-Za-z0-9]")
+SENTENCE_PATTERN = re.compile(r"[.!?;:\n]+(?:\s|$)|,\s+(?:and|but)\s+|\s+-\s+")
+
+STOPWORDS = set(
+    """
+    a about above after again against all also am an and any are as at be because been before being
+    below between both but by can could did do does doing down during each etc few for from further
+    get got had has have having he her here hers herself him himself his how i i'm if in into is it
+    its itself just let like likes liked love loves lot lots me more most much my myself no nor not
+    now of off on once only or other our ours ourselves out over own really same she should so some
+    such than that the their theirs them themselves then there these they this those through to too
+    under until up very was we were what when where which while who whom why will with would you your
+    yours yourself yourselves enjoy enjoying interested interest interests passionate passion currently
+    work working worked job based living live im ive things thing stuff especially particularly
+    mostly years year time new also want wanting reading read follow following topics
+    i'd i'll i've don't can't it's
+    """.split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return [token.lower() for token in TOKEN_PATTERN.findall(text)]
+
+
+class TermStatistics:
+    """
+    Document frequencies of the terms of the Hacker News titles, used to weight the
+    words of a bio by their inverse document frequency.
+    """
+
+    def __init__(self, documents: int = 0, df: dict[str, int] | None = None):
+        self.documents = documents
+        self.df = df or {}
+
+    def idf(self, term: str) -> float:
+        if not self.documents:
+            return 1.0
+        return math.log((self.documents + 1) / (self.df.get(term, 0) + 1)) + 1.0
+
+    @classmethod
+    def build(cls, titles, min_df: int = 2):
+        df = Counter()
+        documents = 0
+        for title in titles:
+            documents += 1
+            df.update(set(tokenize(title)))
+        return cls(documents, {term: count for term, count in df.items() if count >= min_df})
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["documents"], data["df"])
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"documents": self.documents, "df": self.df}, f)
+
+
+class QueryExpander(ABC):
+    """
+    Query expansion engine with the same interface as the `make_prompt() | ChatOpenAI` chain:
+    `astream({"input": bio})` yields message chunks whose content forms one subquery per line.
+    """
+
+    @abstractmethod
+    def astream(self, input: dict):
+        pass
+
+
+class LocalExpander(QueryExpander):
+    """
+    CPU-only expansion in well under a millisecond: the bio is split into sentences,
+    candidate keyphrases are the runs of non-stopwords of each sentence (RAKE), scored
+    by the sum of the TF-IDF weights of their words against the HN title statistics.
+    The best non-overlapping phrases become the subqueries.
+    """
+
+    def __init__(
+        self,
+        statistics: TermStatistics | None = None,
+        max_queries: int = 5,
+        max_phrase_words: int = 4,
+        min_relative_score: float = 0.3,
+    ):
+        self.statistics = statistics or TermStatistics()
+        self.max_queries = max_queries
+        self.max_phrase_words = max_phrase_words
+        self.min_relative_score = min_relative_score
+
+    def _phrases(self, text: str) -> list[list[str]]:
+        phrases = []
+        for sentence in SENTENCE_PATTERN.split(text):
+            current = []
+            for word in TOKEN_PATTERN.findall(sentence):
+                if word.lower() in STOPWORDS or word.isdigit() or word.islower() and len(word) == 1:
+                    if current:
+                        phrases.append(current)
+                    current = []
+                else:
+                    current.append(word)
+            if current:
+                phrases.append(current)
+        # Long runs are split in windows to keep the subqueries short
+        return [
+            phrase[start : start + self.max_phrase_words]
+            for phrase in phrases
+            for start in range(0, len(phrase), self.max_phrase_words)
+        ]
+
+    def expand(self, text: str) -> list[str]:
+        tf = Counter(tokenize(text))
+        scored = []
+        for phrase in self._phrases(text):
+            terms = [word.lower() for word in phrase]
+            score = sum(math.log1p(tf[term]) * self.statistics.idf(term) for term in terms)
+            scored.append((score, terms, " ".join(phrase)))
+        scored.sort(key=lambda item: -item[0])
+
+        queries = []
+        chosen_terms = []
+        for score, terms, phrase in scored:
+            if len(queries) == self.max_queries or score < self.min_relative_score * scored[0][0]:
+                break
+            terms = set(terms)
+            # Skip phrases mostly covered by an already chosen one
+            if any(len(terms & other) > len(terms) / 2 for other in chosen_terms):
+                continue
+            chosen_terms.append(terms)
+            queries.append(phrase)
+        return queries or [" ".join(text.split())]
+
+    async def astream(self, input: dict):
+        queries = self.expand(input["input"])
+        for i, query in enumerate(queries):
+            yield AIMessageChunk(content=query + ("\n" if i < len(queries) - 1 else ""))
+
+
+class RacingExpander(QueryExpander):
+    """
+    Streams the primary engine (the LLM chain), but falls back to the local engine if the
+    primary doesn't produce its first token within `deadline` seconds or fails before it.
+    If the primary then stalls for `chunk_timeout` seconds (or fails), it is stopped and
+    the subqueries it streamed so far are completed with those of the local engine.
+    Failures and timeouts of the primary are recorded by its circuit `breaker` (if any),
+    and while that circuit is open the local engine answers alone.
+    """
+
+    def __init__(
+        self,
+        primary,
+        fallback: QueryExpander,
+        deadline: float = 1.5,
+        chunk_timeout: float = 1.0,
+        max_queries: int = 5,
+        breaker=None,
+    ):
+        self.primary = primary
+        self.fallback = fallback
+        self.deadline = deadline
+        self.chunk_timeout = chunk_timeout
+        self.max_queries = max_queries
+        self.breaker = breaker
+        self.fallbacks = 0
+        self.interruptions = 0
+
+    async def astream(self, input: dict):
+        text = None
+        try:
+            # The breaker sees the errors of the primary before they are handled below
+            with self.breaker if self.breaker is not None else nullcontext():
+                stream = aiter(self.primary.astream(input))
+                try:
+                    first = await asyncio.wait_for(anext(stream), self.deadline)
+                    text = first.content or ""
+                    yield first
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(anext(stream), self.chunk_timeout)
+                        except StopAsyncIteration:
+                            break
+                        text += chunk.content or ""
+                        yield chunk
+                finally:
+                    await _close(stream)
+        except Exception as e:
+            if text is None:
+                self.fallbacks += 1
+                print(f"Query expansion falling back to the local engine: {error_name(e)}")
+                async for chunk in self.fallback.astream(input):
+                    yield chunk
+            else:
+                self.interruptions += 1
+                print(f"Query expansion interrupted, completed by the local engine: {error_name(e)}")
+                completion = await self._completion(input, text)
+                if completion:
+                    yield AIMessageChunk(content=completion)
+
+    def stats(self) -> dict:
+        return {"fallbacks": self.fallbacks, "interruptions": self.interruptions}
+
+    async def _completion(self, input: dict, text: str) -> str:
+        """Local subqueries not streamed yet, up to `max_queries` in total (ending the current line)."""
+        streamed = [line.strip() for line in text.split("\n") if line.strip()]
+        local = "".join([chunk.content async for chunk in self.fallback.astream(input)])
+        seen = {line.lower() for line in streamed}
+        extra = [line.strip() for line in local.split("\n") if line.strip() and line.strip().lower() not in seen]
+        extra = extra[: max(0, self.max_queries - len(streamed))]
+        if not extra:
+            return ""
+        return ("\n" if text and not text.endswith("\n") else "") + "\n".join(extra)
+
+
+async def _close(stream):
+    if hasattr(stream, "aclose"):
+        await stream.aclose()
+
+
+def render_expander(expander: RacingExpander) -> list[str]:
+    """Prometheus counters of the racing expander."""
+    return [
+        "# HELP hn_search_expansion_fallbacks_total Expansions answered by the local engine alone.",
+        "# TYPE hn_search_expansion_fallbacks_total counter",
+        f"hn_search_expansion_fallbacks_total {expander.fallbacks}",
+        "# HELP hn_search_expansion_interruptions_total LLM expansions interrupted and completed by the local engine.",
+        "# TYPE hn_search_expansion_interruptions_total counter",
+        f"hn_search_expansion_interruptions_total {expander.interruptions}",
+    ]
+
+
+def _read_titles(path: str):
+    if path.endswith(".csv"):
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                yield row["title"]
+    else:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)["title"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local query expansion tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    stats_parser = subparsers.add_parser("build-stats", help="Compute the term statistics of the HN titles")
+    stats_parser.add_argument("titles", help="CSV with a title column or JSONL with a title field (e.g. index/stories.jsonl)")
+    stats_parser.add_argument("--out", default=os.getenv("EXPANSION_STATS_PATH", "term_stats.json"))
+    stats_parser.add_argument("--min-df", type=int, default=2)
+    expand_parser = subparsers.add_parser("expand", help="Expand a bio with the local engine")
+    expand_parser.add_argument("bio")
+    expand_parser.add_argument("--stats", default=os.getenv("EXPANSION_STATS_PATH", "term_stats.json"))
+    args = parser.parse_args()
+
+    if args.command == "build-stats":
+        statistics = TermStatistics.build(_read_titles(args.titles), min_df=args.min_df)
+        statistics.save(args.out)
+        print(f"Saved statistics of {len(statistics.df)} terms over {statistics.documents} titles to {args.out}")
+    else:
+        statistics = TermStatistics.load(args.stats) if os.path.exists(args.stats) else None
+        print("\n".join(LocalExpander(statistics).expand(args.bio)))
@@ -0,0 +1,34 @@
+import heapq
+
+
+def fuse_results(
+    ranked_lists: list[list[dict]],
+    k: int,
+    method: str = "rrf",
+    rrf_k: int = 60,
+    weights: list[float] | None = None,
+) -> list[dict]:
+    """
+    Merge the ranked story lists of several subqueries into the top-k unique stories.
+
+    Stories are deduplicated on `hn_id` and ranked by:
+      - `rrf`: Reciprocal Rank Fusion, sum of weight / (rrf_k + rank) over the lists
+      - `score`: sum of weight * score over the lists (the backend scores, higher is better)
+    The best k are selected with a heap. Returned stories carry their fused score.
+    """
+    if method not in ("rrf", "score"):
+        raise ValueError(f"Unknown fusion method: {method}")
+    weights = weights or [1.0] * len(ranked_lists)
+    fused: dict = {}
+    stories: dict = {}
+    for weight, stories_list in zip(weights, ranked_lists):
+        for rank, story in enumerate(stories_list):
+            hn_id = story["hn_id"]
+            if method == "rrf":
+                contribution = weight / (rrf_k + rank + 1)
+            else:
+                contribution = weight * story.get("score", 0.0)
+            fused[hn_id] = fused.get(hn_id, 0.0) + contribution
+            stories.setdefault(hn_id, story)
+    best = heapq.nlargest(k, fused.items(), key=lambda item: item[1])
+    return [{**stories[hn_id], "score": score} for hn_id, score in best]
@@ -0,0 +1,186 @@
+import asyncio
+import time
+
+import httpx
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a dependency whose circuit breaker is open."""
+
+    def __init__(self, name: str, retry_after: float, last_error: str | None = None):
+        self.name = name
+        self.retry_after = retry_after
+        message = f"{name} is unavailable, retry in {retry_after:.0f}s"
+        if last_error:
+            message += f" (last error: {last_error})"
+        super().__init__(message)
+
+
+def error_name(error: BaseException | str) -> str:
+    """Short description of an error for responses and stats (the full message goes to the logs)."""
+    return error if isinstance(error, str) else type(error).__name__
+
+
+def is_failure(error: BaseException) -> bool:
+    """
+    Whether an error counts against the dependency: client errors (4xx) are answers of
+    a working service, except 429 which means that it is overloaded.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status >= 500 or status == 429
+    return not isinstance(error, CircuitOpenError)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of one dependency, used as a context manager around its calls.
+
+    After `failure_threshold` consecutive failures the circuit opens: calls fail at once
+    with `CircuitOpenError` for `reset_timeout` seconds. Then it is half-open and lets
+    a single trial call through, which closes it again if it succeeds (or reopens it).
+    The health monitor can also open it, or close it as soon as a probe succeeds.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.last_error = None
+        self.last_success = None
+        self.rejected = 0
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    @property
+    def is_open(self) -> bool:
+        """True if a call would be rejected right now."""
+        state = self.state
+        return state == "open" or (state == "half_open" and self.trial)
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(1.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def __enter__(self):
+        state = self.state
+        if state == "open" or (state == "half_open" and self.trial):
+            self.rejected += 1
+            raise CircuitOpenError(self.name, self.retry_after(), self.last_error)
+        if state == "half_open":
+            self.trial = True
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.trial = False
+        if exc_type is None:
+            self.record_success()
+        elif issubclass(exc_type, Exception) and is_failure(exc):
+            self.record_failure(exc)
+        # Cancellations and client errors are neither a success nor a failure
+        return False
+
+    async def call(self, function, *args, **kwargs):
+        with self:
+            return await function(*args, **kwargs)
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.last_success = time.monotonic()
+
+    def record_failure(self, error: BaseException):
+        self.failures += 1
+        self.last_error = error_name(error)
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.trip(error)
+
+    def trip(self, error: BaseException | str | None = None):
+        if self.opened_at is None:
+            self.trips += 1
+            print(f"Circuit of {self.name} opened: {error}")
+        self.opened_at = time.monotonic()
+        if error is not None:
+            self.last_error = error_name(error)
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+            "last_error": self.last_error,
+        }
+
+
+class HealthMonitor:
+    """
+    Background readiness checks of the dependencies, so that requests read a cached state
+    instead of probing them.
+
+    Every `interval` seconds each dependency with a probe is checked, unless its breaker
+    saw a successful call since the last round (live traffic already proves it is up).
+    A failed or timed out probe opens the breaker, a successful one closes it. Dependencies
+    without a probe (e.g. the LLM, which has no free health check) only follow their breaker.
+    """
+
+    def __init__(self, breakers: dict[str, CircuitBreaker], probes: dict, interval: float = 10.0, timeout: float = 5.0):
+        self.breakers = breakers
+        self.probes = probes
+        self.interval = interval
+        self.timeout = timeout
+        self.checks = {name: {"last_check": None, "latency_ms": None} for name in breakers}
+
+    def is_ready(self, name: str) -> bool:
+        return not self.breakers[name].is_open
+
+    async def _check(self, name: str, probe):
+        breaker = self.breakers[name]
+        # An open circuit is always probed, even if it saw a success just before failing
+        recent = breaker.last_success is not None and time.monotonic() - breaker.last_success < self.interval
+        if recent and breaker.opened_at is None:
+            return
+        start = time.monotonic()
+        try:
+            ready = await asyncio.wait_for(probe(), self.timeout)
+            error = None if ready else "not ready"
+        except asyncio.TimeoutError:
+            error = f"no answer within {self.timeout:.0f}s"
+        except Exception as e:
+            error = e
+        self.checks[name] = {"last_check": time.time(), "latency_ms": 1000 * (time.monotonic() - start)}
+        if error is None:
+            if breaker.opened_at is not None:
+                print(f"Circuit of {name} closed: the health check passed")
+            breaker.record_success()
+        else:
+            breaker.trip(error)
+
+    async def check_all(self):
+        await asyncio.gather(*(self._check(name, probe) for name, probe in self.probes.items()))
+
+    async def run(self):
+        """Checks the dependencies every `interval` seconds (the first check is up to the caller)."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check_all()
+            except Exception as e:
+                print(f"Health check failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            name: {"ready": self.is_ready(name), **breaker.stats(), **self.checks[name]}
+            for name, breaker in self.breakers.items()
+        }
@@ -0,0 +1,347 @@
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import random
+import time
+
+from src.lexical import build_lexical_index
+from src.local_index import IndexWriter
+from src.metadata import MetadataStore, MetadataWriter
+from src.utils import CustomHFEmbeddings, make_http_client
+
+
+class StoryFilter:
+    """
+    Streaming version of the filters of `notebooks/filter.ipynb`: rows with missing
+    fields, non-https urls, duplicated urls (first occurrence wins) and stories with
+    a non-positive score are dropped. Unlike the notebook, the score (as `points`) and
+    the time of the kept stories are preserved for the metadata store.
+
+    Seen urls are kept as 8-byte digests so the dedupe set of the full dump stays small.
+    """
+
+    def __init__(self):
+        self.seen_urls = set()
+        self.dropped = 0
+
+    def __call__(self, row: dict) -> dict | None:
+        story = self._accept(row)
+        if story is None:
+            self.dropped += 1
+        return story
+
+    def _accept(self, row: dict) -> dict | None:
+        if any(value is None or value == "" for value in row.values()):
+            return None
+        url = row["url"]
+        if "https" not in url:
+            return None
+        # As in the notebook, urls are deduplicated before the score filter
+        digest = hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest()
+        if digest in self.seen_urls:
+            return None
+        self.seen_urls.add(digest)
+        try:
+            points = int(float(row["score"]))
+            if points <= 0:
+                return None
+            hn_id = int(row["id"])
+            timestamp = int(float(row["time"]))
+        except ValueError:
+            return None
+        return {"title": row["title"], "url": url, "hn_id": hn_id, "points": points, "time": timestamp}
+
+
+class CsvSource:
+    """Reads a CSV row by row, keeping track of the bytes consumed for the ETA."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.bytes_read = 0
+
+    def _lines(self, f):
+        for line in f:
+            self.bytes_read += len(line)
+            yield line.decode("utf-8", errors="replace")
+
+    def rows(self):
+        with open(self.path, "rb") as f:
+            yield from csv.DictReader(self._lines(f))
+
+
+class Checkpoint:
+    """
+    JSON file with the number of CSV rows consumed and of stories written by the last
+    committed window. It is replaced atomically, so a crash leaves the previous one.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> dict:
+        if not os.path.exists(self.path):
+            return {"rows": 0, "written": 0}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def save(self, rows: int, written: int):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"rows": rows, "written": written}, f)
+        os.replace(tmp_path, self.path)
+
+
+class LocalSink:
+    """Writes to a local index directory (see `src.local_index`)."""
+
+    def __init__(self, path: str, dtype: str = "float16"):
+        self.writer = IndexWriter(path, dtype=dtype)
+
+    async def resume(self, written: int):
+        # Rows added after the last checkpoint would be written twice
+        self.writer.rollback(written)
+
+    async def write(self, vectors, stories: list[dict]):
+        await asyncio.to_thread(self.writer.add, vectors, stories)
+
+    async def commit(self):
+        await asyncio.to_thread(self.writer.flush)
+
+    async def close(self):
+        await asyncio.to_thread(self.writer.close)
+
+
+class WeaviateSink:
+    """
+    Writes to a Weaviate collection with async bulk inserts. Objects get a UUID derived
+    from their `hn_id`, so the batches replayed after a crash overwrite themselves.
+    """
+
+    def __init__(self, index_name: str, retries: int = 5, backoff: float = 1.0):
+        import weaviate
+        from weaviate.classes.init import Auth
+
+        self.client = weaviate.use_async_with_weaviate_cloud(
+            cluster_url=os.environ["WEAVIATE_URL"],
+            auth_credentials=Auth.api_key(os.environ["WEAVIATE_API_KEY"]),
+        )
+        self.index_name = index_name
+        self.retries = retries
+        self.backoff = backoff
+        self.collection = None
+
+    async def resume(self, written: int):
+        await self.client.connect()
+        if not await self.client.collections.exists(self.index_name):
+            raise RuntimeError(f"Weaviate collection {self.index_name} does not exist")
+        self.collection = self.client.collections.get(self.index_name)
+
+    async def write(self, vectors, stories: list[dict]):
+        from src.backends import story_object
+
+        objects = [story_object(story, vector) for story, vector in zip(stories, vectors)]
+        attempt = 0
+        while True:
+            try:
+                result = await self.collection.data.insert_many(objects)
+                failed = sorted(result.errors)
+            except Exception as e:
+                print(f"Bulk insert failed: {e}")
+                failed = range(len(objects))
+            if not failed:
+                return
+            if attempt == self.retries:
+                raise RuntimeError(f"{len(failed)} objects could not be inserted")
+            objects = [objects[i] for i in failed]
+            await asyncio.sleep(random.uniform(0, self.backoff * 2**attempt))
+            attempt += 1
+
+    async def commit(self):
+        pass
+
+    async def close(self):
+        await self.client.close()
+
+
+def format_eta(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s"
+
+
+class Progress:
+    def __init__(self, source: CsvSource, interval: float = 10.0):
+        self.source = source
+        self.interval = interval
+        self.start = time.perf_counter()
+        self.start_bytes = 0
+        self.start_rows = 0
+        self.last_report = self.start
+
+    def resumed(self, rows: int):
+        self.start = time.perf_counter()
+        self.start_bytes = self.source.bytes_read
+        self.start_rows = rows
+
+    def report(self, rows: int, written: int, force: bool = False):
+        now = time.perf_counter()
+        if not force and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        elapsed = max(now - self.start, 1e-9)
+        rows_per_second = (rows - self.start_rows) / elapsed
+        bytes_per_second = (self.source.bytes_read - self.start_bytes) / elapsed
+        remaining = self.source.size - self.source.bytes_read
+        eta = format_eta(remaining / bytes_per_second) if bytes_per_second > 0 else "?"
+        done = self.source.bytes_read / max(self.source.size, 1)
+        print(
+            f"{rows} rows read ({done:.1%}), {written} stories written, "
+            f"{rows_per_second:.0f} rows/s, ETA {eta}"
+        )
+
+
+async def embed_window(embedder, stories: list[dict], batch_size: int):
+    batches = [stories[i : i + batch_size] for i in range(0, len(stories), batch_size)]
+    outputs = await asyncio.gather(
+        *(embedder.aembed_documents([s["title"] for s in batch]) for batch in batches)
+    )
+    return [vector for output in outputs for vector in output]
+
+
+async def ingest(
+    source: CsvSource,
+    sink,
+    embedder,
+    checkpoint: Checkpoint,
+    batch_size: int = 64,
+    concurrency: int = 8,
+    report_interval: float = 10.0,
+    metadata: MetadataWriter | None = None,
+):
+    """
+    Streams the stories of `source` into `sink`, `batch_size * concurrency` stories at a
+    time: the batches of a window are embedded concurrently while the previous window
+    is being written, and the checkpoint is saved once a window is committed.
+    The metadata store, if any, is written in the same windows.
+    """
+    state = checkpoint.load()
+    await sink.resume(state["written"])
+    if metadata is not None:
+        metadata.rollback(state["written"])
+    story_filter = StoryFilter()
+    progress = Progress(source, report_interval)
+    rows_seen, written = 0, state["written"]
+    window_size = batch_size * concurrency
+    window = []
+    pending = None
+
+    async def write(vectors, stories, rows):
+        nonlocal written
+        await sink.write(vectors, stories)
+        await sink.commit()
+        if metadata is not None:
+            await asyncio.to_thread(metadata.add, stories)
+            await asyncio.to_thread(metadata.flush)
+        written += len(stories)
+        checkpoint.save(rows, written)
+
+    async def submit(stories, rows):
+        nonlocal pending
+        vectors = await embed_window(embedder, stories, batch_size)
+        if pending is not None:
+            await pending
+        pending = asyncio.create_task(write(vectors, stories, rows))
+
+    if state["rows"]:
+        print(f"Resuming after row {state['rows']} ({written} stories already written)")
+    try:
+        for row in source.rows():
+            rows_seen += 1
+            story = story_filter(row)
+            if rows_seen <= state["rows"]:
+                # Replayed only to rebuild the url dedupe set
+                if rows_seen == state["rows"]:
+                    progress.resumed(rows_seen)
+                continue
+            if story is not None:
+                window.append(story)
+            if len(window) == window_size:
+                await submit(window, rows_seen)
+                window = []
+            progress.report(rows_seen, written)
+        if window:
+            await submit(window, rows_seen)
+        if pending is not None:
+            await pending
+    finally:
+        # If embedding a window failed, the previous one may still be written: let it finish
+        # (it is committed) before the caller closes the sink and the metadata store
+        if pending is not None:
+            await asyncio.wait([pending])
+            if not pending.cancelled():
+                pending.exception()  # A write error is superseded by the error being raised
+    checkpoint.save(rows_seen, written)
+    progress.report(rows_seen, written, force=True)
+    print(f"Done: {written} stories written, {story_filter.dropped} rows filtered out")
+
+
+async def _cli(args):
+    client = make_http_client(max_connections=args.concurrency, timeout=60.0)
+    embedder = CustomHFEmbeddings(os.environ["EMBEDDER_ENDPOINT_URL"], client=client, retries=5, backoff=1.0)
+    if args.backend == "local":
+        sink = LocalSink(args.index, dtype=args.dtype)
+    else:
+        sink = WeaviateSink(args.index_name)
+    metadata_path = args.metadata or (
+        os.path.join(args.index, "metadata") if args.backend == "local" else "metadata"
+    )
+    metadata = MetadataWriter(metadata_path, columns=("points", "time"))
+    default_checkpoint = (
+        os.path.join(args.index, "ingest_checkpoint.json")
+        if args.backend == "local"
+        else f"ingest_checkpoint_{args.index_name}.json"
+    )
+    checkpoint = Checkpoint(args.checkpoint or default_checkpoint)
+    try:
+        await ingest(
+            CsvSource(args.csv),
+            sink,
+            embedder,
+            checkpoint,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            report_interval=args.report_interval,
+            metadata=metadata,
+        )
+    finally:
+        metadata.close()
+        await sink.close()
+        await embedder.aclose()
+
+    # The lexical index cannot be appended to: it is rebuilt from all the titles at the end
+    lexical_path = args.lexical or (os.path.join(args.index, "lexical") if args.backend == "local" else "lexical")
+    meta = await asyncio.to_thread(build_lexical_index, MetadataStore.load(metadata_path).titles(), lexical_path)
+    print(f"Lexical index: {meta['documents']} titles, {meta['terms']} terms in {lexical_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Filter, embed and index the HN stories dump")
+    parser.add_argument("csv", help="Raw HN dump (story.csv) with id, title, url, score, time, comments, author")
+    parser.add_argument("--backend", default=os.getenv("SEARCH_BACKEND", "weaviate"), choices=["local", "weaviate"])
+    parser.add_argument("--index", default=os.getenv("LOCAL_INDEX_PATH", "index"))
+    parser.add_argument("--index-name", default=os.getenv("WEAVIATE_INDEX_NAME"))
+    parser.add_argument("--dtype", default="float16", choices=["float16", "float32"])
+    parser.add_argument("--metadata", help="Metadata store directory (default: <index>/metadata, or metadata)")
+    parser.add_argument("--lexical", help="Lexical index directory (default: <index>/lexical, or lexical)")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: next to the index)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=8, help="Embedding batches in flight")
+    parser.add_argument("--report-interval", type=float, default=10.0)
+    args = parser.parse_args()
+    if args.backend == "weaviate" and not args.index_name:
+        parser.error("--index-name (or WEAVIATE_INDEX_NAME) is required for the weaviate backend")
+    asyncio.run(_cli(args))
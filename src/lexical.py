@@ -0,0 +1,264 @@
+import argparse
+import json
+import math
+import os
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from src.expansion import STOPWORDS, tokenize
+from src.metadata import MetadataStore, load_metadata
+
+
+def varint_sizes(values: np.ndarray) -> np.ndarray:
+    """Number of bytes of the varint encoding of each value."""
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for bits in (7, 14, 21, 28, 35):
+        sizes += values >= (1 << bits)
+    return sizes
+
+
+def encode_varints(values: np.ndarray) -> np.ndarray:
+    """LEB128 encoding of unsigned integers (7 bits per byte, high bit set on all but the last)."""
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = varint_sizes(values)
+    starts = np.cumsum(sizes) - sizes
+    out = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for j in range(int(sizes.max(initial=0))):
+        mask = sizes > j
+        byte = (values[mask] >> np.uint64(7 * j)) & np.uint64(0x7F)
+        more = (sizes[mask] > j + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[mask] + j] = (byte | more).astype(np.uint8)
+    return out
+
+
+def decode_varints(data: np.ndarray) -> np.ndarray:
+    """Inverse of `encode_varints`, vectorized over the whole buffer."""
+    data = np.asarray(data, dtype=np.uint8)
+    if not len(data):
+        return np.empty(0, dtype=np.int64)
+    last = np.flatnonzero(data < 0x80)
+    starts = np.concatenate([[0], last[:-1] + 1])
+    value_index = np.repeat(np.arange(len(last)), last - starts + 1)
+    shifts = 7 * (np.arange(len(data)) - starts[value_index])
+    parts = (data & 0x7F).astype(np.int64) << shifts
+    return np.add.reduceat(parts, starts)
+
+
+class LexicalIndexWriter:
+    """
+    Builds a BM25 inverted index of story titles, one document per row of the index
+    (so row ids are shared with the vector index and the metadata store):
+      - `terms.txt`: the vocabulary, one term per line in term id order
+      - `postings.bin`: the row ids of each term, delta-encoded and varint-compressed
+      - `offsets.bin`: int64 byte offset of the postings of each term (plus the end)
+      - `df.bin`: int32 number of rows of each term
+      - `tf.bin`: uint8 frequency of the term in the row, for each posting
+      - `lengths.bin`: uint16 number of tokens of each row
+      - `lexical.json`: number of documents and average length
+
+    Postings are collected in compact arrays and sorted by term once, in `close`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.vocabulary = {}
+        self.terms = array("I")
+        self.docs = array("I")
+        self.tfs = array("B")
+        self.lengths = array("H")
+
+    def add(self, title: str):
+        tokens = tokenize(title)
+        doc = len(self.lengths)
+        for term, tf in Counter(tokens).items():
+            term_id = self.vocabulary.setdefault(term, len(self.vocabulary))
+            self.terms.append(term_id)
+            self.docs.append(doc)
+            self.tfs.append(min(tf, 255))
+        self.lengths.append(min(len(tokens), 65535))
+
+    def close(self):
+        os.makedirs(self.path, exist_ok=True)
+        terms = np.frombuffer(self.terms, dtype=np.uint32)
+        # Rows were added in order, so a stable sort keeps the postings of a term sorted
+        order = np.argsort(terms, kind="stable")
+        terms, docs = terms[order], np.frombuffer(self.docs, dtype=np.uint32)[order].astype(np.int64)
+        # Every term of the vocabulary has at least one posting
+        df = np.bincount(terms, minlength=len(self.vocabulary)).astype(np.int32)
+        first = np.cumsum(df, dtype=np.int64) - df
+        gaps = docs.copy()
+        gaps[1:] -= docs[:-1]
+        gaps[first] = docs[first]
+        postings = encode_varints(gaps)
+        sizes = np.add.reduceat(varint_sizes(gaps), first) if len(gaps) else np.zeros(0, dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+
+        with open(os.path.join(self.path, "terms.txt"), "w", encoding="utf-8") as f:
+            for term in self.vocabulary:
+                f.write(term + "\n")
+        postings.tofile(os.path.join(self.path, "postings.bin"))
+        offsets.tofile(os.path.join(self.path, "offsets.bin"))
+        df.tofile(os.path.join(self.path, "df.bin"))
+        np.frombuffer(self.tfs, dtype=np.uint8)[order].tofile(os.path.join(self.path, "tf.bin"))
+        lengths = np.frombuffer(self.lengths, dtype=np.uint16)
+        lengths.tofile(os.path.join(self.path, "lengths.bin"))
+        meta = {
+            "documents": len(lengths),
+            "avg_length": float(lengths.mean()) if len(lengths) else 0.0,
+            "terms": len(self.vocabulary),
+        }
+        with open(os.path.join(self.path, "lexical.json"), "w") as f:
+            json.dump(meta, f)
+        return meta
+
+
+def build_lexical_index(titles, path: str) -> dict:
+    writer = LexicalIndexWriter(path)
+    for title in titles:
+        writer.add(title)
+    return writer.close()
+
+
+def _map(path: str, name: str, dtype) -> np.ndarray:
+    file_path = os.path.join(path, name)
+    if os.path.getsize(file_path) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(file_path, dtype=dtype, mode="r")
+
+
+class LexicalIndex:
+    """
+    BM25 search over the memory-mapped inverted index of the titles. Only the vocabulary
+    is loaded in RAM; the postings of the query terms are decoded with numpy at query time.
+
+    The index covers the rows that existed when it was built: stories added later by
+    delta updates are only found by vector search until it is rebuilt.
+    """
+
+    def __init__(self, path: str, metadata: MetadataStore, k1: float = 1.2, b: float = 0.75):
+        with open(os.path.join(path, "lexical.json")) as f:
+            meta = json.load(f)
+        if meta["documents"] > len(metadata):
+            raise ValueError(f"Lexical index {path} has more rows than the metadata store")
+        with open(os.path.join(path, "terms.txt"), encoding="utf-8") as f:
+            self.vocabulary = {line.rstrip("\n"): term_id for term_id, line in enumerate(f)}
+        self.metadata = metadata
+        self.documents = meta["documents"]
+        self.avg_length = meta["avg_length"] or 1.0
+        self.k1 = k1
+        self.b = b
+        self.postings = _map(path, "postings.bin", np.uint8)
+        self.offsets = _map(path, "offsets.bin", np.int64)
+        self.df = _map(path, "df.bin", np.int32)
+        self.tf_offsets = np.concatenate([[0], np.cumsum(self.df, dtype=np.int64)])
+        self.tfs = _map(path, "tf.bin", np.uint8)
+        self.lengths = _map(path, "lengths.bin", np.uint16)
+
+    def terms(self, query: str) -> list[str]:
+        """Distinct searchable terms of a query, in order."""
+        return list(dict.fromkeys(token for token in tokenize(query) if token not in STOPWORDS))
+
+    def is_keyword_query(self, query: str, max_terms: int) -> bool:
+        """A query of a few terms, all of them in the vocabulary (e.g. "rust", "crispr")."""
+        terms = self.terms(query)
+        return 0 < len(terms) <= max_terms and all(term in self.vocabulary for term in terms)
+
+    def max_df(self, query: str) -> int:
+        """Rows of the most frequent query term: a lower bound of the number of matching rows."""
+        return max((int(self.df[self.vocabulary[term]]) for term in self.terms(query) if term in self.vocabulary), default=0)
+
+    def _postings(self, term_id: int) -> tuple[np.ndarray, np.ndarray]:
+        gaps = decode_varints(self.postings[self.offsets[term_id] : self.offsets[term_id + 1]])
+        tfs = self.tfs[self.tf_offsets[term_id] : self.tf_offsets[term_id + 1]]
+        return np.cumsum(gaps), tfs.astype(np.float32)
+
+    def search_rows(self, query: str, k: int, exclude=frozenset()) -> tuple[np.ndarray, np.ndarray]:
+        """Row ids and BM25 scores of the top-k rows, sorted by decreasing score."""
+        docs, contributions = [], []
+        for term in self.terms(query):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            df = int(self.df[term_id])
+            idf = math.log(1 + (self.documents - df + 0.5) / (df + 0.5))
+            rows, tfs = self._postings(term_id)
+            norms = self.k1 * (1 - self.b + self.b * self.lengths[rows] / self.avg_length)
+            docs.append(rows)
+            contributions.append(idf * tfs * (self.k1 + 1) / (tfs + norms))
+        if not docs:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows, inverse = np.unique(np.concatenate(docs), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions)).astype(np.float32)
+        if exclude:
+            keep = ~np.isin(rows, np.fromiter(exclude, dtype=np.int64))
+            rows, scores = rows[keep], scores[keep]
+        if k < len(scores):
+            # Keep every row tied with the k-th score, so that the cut doesn't depend on k
+            threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+            keep = scores >= threshold
+            rows, scores = rows[keep], scores[keep]
+        # Ties are ranked by row id (`rows` is sorted), so pages of any size line up
+        order = np.argsort(-scores, kind="stable")[:k]
+        return rows[order], scores[order]
+
+    def search(self, query: str, k: int, offset: int = 0, exclude=frozenset()) -> list[tuple[dict, float]]:
+        """Serialized stories of the results ranked from `offset` to `offset + k`, with their scores."""
+        rows, scores = self.search_rows(query, offset + k, exclude)
+        return [(self.metadata[row], float(score)) for row, score in zip(rows.tolist()[offset:], scores.tolist()[offset:])]
+
+
+class SearchModeStats:
+    """
+    Latency of the searches per retrieval mode, and in hybrid mode the overlap of the
+    lexical and vector top-k (share of the lexical results also found by vector search).
+    """
+
+    def __init__(self):
+        self.modes = {}
+
+    def record(self, mode: str, seconds: float, overlap: float | None = None):
+        stats = self.modes.setdefault(mode, {"searches": 0, "seconds": 0.0, "overlap": 0.0, "fused": 0})
+        stats["searches"] += 1
+        stats["seconds"] += seconds
+        if overlap is not None:
+            stats["overlap"] += overlap
+            stats["fused"] += 1
+
+    def as_dict(self) -> dict:
+        return {
+            mode: {
+                "searches": stats["searches"],
+                "avg_ms": 1000 * stats["seconds"] / stats["searches"],
+                **({"avg_overlap": stats["overlap"] / stats["fused"]} if stats["fused"] else {}),
+            }
+            for mode, stats in self.modes.items()
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="BM25 index of the story titles")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Build the lexical index of an existing index")
+    build_parser.add_argument("--index", default=os.getenv("LOCAL_INDEX_PATH", "index"))
+    build_parser.add_argument("--metadata", help="Metadata store directory (default: <index>/metadata)")
+    build_parser.add_argument("--out", help="Lexical index directory (default: <index>/lexical)")
+    search_parser = subparsers.add_parser("search", help="Search the titles with BM25")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--index", default=os.getenv("LOCAL_INDEX_PATH", "index"))
+    search_parser.add_argument("--metadata")
+    search_parser.add_argument("--lexical", help="Lexical index directory (default: <index>/lexical)")
+    search_parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    metadata = load_metadata(args.index, args.metadata)
+    if args.command == "build":
+        out = args.out or os.path.join(args.index, "lexical")
+        meta = build_lexical_index(metadata.titles(), out)
+        print(f"Indexed {meta['documents']} titles ({meta['terms']} terms) into {out}")
+    else:
+        index = LexicalIndex(args.lexical or os.path.join(args.index, "lexical"), metadata)
+        for story, score in index.search(args.query, args.k):
+            print(f"{score:6.2f}  {story['title']}  {story['url']}")
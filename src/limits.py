@@ -0,0 +1,171 @@
+import asyncio
+import heapq
+import itertools
+import math
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from src import metrics
+
+# Lower values are served first
+PRIORITY_SEARCH = 0
+PRIORITY_LLM = 1
+PRIORITY_BACKGROUND = 2
+
+# Priority of the downstream calls made on behalf of the current request
+current_priority: ContextVar[int] = ContextVar("current_priority", default=PRIORITY_BACKGROUND)
+
+
+class OverloadedError(RuntimeError):
+    """Raised when a call is not admitted by the concurrency limiter of a dependency."""
+
+    def __init__(self, name: str, retry_after: float, reason: str = "queue full"):
+        self.name = name
+        self.retry_after = retry_after
+        self.reason = reason
+        super().__init__(f"{name} is overloaded ({reason}), retry in {retry_after:.0f}s")
+
+
+class ConcurrencyLimiter:
+    """
+    At most `limit` concurrent calls to a dependency; the others wait in a bounded queue,
+    served by priority then in arrival order.
+
+    When the queue is full, a caller is rejected with `OverloadedError`, unless a waiter
+    of lower priority can be shed to make room for it. Waiters are also rejected after
+    `queue_timeout` seconds: under overload, failing fast keeps the latency of the admitted
+    calls bounded instead of letting every request slow down.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, queue_timeout: float | None = None):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiters = []  # Heap of [priority, arrival, future]
+        self.arrivals = itertools.count()
+        self.avg_hold = 0.0  # Moving average of the time a slot is held
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "shed": 0, "timeout": 0}
+        self.max_queue_depth = 0
+        self.waited = 0
+        self.total_wait = 0.0
+
+    def retry_after(self) -> float:
+        """Rough time for the current queue to drain."""
+        return max(1.0, math.ceil(self.avg_hold * (len(self.waiters) + 1) / self.limit))
+
+    def _lowest_waiter(self):
+        return max(self.waiters, key=lambda waiter: (waiter[0], waiter[1]), default=None)
+
+    def admits(self, priority: int) -> bool:
+        """True if a call with this priority would be accepted (possibly after waiting)."""
+        if self.active < self.limit or len(self.waiters) < self.max_queue:
+            return True
+        lowest = self._lowest_waiter()
+        return lowest is not None and lowest[0] > priority
+
+    def _remove(self, waiter):
+        if waiter in self.waiters:
+            self.waiters.remove(waiter)
+            heapq.heapify(self.waiters)
+
+    async def acquire(self, priority: int) -> bool:
+        """Takes a slot and returns whether the caller had to wait for it."""
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            self.admitted += 1
+            return False
+        if len(self.waiters) >= self.max_queue:
+            lowest = self._lowest_waiter()
+            if lowest is None or lowest[0] <= priority:
+                self.rejected["queue_full"] += 1
+                raise OverloadedError(self.name, self.retry_after())
+            # Make room by shedding the newest waiter of the lowest priority
+            self._remove(lowest)
+            self.rejected["shed"] += 1
+            lowest[2].set_exception(OverloadedError(self.name, self.retry_after(), "shed for a higher priority call"))
+        future = asyncio.get_running_loop().create_future()
+        waiter = [priority, next(self.arrivals), future]
+        heapq.heappush(self.waiters, waiter)
+        self.max_queue_depth = max(self.max_queue_depth, len(self.waiters))
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._remove(waiter)
+            self.rejected["timeout"] += 1
+            raise OverloadedError(self.name, self.retry_after(), "queue timeout") from None
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # The slot was handed over just before the caller went away
+                self.release()
+            self._remove(waiter)
+            raise
+        self.admitted += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+                return
+
+    @asynccontextmanager
+    async def slot(self, priority: int | None = None):
+        """Holds a slot for the duration of the block (priority of the request by default)."""
+        priority = current_priority.get() if priority is None else priority
+        start = perf_counter()
+        if await self.acquire(priority):
+            wait = perf_counter() - start
+            self.waited += 1
+            self.total_wait += wait
+            metrics.record(f"{self.name}_queue", wait)
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.release()
+            self.avg_hold = 0.9 * self.avg_hold + 0.1 * (perf_counter() - start)
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queue_depth": len(self.waiters),
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_queue_wait_ms": 1000 * self.total_wait / self.waited if self.waited else 0.0,
+        }
+
+
+def render_limiters(limiters: dict[str, ConcurrencyLimiter]) -> list[str]:
+    """Prometheus gauges and counters of the limiters."""
+    lines = [
+        "# HELP hn_search_dependency_active Calls in progress per dependency.",
+        "# TYPE hn_search_dependency_active gauge",
+    ]
+    lines += [f'hn_search_dependency_active{{dependency="{name}"}} {limiter.active}' for name, limiter in limiters.items()]
+    lines += [
+        "# HELP hn_search_dependency_queue_depth Calls waiting for a slot per dependency.",
+        "# TYPE hn_search_dependency_queue_depth gauge",
+    ]
+    lines += [
+        f'hn_search_dependency_queue_depth{{dependency="{name}"}} {len(limiter.waiters)}'
+        for name, limiter in limiters.items()
+    ]
+    lines += [
+        "# HELP hn_search_dependency_rejected_total Calls rejected by the limiter of a dependency.",
+        "# TYPE hn_search_dependency_rejected_total counter",
+    ]
+    lines += [
+        f'hn_search_dependency_rejected_total{{dependency="{name}",reason="{reason}"}} {count}'
+        for name, limiter in limiters.items()
+        for reason, count in limiter.rejected.items()
+    ]
+    return lines
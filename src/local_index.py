@@ -0,0 +1,216 @@
+import os
+import json
+import asyncio
+import argparse
+import csv
+
+import numpy as np
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """L2-normalize the rows of a matrix, so that dot products are cosine similarities."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def merge_top_k(ids: np.ndarray, scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Keep the k best (highest score) columns of each row of `scores`, sorted in descending order.
+    `ids` has the same shape as `scores`.
+    """
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+    if k < scores.shape[1]:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        ids = np.take_along_axis(ids, top, axis=1)
+        scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-scores, axis=1, kind="stable")
+    return np.take_along_axis(ids, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+class IndexWriter:
+    """
+    Append-only writer of a local index directory:
+      - `vectors.bin`: raw `(count, dim)` matrix of L2-normalized embeddings (float16 or float32)
+      - `stories.jsonl`: one `{"title", "url", "hn_id"}` object per row
+      - `meta.json`: dim, dtype and the number of committed rows
+
+    Rows are only visible once `flush` has updated `meta.json`; a crashed run is
+    truncated back to the last committed row when the writer is reopened.
+    """
+
+    def __init__(self, path: str, dim: int | None = None, dtype: str = "float16"):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        meta = read_meta(path)
+        if meta is not None:
+            self.dim, self.dtype, self.count = meta["dim"], np.dtype(meta["dtype"]), meta["count"]
+            self._truncate()
+        else:
+            self.dim, self.dtype, self.count = dim, np.dtype(dtype), 0
+            open(os.path.join(path, "vectors.bin"), "wb").close()
+            open(os.path.join(path, "stories.jsonl"), "wb").close()
+        self._vectors = open(os.path.join(path, "vectors.bin"), "ab")
+        self._stories = open(os.path.join(path, "stories.jsonl"), "a", encoding="utf-8")
+
+    def _truncate(self):
+        row_size = self.dim * self.dtype.itemsize
+        with open(os.path.join(self.path, "vectors.bin"), "r+b") as f:
+            f.truncate(self.count * row_size)
+        stories_path = os.path.join(self.path, "stories.jsonl")
+        with open(stories_path, "r+b") as f:
+            offset = 0
+            for _ in range(self.count):
+                line = f.readline()
+                offset += len(line)
+            f.truncate(offset)
+
+    def add(self, vectors, stories: list[dict]):
+        if len(vectors) != len(stories):
+            raise ValueError("vectors and stories must have the same length")
+        if not stories:
+            return
+        vectors = normalize_rows(vectors)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        self._vectors.write(vectors.astype(self.dtype).tobytes())
+        for story in stories:
+            story = {"title": story["title"], "url": story["url"], "hn_id": story["hn_id"]}
+            self._stories.write(json.dumps(story, ensure_ascii=False) + "\n")
+        self.count += len(stories)
+
+    def rollback(self, count: int):
+        """Drops the rows after the first `count` (e.g. written after the last checkpoint)."""
+        if count >= self.count:
+            return
+        self._vectors.flush()
+        self._stories.flush()
+        self.count = count
+        self._truncate()
+        self.flush()
+
+    def flush(self):
+        self._vectors.flush()
+        self._stories.flush()
+        os.fsync(self._vectors.fileno())
+        os.fsync(self._stories.fileno())
+        meta = {"dim": self.dim, "dtype": self.dtype.name, "count": self.count}
+        tmp_path = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self.path, "meta.json"))
+
+    def close(self):
+        self.flush()
+        self._vectors.close()
+        self._stories.close()
+
+
+def read_meta(path: str) -> dict | None:
+    meta_path = os.path.join(path, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def load_vectors(path: str) -> np.ndarray:
+    """Memory-map the embedding matrix of a local index."""
+    meta = read_meta(path)
+    if meta is None:
+        raise FileNotFoundError(f"No local index found in {path}")
+    if meta["count"] == 0:
+        return np.empty((0, meta["dim"] or 0), dtype=meta["dtype"])
+    return np.memmap(
+        os.path.join(path, "vectors.bin"),
+        dtype=meta["dtype"],
+        mode="r",
+        shape=(meta["count"], meta["dim"]),
+    )
+
+
+def load_stories(path: str) -> list[dict]:
+    meta = read_meta(path)
+    stories = []
+    with open(os.path.join(path, "stories.jsonl"), encoding="utf-8") as f:
+        for line, _ in zip(f, range(meta["count"])):
+            stories.append(json.loads(line))
+    return stories
+
+
+class ExactIndex:
+    """
+    Exact top-k cosine search over a memory-mapped embedding matrix.
+
+    The matrix is scanned in blocks of `block_size` rows: each block is scored against all
+    the queries with one matrix product and reduced to its top-k with `argpartition`,
+    so memory stays bounded regardless of the corpus size.
+    """
+
+    def __init__(self, vectors: np.ndarray, block_size: int = 65536):
+        self.vectors = vectors
+        self.block_size = block_size
+
+    @classmethod
+    def load(cls, path: str, block_size: int = 65536):
+        return cls(load_vectors(path), block_size=block_size)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, queries, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the row ids and cosine similarities of the top-k rows for each query,
+        as two `(len(queries), k)` arrays sorted by decreasing similarity.
+        """
+        queries = normalize_rows(queries)
+        best_ids = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(self.vectors), self.block_size):
+            block = np.asarray(self.vectors[start : start + self.block_size], dtype=np.float32)
+            scores = queries @ block.T
+            ids = np.broadcast_to(np.arange(start, start + len(block)), scores.shape)
+            ids, scores = merge_top_k(ids, scores, k)
+            best_ids, best_scores = merge_top_k(
+                np.concatenate([best_ids, ids], axis=1),
+                np.concatenate([best_scores, scores], axis=1),
+                k,
+            )
+        return best_ids, best_scores
+
+
+async def _build_cli(args):
+    from src.utils import CustomHFEmbeddings, make_http_client
+
+    embedder = CustomHFEmbeddings(os.environ["EMBEDDER_ENDPOINT_URL"], client=make_http_client())
+    writer = IndexWriter(args.out, dtype=args.dtype)
+    try:
+        with open(args.csv, encoding="utf-8", newline="") as f:
+            rows = csv.DictReader(f)
+            batch = []
+            for row in rows:
+                batch.append({"title": row["title"], "url": row["url"], "hn_id": int(row["id"])})
+                if len(batch) == args.batch_size:
+                    writer.add(await embedder.aembed_documents([s["title"] for s in batch]), batch)
+                    batch = []
+            if batch:
+                writer.add(await embedder.aembed_documents([s["title"] for s in batch]), batch)
+    finally:
+        writer.close()
+        await embedder.aclose()
+    print(f"Indexed {writer.count} stories into {args.out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a local story index from a cleaned CSV")
+    parser.add_argument("csv", help="CSV with id, title and url columns (e.g. story_cleaned.csv)")
+    parser.add_argument("--out", default=os.getenv("LOCAL_INDEX_PATH", "index"))
+    parser.add_argument("--dtype", default="float16", choices=["float16", "float32"])
+    parser.add_argument("--batch-size", type=int, default=64)
+    asyncio.run(_build_cli(parser.parse_args()))
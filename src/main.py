@@ -1,25 +1,182 @@
 import os
 import asyncio
-import json
+from time import perf_counter
 
-from fastapi import FastAPI
-from contextlib import asynccontextmanager
-from starlette.responses import StreamingResponse, JSONResponse
+from fastapi import FastAPI, Header
+from contextlib import asynccontextmanager, nullcontext
+from starlette.responses import StreamingResponse, JSONResponse, PlainTextResponse
 import weaviate
 from weaviate.classes.init import Auth
-from langchain_weaviate import WeaviateVectorStore
-from langchain_core.documents import Document
 from langchain_openai import ChatOpenAI
 
-from src.utils import Request, CustomHFEmbeddings
+from src.utils import Request, BatchRequest, CustomHFEmbeddings, make_http_client
+from src.batching import EmbeddingBatcher
+from src.cache import EmbeddingCache, CachedEmbeddings, ResultCache, SemanticCache
+from src.coalescing import SingleFlight, StreamFlights
+from src.pagination import ResultSetStore, encode_cursor, decode_cursor
+from src.backends import SearchBackend, WeaviateBackend, LocalBackend, with_scores
+from src.fusion import fuse_results
 from src.prompt import make_prompt
+from src.expansion import LocalExpander, RacingExpander, TermStatistics, render_expander
+from src.delta import DeltaUpdater, make_source
+from src.metadata import MetadataStore
+from src.lexical import LexicalIndex, SearchModeStats
+from src.serialization import Serializer
+from src import metrics
+from src.metrics import SamplingProfiler, TimingMiddleware, render_metrics
+from src.health import CircuitBreaker, CircuitOpenError, HealthMonitor
+from src.limits import (
+    ConcurrencyLimiter,
+    OverloadedError,
+    current_priority,
+    render_limiters,
+    PRIORITY_SEARCH,
+    PRIORITY_LLM,
+)
 
 
 EMBEDDER_ENDPOINT_URL = os.environ["EMBEDDER_ENDPOINT_URL"]
-WEAVIATE_INDEX_NAME = os.environ["WEAVIATE_INDEX_NAME"]
 
-
-chain = embedder = client = db = None
+# Vector search backend: "weaviate" or "local"
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "weaviate")
+WEAVIATE_INDEX_NAME = os.getenv("WEAVIATE_INDEX_NAME")
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "index")
+LOCAL_INDEX_BLOCK_SIZE = int(os.getenv("LOCAL_INDEX_BLOCK_SIZE", "65536"))
+LOCAL_INDEX_KIND = os.getenv("LOCAL_INDEX_KIND", "exact")
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+QUANT_OVERSAMPLE = int(os.getenv("QUANT_OVERSAMPLE", "10"))
+SEARCH_SHARDS = int(os.getenv("SEARCH_SHARDS", "4"))
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "0")) or None
+# Columnar story metadata (default for the local backend: <LOCAL_INDEX_PATH>/metadata)
+METADATA_PATH = os.getenv("METADATA_PATH")
+
+# Embedder HTTP client tuning
+EMBEDDER_HTTP2 = os.getenv("EMBEDDER_HTTP2", "false").lower() == "true"
+EMBEDDER_MAX_CONNECTIONS = int(os.getenv("EMBEDDER_MAX_CONNECTIONS", "100"))
+EMBEDDER_MAX_KEEPALIVE = int(os.getenv("EMBEDDER_MAX_KEEPALIVE", "20"))
+EMBEDDER_TIMEOUT = float(os.getenv("EMBEDDER_TIMEOUT", "10"))
+EMBEDDER_CONNECT_TIMEOUT = float(os.getenv("EMBEDDER_CONNECT_TIMEOUT", "5"))
+EMBEDDER_RETRIES = int(os.getenv("EMBEDDER_RETRIES", "3"))
+EMBEDDER_BACKOFF = float(os.getenv("EMBEDDER_BACKOFF", "0.2"))
+
+# Micro-batching of concurrent embedding requests
+EMBEDDER_MAX_BATCH = int(os.getenv("EMBEDDER_MAX_BATCH", "32"))
+EMBEDDER_MAX_WAIT_MS = float(os.getenv("EMBEDDER_MAX_WAIT_MS", "5"))
+
+# Query embedding cache
+EMBEDDER_MODEL_ID = os.getenv("EMBEDDER_MODEL_ID", "sentence-transformers/all-mpnet-base-v2")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float32")
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR")
+EMBEDDING_CACHE_DISK_SIZE = int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", "100000"))
+EMBEDDING_CACHE_WARM_FILE = os.getenv("EMBEDDING_CACHE_WARM_FILE")
+
+# Endpoint result cache (seconds, 0 disables it)
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "300"))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1000"))
+
+# Semantic cache of LLM query expansions (size 0 disables it)
+EXPANSION_CACHE_THRESHOLD = float(os.getenv("EXPANSION_CACHE_THRESHOLD", "0.95"))
+EXPANSION_CACHE_SIZE = int(os.getenv("EXPANSION_CACHE_SIZE", "5000"))
+
+# Query expansion engine: "llm", "local" or "race" (LLM with local fallback after a deadline)
+EXPANSION_ENGINE = os.getenv("EXPANSION_ENGINE", "llm")
+EXPANSION_DEADLINE_MS = float(os.getenv("EXPANSION_DEADLINE_MS", "1500"))
+EXPANSION_CHUNK_TIMEOUT_MS = float(os.getenv("EXPANSION_CHUNK_TIMEOUT_MS", "1000"))
+EXPANSION_STATS_PATH = os.getenv("EXPANSION_STATS_PATH", "term_stats.json")
+
+# Progressive /search: size of the first page and of the following chunks
+SEARCH_FIRST_PAGE = int(os.getenv("SEARCH_FIRST_PAGE", "20"))
+SEARCH_STREAM_CHUNK = int(os.getenv("SEARCH_STREAM_CHUNK", "100"))
+
+# Maximum number of concurrent backend searches of one /search_batch request
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# Cursor pagination: lifetime (seconds) and memory cap of the stored result sets
+RESULT_SET_TTL = float(os.getenv("RESULT_SET_TTL", "600"))
+RESULT_SET_MAX_MB = float(os.getenv("RESULT_SET_MAX_MB", "64"))
+
+# Server-side fusion of the subquery results: "rrf" or "score"
+FUSION_METHOD = os.getenv("FUSION_METHOD", "rrf")
+FUSION_RRF_K = int(os.getenv("FUSION_RRF_K", "60"))
+
+# Responses: SSE token events are batched for up to SSE_FLUSH_MS (0 sends each one at once),
+# JSON bodies above COMPRESS_MIN_BYTES are compressed when the client accepts it
+SSE_FLUSH_MS = float(os.getenv("SSE_FLUSH_MS", "20"))
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+
+# Retrieval: "vector", or "hybrid" (BM25 over the titles and vector search, fused with RRF).
+# Queries of at most LEXICAL_FAST_PATH_TERMS terms, all known to the lexical index, are answered
+# by BM25 alone without calling the embedder (0 disables it)
+SEARCH_MODE = os.getenv("SEARCH_MODE", "vector")
+# Lexical index built by src.ingest (default: <LOCAL_INDEX_PATH>/lexical for the local backend, lexical otherwise)
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH")
+LEXICAL_FAST_PATH_TERMS = int(os.getenv("LEXICAL_FAST_PATH_TERMS", "0"))
+LEXICAL_WEIGHT = float(os.getenv("LEXICAL_WEIGHT", "1.0"))
+
+# Incremental updates: "hn" (Hacker News API) or a JSONL file of items, unset disables them
+DELTA_SOURCE = os.getenv("DELTA_SOURCE")
+DELTA_INTERVAL = float(os.getenv("DELTA_INTERVAL", "300"))
+DELTA_STATE_PATH = os.getenv("DELTA_STATE_PATH", "delta_state.json")
+DELTA_BATCH_SIZE = int(os.getenv("DELTA_BATCH_SIZE", "16"))
+DELTA_EXPIRE_AFTER = float(os.getenv("DELTA_EXPIRE_AFTER", "0")) or None
+DELTA_MIN_SCORE = int(os.getenv("DELTA_MIN_SCORE", "2"))
+
+# Health checks: dependencies are probed every HEALTH_INTERVAL seconds (unless they served traffic),
+# a circuit opens after CIRCUIT_FAILURES consecutive failures and lets a call through after CIRCUIT_RESET seconds
+HEALTH_INTERVAL = float(os.getenv("HEALTH_INTERVAL", "10"))
+HEALTH_TIMEOUT = float(os.getenv("HEALTH_TIMEOUT", "5"))
+CIRCUIT_FAILURES = int(os.getenv("CIRCUIT_FAILURES", "5"))
+CIRCUIT_RESET = float(os.getenv("CIRCUIT_RESET", "30"))
+
+# Concurrency limits of the dependencies: calls beyond the limit wait in a queue of at most *_QUEUE
+# calls for at most LIMIT_QUEUE_TIMEOUT_MS, the calls of /search before those of /search_llm
+EMBEDDER_CONCURRENCY = int(os.getenv("EMBEDDER_CONCURRENCY", "16"))
+EMBEDDER_QUEUE = int(os.getenv("EMBEDDER_QUEUE", "256"))
+VECTOR_DB_CONCURRENCY = int(os.getenv("VECTOR_DB_CONCURRENCY", "32"))
+VECTOR_DB_QUEUE = int(os.getenv("VECTOR_DB_QUEUE", "512"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "16"))
+LLM_QUEUE = int(os.getenv("LLM_QUEUE", "64"))
+LIMIT_QUEUE_TIMEOUT_MS = float(os.getenv("LIMIT_QUEUE_TIMEOUT_MS", "2000"))
+
+# Sampling profiler: requests slower than PROFILE_SLOW_MS write a profile to PROFILE_DIR, unset disables it
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0")) or None
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+
+# The prompt asks the LLM for between 1 and 5 key points
+MAX_SUB_QUERIES = 5
+
+
+chain = embedder = batcher = embedding_cache = backend = delta_updater = health_monitor = lexical_index = None
+
+breakers = {
+    name: CircuitBreaker(name, failure_threshold=CIRCUIT_FAILURES, reset_timeout=CIRCUIT_RESET)
+    for name in ("vector_db", "embedder", "llm")
+}
+limiters = {
+    name: ConcurrencyLimiter(name, limit, max_queue, queue_timeout=LIMIT_QUEUE_TIMEOUT_MS / 1000)
+    for name, limit, max_queue in (
+        ("vector_db", VECTOR_DB_CONCURRENCY, VECTOR_DB_QUEUE),
+        ("embedder", EMBEDDER_CONCURRENCY, EMBEDDER_QUEUE),
+        ("llm", LLM_CONCURRENCY, LLM_QUEUE),
+    )
+}
+metrics.collectors.append(lambda: render_limiters(limiters))
+metrics.collectors.append(lambda: render_expander(chain) if isinstance(chain, RacingExpander) else [])
+
+result_cache = ResultCache(ttl=RESULT_CACHE_TTL, max_entries=RESULT_CACHE_SIZE)
+expansion_cache = SemanticCache(
+    threshold=EXPANSION_CACHE_THRESHOLD, max_entries=EXPANSION_CACHE_SIZE
+)
+search_flights = SingleFlight()
+search_llm_flights = StreamFlights()
+search_stream_stats = {"streams": 0, "time_to_first_result_ms": 0.0, "total_ms": 0.0}
+batch_stats = {"bios": 0, "seconds": 0.0}
+search_mode_stats = SearchModeStats()
+result_sets = ResultSetStore(ttl=RESULT_SET_TTL, max_bytes=int(RESULT_SET_MAX_MB * 2**20))
+serializer = Serializer(compress_min_size=COMPRESS_MIN_BYTES)
+profiler = SamplingProfiler(PROFILE_DIR, interval=PROFILE_INTERVAL_MS / 1000) if PROFILE_SLOW_MS else None
 
 
 # FastAPI lifespan event handler
@@ -27,90 +184,566 @@ chain = embedder = client = db = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global chain, embedder, client, db
+    global chain, embedder, batcher, embedding_cache, backend, delta_updater, health_monitor, lexical_index
 
     ### LLM configuration ###
 
-    model = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-    prompt = make_prompt()
-    chain = prompt | model
+    chain = make_chain()
     print("Chain created")
 
     ### Embedder configuration ###
     
-    embedder = CustomHFEmbeddings(EMBEDDER_ENDPOINT_URL)
+    http_client = make_http_client(
+        http2=EMBEDDER_HTTP2,
+        max_connections=EMBEDDER_MAX_CONNECTIONS,
+        max_keepalive_connections=EMBEDDER_MAX_KEEPALIVE,
+        timeout=EMBEDDER_TIMEOUT,
+        connect_timeout=EMBEDDER_CONNECT_TIMEOUT,
+    )
+    hf_embedder = CustomHFEmbeddings(
+        EMBEDDER_ENDPOINT_URL,
+        client=http_client,
+        retries=EMBEDDER_RETRIES,
+        backoff=EMBEDDER_BACKOFF,
+        timeout=EMBEDDER_TIMEOUT,
+        breaker=breakers["embedder"],
+        limiter=limiters["embedder"],
+    )
+    batcher = EmbeddingBatcher(
+        hf_embedder,
+        max_batch_size=EMBEDDER_MAX_BATCH,
+        max_wait=EMBEDDER_MAX_WAIT_MS / 1000,
+    )
+    embedding_cache = EmbeddingCache(
+        model_id=EMBEDDER_MODEL_ID,
+        capacity=EMBEDDING_CACHE_SIZE,
+        dtype=EMBEDDING_CACHE_DTYPE,
+        disk_path=EMBEDDING_CACHE_DIR,
+        disk_capacity=EMBEDDING_CACHE_DISK_SIZE,
+    )
+    embedder = CachedEmbeddings(batcher, embedding_cache)
+    warm_task = None
+    if EMBEDDING_CACHE_WARM_FILE:
+        warm_task = asyncio.create_task(embedder.warm(EMBEDDING_CACHE_WARM_FILE))
     print("Embedder created")
 
-    ### WEAVIATE cliet configuration ###
+    ### Search backend configuration ###
 
-    weaviate_url = os.environ["WEAVIATE_URL"]
-    weaviate_api_key = os.environ["WEAVIATE_API_KEY"]
+    backend = make_backend()
+    await backend.connect()
+    lexical_index = make_lexical_index(backend)
 
-    client = weaviate.connect_to_weaviate_cloud(
-        cluster_url=weaviate_url,
-        auth_credentials=Auth.api_key(weaviate_api_key),
-    )
+    ### Health checks ###
 
-    if not client.is_ready():
-        print("Weaviate is not ready yet")
-    else:
-        print("Weaviate is ready")
-    db = WeaviateVectorStore(
-        client=client,
-        index_name=WEAVIATE_INDEX_NAME,
-        text_key="text",
-        embedding=embedder,
+    health_monitor = HealthMonitor(
+        breakers,
+        {"vector_db": backend.is_ready, "embedder": hf_embedder.ahealth_check},
+        interval=HEALTH_INTERVAL,
+        timeout=HEALTH_TIMEOUT,
     )
+    await health_monitor.check_all()
+    for name, state in health_monitor.stats().items():
+        if not state["ready"]:
+            print(f"{name} is not ready: {state['last_error']}")
+    health_task = asyncio.create_task(health_monitor.run())
+
+    delta_task = None
+    if DELTA_SOURCE:
+        # Titles are embedded without the query cache, which they would only evict
+        delta_updater = DeltaUpdater(
+            make_source(DELTA_SOURCE),
+            backend,
+            batcher,
+            state_path=DELTA_STATE_PATH,
+            batch_size=DELTA_BATCH_SIZE,
+            expire_after=DELTA_EXPIRE_AFTER,
+            min_score=DELTA_MIN_SCORE,
+        )
+        delta_task = asyncio.create_task(delta_updater.run(DELTA_INTERVAL))
+    if profiler is not None:
+        # Samples the thread running the event loop
+        profiler.start()
     print("All set up")
 
     yield
 
-    client.close()
+    if profiler is not None:
+        profiler.stop()
+    health_task.cancel()
+
+    if warm_task is not None and not warm_task.done():
+        warm_task.cancel()
+    if delta_task is not None:
+        # Let an interrupted batch unwind before the source and the backend are closed
+        delta_task.cancel()
+        await asyncio.gather(delta_task, return_exceptions=True)
+        await delta_updater.source.close()
+    await backend.close()
+    await embedder.aclose()
+
+
+def make_chain():
+    if EXPANSION_ENGINE not in ("llm", "local", "race"):
+        raise ValueError(f"Unknown expansion engine: {EXPANSION_ENGINE}")
+    if EXPANSION_ENGINE in ("local", "race"):
+        statistics = None
+        if os.path.exists(EXPANSION_STATS_PATH):
+            statistics = TermStatistics.load(EXPANSION_STATS_PATH)
+        else:
+            print(f"No term statistics at {EXPANSION_STATS_PATH}, local expansion uses uniform weights")
+        local_expander = LocalExpander(statistics, max_queries=MAX_SUB_QUERIES)
+        if EXPANSION_ENGINE == "local":
+            return local_expander
+
+    model = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+    prompt = make_prompt()
+    llm_chain = prompt | model
+    if EXPANSION_ENGINE == "race":
+        return RacingExpander(
+            llm_chain,
+            local_expander,
+            deadline=EXPANSION_DEADLINE_MS / 1000,
+            chunk_timeout=EXPANSION_CHUNK_TIMEOUT_MS / 1000,
+            max_queries=MAX_SUB_QUERIES,
+            breaker=breakers["llm"],
+        )
+    return llm_chain
+
+
+def make_backend() -> SearchBackend:
+    if SEARCH_BACKEND == "local":
+        local_backend = LocalBackend.load(
+            LOCAL_INDEX_PATH,
+            kind=LOCAL_INDEX_KIND,
+            block_size=LOCAL_INDEX_BLOCK_SIZE,
+            nprobe=IVF_NPROBE,
+            oversample=QUANT_OVERSAMPLE,
+            shards=SEARCH_SHARDS,
+            workers=SEARCH_WORKERS,
+            metadata_path=METADATA_PATH,
+        )
+        print(f"Local index loaded: {len(local_backend.metadata)} stories")
+        return local_backend
+    if SEARCH_BACKEND != "weaviate":
+        raise ValueError(f"Unknown search backend: {SEARCH_BACKEND}")
+
+    ### WEAVIATE cliet configuration ###
+
+    weaviate_url = os.environ["WEAVIATE_URL"]
+    weaviate_api_key = os.environ["WEAVIATE_API_KEY"]
+
+    # Connected by `backend.connect()`, in the event loop
+    client = weaviate.use_async_with_weaviate_cloud(
+        cluster_url=weaviate_url,
+        auth_credentials=Auth.api_key(weaviate_api_key),
+    )
+    metadata = None
+    if METADATA_PATH:
+        metadata = MetadataStore.load(METADATA_PATH)
+        print(f"Metadata store loaded: {len(metadata)} stories")
+    return WeaviateBackend(client, WEAVIATE_INDEX_NAME, metadata=metadata)
+
+
+def make_lexical_index(backend: SearchBackend) -> LexicalIndex | None:
+    if SEARCH_MODE not in ("vector", "hybrid"):
+        raise ValueError(f"Unknown search mode: {SEARCH_MODE}")
+    if SEARCH_MODE == "vector" and not LEXICAL_FAST_PATH_TERMS:
+        return None
+    path = LEXICAL_INDEX_PATH
+    if path is None:
+        path = os.path.join(LOCAL_INDEX_PATH, "lexical") if SEARCH_BACKEND == "local" else "lexical"
+    # Lexical results are read from the metadata store, by row
+    if backend.metadata is None or not os.path.exists(os.path.join(path, "lexical.json")):
+        print(f"No lexical index at {path} (or no metadata store), using vector search only")
+        return None
+    index = LexicalIndex(path, backend.metadata)
+    print(f"Lexical index loaded: {index.documents} titles, {len(index.vocabulary)} terms")
+    return index
 
 
 # FastAPI app
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(
+    TimingMiddleware,
+    profiler=profiler,
+    slow_threshold=PROFILE_SLOW_MS / 1000 if PROFILE_SLOW_MS else None,
+)
+
+
+def circuit_error(*names) -> CircuitOpenError | None:
+    """Error of the first of these dependencies whose circuit is open, if any."""
+    for name in names:
+        breaker = breakers[name]
+        if breaker.is_open:
+            return CircuitOpenError(name, breaker.retry_after(), breaker.last_error)
+    return None
+
+
+def overload_error(priority: int, *names) -> OverloadedError | None:
+    """Error of the first of these dependencies whose queue has no room for this priority, if any."""
+    for name in names:
+        limiter = limiters[name]
+        if not limiter.admits(priority):
+            limiter.rejected["queue_full"] += 1
+            return OverloadedError(name, limiter.retry_after())
+    return None
+
+
+def unavailable(error: CircuitOpenError | OverloadedError) -> JSONResponse:
+    """503 while a dependency is down, 429 while it is overloaded."""
+    return JSONResponse(
+        {"error": str(error)},
+        status_code=429 if isinstance(error, OverloadedError) else 503,
+        headers={"Retry-After": str(int(error.retry_after))},
+    )
 
 
-def serialize_docs(docs: list[Document]) -> list[dict]:
-    return [
-        {
-            "title": doc.page_content,
-            "url": doc.metadata.get("url", ""),
-            "hn_id": doc.metadata.get("hn_id", ""),
-        }
-        for doc in docs
-    ]
+async def call_dependency(name: str, function, *args):
+    """Calls a dependency within its concurrency limit and through its circuit breaker."""
+    async with limiters[name].slot():
+        return await breakers[name].call(function, *args)
 
 
-async def wait_for_db_ready(timeout=30) -> bool:
-    for _ in range(timeout):
-        if client.is_ready():
-            return True
-        await asyncio.sleep(1)
-    return False
+async def search_stories(query, k, offset=0, total=None) -> list[dict]:
+    hits = await search_stories_many([query], k, offset, total)
+    return with_scores(hits[0])
 
 
-async def search_stories(query, k) -> list[dict]:
-    if not await wait_for_db_ready():
+def is_lexical_query(query, total) -> bool:
+    """
+    Keyword query answered by the lexical index alone: it must have enough matching titles
+    for the whole result set, so that every page of it comes from the same ranking.
+    """
+    return (
+        lexical_index is not None
+        and LEXICAL_FAST_PATH_TERMS > 0
+        and lexical_index.is_keyword_query(query, LEXICAL_FAST_PATH_TERMS)
+        and lexical_index.max_df(query) >= total
+    )
+
+
+async def search_stories_many(queries, k, offset=0, total=None) -> list[list[tuple[dict, float]]]:
+    """
+    Search several queries in one go: one batched embedding call for all the queries,
+    then the backend searches them together.
+    Keyword queries are answered by the lexical index alone when the fast path is enabled,
+    and in hybrid mode the other queries are also searched with BM25 and the results fused.
+    `total` is the size of the result set this page belongs to (`offset + k` by default):
+    the retrieval mode and the fusion depth only depend on it, so pages fetched separately
+    (e.g. the chunks of a streamed `/search`) are consistent.
+    Returns, for each query, its serialized stories together with their scores.
+    Raises `CircuitOpenError` at once if the embedder or the vector database is down,
+    and `OverloadedError` if one of them has no room for the call.
+    """
+    if not queries:
         return []
-    results = await db.asimilarity_search(query, k)
-    return serialize_docs(results)
+    total = max(total or 0, offset + k)
+    results = [None] * len(queries)
+    for i, query in enumerate(queries):
+        if is_lexical_query(query, total):
+            start = perf_counter()
+            with metrics.stage("lexical"):
+                results[i] = await asyncio.to_thread(lexical_index.search, query, k, offset, deleted_rows())
+            search_mode_stats.record("lexical", perf_counter() - start)
+    rest = [i for i, hits in enumerate(results) if hits is None]
+    if rest:
+        rest_queries = [queries[i] for i in rest]
+        start = perf_counter()
+        if lexical_index is not None and SEARCH_MODE == "hybrid":
+            rest_hits = await hybrid_search(rest_queries, k, offset, total)
+        else:
+            rest_hits = await vector_search(rest_queries, k, offset)
+            search_mode_stats.record("vector", perf_counter() - start)
+        for i, hits in zip(rest, rest_hits):
+            results[i] = hits
+    return results
+
+
+def deleted_rows():
+    """Rows of the deleted stories, which the lexical index still contains."""
+    return getattr(backend, "deleted_rows", frozenset())
+
+
+async def vector_search(queries, k, offset=0) -> list[list[tuple[dict, float]]]:
+    # Embed on the event loop with the pooled async client, so the vector store
+    # doesn't fall back to the blocking `embed_query`
+    with metrics.stage("embed"):
+        vectors = await embedder.aembed_documents(queries)
+    with metrics.stage("search"):
+        return await call_dependency("vector_db", backend.search, queries, vectors, k, offset)
+
+
+async def hybrid_search(queries, k, offset=0, total=None) -> list[list[tuple[dict, float]]]:
+    """
+    BM25 and vector search of the queries, run concurrently and fused with RRF (their
+    scores are not comparable). Both lists are ranked from the top down to `total`, so
+    that the pages of one result set are cut from the same fused ranking.
+    """
+    start = perf_counter()
+    n = max(total or 0, offset + k)
+    exclude = deleted_rows()
+
+    async def lexical_search():
+        with metrics.stage("lexical"):
+            return await asyncio.to_thread(lambda: [lexical_index.search(query, n, 0, exclude) for query in queries])
+
+    lexical_hits, vector_hits = await asyncio.gather(lexical_search(), vector_search(queries, n))
+    seconds = perf_counter() - start
+    results = []
+    for lexical, vector in zip(lexical_hits, vector_hits):
+        fused = fuse_results(
+            [with_scores(vector), with_scores(lexical)],
+            n,
+            method="rrf",
+            rrf_k=FUSION_RRF_K,
+            weights=[1.0, LEXICAL_WEIGHT],
+        )
+        stories = [({key: value for key, value in story.items() if key != "score"}, story["score"]) for story in fused]
+        results.append(stories[offset : offset + k])
+        # Share of the lexical top-k also found by vector search
+        lexical_ids = {story["hn_id"] for story, _ in lexical[:k]}
+        overlap = None
+        if lexical_ids:
+            overlap = len(lexical_ids & {story["hn_id"] for story, _ in vector[:k]}) / len(lexical_ids)
+        search_mode_stats.record("hybrid", seconds, overlap)
+    return results
 
 
 # Endpoint for simple search (No LLM)
 
 
 @app.post("/search")
-async def search(request: Request):
+async def search(request: Request, accept_encoding: str = Header("")):
     query = request.user_input
     k = request.k
 
     if not query:
         return JSONResponse({"error": "Missing query"}, status_code=400)
-    results = await search_stories(query, k)
-    return JSONResponse({"results": results})
+    current_priority.set(PRIORITY_SEARCH)
+    found = result_cache.lookup("search", query, k)
+    cached = found[:2] if found is not None and not found[2] else None
+    error = None
+    if cached is None:
+        error = circuit_error("vector_db", "embedder") or overload_error(PRIORITY_SEARCH, "vector_db", "embedder")
+    if error is not None:
+        # Serve an expired result rather than an error while a dependency is down or overloaded
+        cached = found[:2] if found is not None else None
+        if cached is None:
+            return unavailable(error)
+    if request.stream:
+        return StreamingResponse(
+            serializer.ndjson_stream(stream_search(query, k, cached[1][:k] if cached else None), "search_stream"),
+            media_type="application/x-ndjson",
+        )
+    if cached is not None:
+        results = cached[1][:k]
+    else:
+
+        async def run_search():
+            results = await search_stories(query, k)
+            result_cache.put("search", query, k, results)
+            return results
+
+        # Concurrent identical requests share one search
+        try:
+            results = await search_flights.do(result_cache.key("search", query) + (k,), run_search)
+        except (CircuitOpenError, OverloadedError) as e:
+            return unavailable(e)
+    if request.page_size:
+        return serializer.response(first_page(results, request.page_size), "search", accept_encoding)
+    return serializer.response({"results": results}, "search", accept_encoding)
+
+
+def first_page(results: list[dict], page_size: int) -> dict:
+    """
+    Store the ranked hn_ids of a result list and return its first page with the cursor
+    of the next one (None on the last page).
+    """
+    result_set = result_sets.put([story["hn_id"] for story in results])
+    next_cursor = encode_cursor(result_set, page_size, page_size) if len(results) > page_size else None
+    return {"results": results[:page_size], "total": len(results), "next_cursor": next_cursor}
+
+
+# Endpoint for batch search (many bios in one request)
+
+
+@app.post("/search_batch")
+async def search_batch(request: BatchRequest):
+    # Bulk jobs yield to the interactive searches
+    current_priority.set(PRIORITY_LLM)
+    return StreamingResponse(
+        serializer.ndjson_stream(generate_batch_results(request.items), "search_batch"),
+        media_type="application/x-ndjson",
+    )
+
+
+async def generate_batch_results(items: list[Request]):
+    """
+    Search many bios at once: the bios that are not in the result cache are searched like
+    with /search, at most BATCH_CONCURRENCY at a time (their embeddings are batched by the embedder).
+    Yields one event (NDJSON line) per item, `{"index": i, "results": [...]}` (or `"error"`),
+    in completion order, and a final line with the throughput in bios per second.
+    """
+    start = perf_counter()
+    lines = asyncio.Queue()
+    pending = []
+    for index, item in enumerate(items):
+        cached = result_cache.get("search", item.user_input, item.k) if item.user_input else None
+        if not item.user_input:
+            await lines.put({"index": index, "error": "Missing query"})
+        elif cached is not None:
+            await lines.put({"index": index, "results": cached[1][: item.k]})
+        else:
+            pending.append((index, item))
+
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def worker(index, item):
+        try:
+            async with semaphore:
+                # Same retrieval as /search (search mode, lexical fast path), so that
+                # both endpoints can share the cached results
+                results = await search_stories(item.user_input, item.k)
+            result_cache.put("search", item.user_input, item.k, results)
+            await lines.put({"index": index, "results": results})
+        except Exception as e:
+            await lines.put({"index": index, "error": str(e)})
+
+    async def search_all():
+        error = circuit_error("vector_db", "embedder") or overload_error(PRIORITY_LLM, "vector_db", "embedder")
+        if error is not None:
+            for index, _ in pending:
+                await lines.put({"index": index, "error": str(error)})
+            return
+        # The embedder coalesces the embeddings of concurrent searches in calls of at most EMBEDDER_MAX_BATCH texts
+        await asyncio.gather(*(worker(index, item) for index, item in pending))
+
+    task = asyncio.create_task(search_all()) if pending else None
+    try:
+        for _ in range(len(items)):
+            yield await lines.get()
+    finally:
+        if task is not None and not task.done():
+            task.cancel()
+    seconds = perf_counter() - start
+    batch_stats["bios"] += len(items)
+    batch_stats["seconds"] += seconds
+    yield {"done": True, "items": len(items), "seconds": seconds, "bios_per_second": len(items) / seconds if seconds else 0.0}
+
+
+# Endpoint for the following pages of a paginated search
+
+
+@app.get("/results/{cursor}")
+async def results_page(cursor: str, accept_encoding: str = Header("")):
+    current_priority.set(PRIORITY_SEARCH)
+    decoded = decode_cursor(cursor)
+    ids = result_sets.get(decoded[0]) if decoded else None
+    if ids is None:
+        return JSONResponse({"error": "Invalid or expired cursor"}, status_code=404)
+    result_set, offset, page_size = decoded
+    try:
+        page = await call_dependency("vector_db", backend.fetch, ids[offset : offset + page_size].tolist())
+    except (CircuitOpenError, OverloadedError) as e:
+        return unavailable(e)
+    end = offset + page_size
+    next_cursor = encode_cursor(result_set, end, page_size) if end < len(ids) else None
+    return serializer.response(
+        {"results": page, "total": len(ids), "next_cursor": next_cursor}, "results", accept_encoding
+    )
+
+
+async def stream_search(query, k, cached=None):
+    """
+    Progressive /search: sends the first page of results as soon as it is available,
+    then the rest in chunks fetched concurrently with offset/limit queries (sent in order).
+    Each event (NDJSON line) is `{"results": [...], "offset": n}`; the last one reports the
+    time to first result and the total time.
+    """
+    start = perf_counter()
+    first_result_ms = None
+    first_page = min(k, max(1, SEARCH_FIRST_PAGE))
+    ranges = [(0, first_page)] + [
+        (offset, min(SEARCH_STREAM_CHUNK, k - offset))
+        for offset in range(first_page, k, SEARCH_STREAM_CHUNK)
+    ]
+
+    async def fetch(offset, limit):
+        if cached is not None:
+            return cached[offset : offset + limit]
+        return await search_stories(query, limit, offset, total=k)
+
+    tasks = [asyncio.create_task(fetch(offset, limit)) for offset, limit in ranges]
+    results = []
+    try:
+        for (offset, _), task in zip(ranges, tasks):
+            page = await task
+            results.extend(page)
+            if first_result_ms is None:
+                first_result_ms = 1000 * (perf_counter() - start)
+            yield {"results": page, "offset": offset}
+    finally:
+        for task in tasks:
+            task.cancel()
+    if cached is None:
+        result_cache.put("search", query, k, results)
+    total_ms = 1000 * (perf_counter() - start)
+    search_stream_stats["streams"] += 1
+    search_stream_stats["time_to_first_result_ms"] += first_result_ms or 0.0
+    search_stream_stats["total_ms"] += total_ms
+    yield {"done": True, "total": len(results), "time_to_first_result_ms": first_result_ms, "total_ms": total_ms}
+
+
+# Endpoint for internal statistics
+
+
+@app.get("/stats")
+async def stats():
+    return {
+        "embedder_batching": batcher.stats.as_dict(),
+        "embedding_cache": embedding_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "expansion_cache": expansion_cache.stats(),
+        "expansion": chain.stats() if isinstance(chain, RacingExpander) else None,
+        "coalesced_requests": search_flights.coalesced + search_llm_flights.coalesced,
+        "abandoned_streams": search_llm_flights.abandoned,
+        "result_sets": result_sets.stats(),
+        "search_batch": {
+            **batch_stats,
+            "bios_per_second": batch_stats["bios"] / batch_stats["seconds"] if batch_stats["seconds"] else 0.0,
+        },
+        "search_stream": {
+            "streams": search_stream_stats["streams"],
+            "avg_time_to_first_result_ms": search_stream_stats["time_to_first_result_ms"]
+            / max(1, search_stream_stats["streams"]),
+            "avg_total_ms": search_stream_stats["total_ms"] / max(1, search_stream_stats["streams"]),
+        },
+        "delta_updates": None if delta_updater is None else delta_updater.stats(),
+        "serialization": serializer.stats.as_dict(),
+        "health": health_monitor.stats(),
+        "search_modes": search_mode_stats.as_dict(),
+        "limits": {name: limiter.stats() for name, limiter in limiters.items()},
+    }
+
+
+# Endpoint for the readiness of the dependencies
+
+
+@app.get("/health")
+async def health():
+    ready = health_monitor.is_ready("vector_db") and health_monitor.is_ready("embedder")
+    return JSONResponse(
+        {"ready": ready, "dependencies": health_monitor.stats()}, status_code=200 if ready else 503
+    )
+
+
+# Endpoint for Prometheus metrics
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 
 # Endpoint for inactivity check
@@ -124,77 +757,218 @@ async def keep_alive():
 
 async def generate_results(query, k):
     """
-    Generate a streaming response for the given query.
+    Generate the events of the streaming response for the given query
+    (formatted as Server-Sent Events by the endpoint).
 
     This function performs the following steps:
       1. Streams tokens from the LLM and immediately sends each token (as 'chunk') to the client.
       2. Accumulates tokens into a buffer and extracts subqueries whenever a newline ("\n") is found.
-      3. After the LLM streaming is complete, performs a database search for each extracted subquery.
-         The number of results per query is computed as k divided by the number of subqueries (with a minimum of 1).
-      4. Sends the serialized documents for each subquery as a single event.
+      3. Launches the database search of each subquery as soon as its line is complete,
+         while the LLM is still generating the next ones (lines completed by the same token
+         share one multi-query search).
+      4. Since the final number of subqueries is unknown while the LLM is streaming, every search
+         overfetches k results. Results arriving before the LLM is done are trimmed to
+         k // MAX_SUB_QUERIES (a share that is always within budget); once the subquery count is
+         known, each list is topped up to k divided by the number of subqueries (with a minimum of 1).
+         Top-ups are sent as further 'results' events for the same query.
       5. If a database error occurs, sends an error message for that subquery but continues processing.
-      6. Finally, signals to the client that streaming is complete.
+      6. Fuses the subquery lists on the server (Reciprocal Rank Fusion or weighted scores,
+         deduplicated on hn_id) and sends the final 'ranking' of exactly k hn_ids, with the
+         'stories' of the ranking that were not sent yet. Stories are never sent twice.
+      7. Finally, signals to the client that streaming is complete.
+
+    If the bio (or one within the semantic cache threshold) was already expanded, the cached
+    subqueries are sent as a single chunk and searched at once, without calling the LLM.
 
     Parameters:
       query (str): The user query to process.
       k (int): The total number of results expected; divided among subqueries.
 
     Yields:
-      str: Server-Sent Events (SSE) formatted strings containing chunks, results, errors, or a done message.
+      dict: Events containing chunks, results, errors, or a done message.
     """
-    buffer = ""
+    events = asyncio.Queue()  # Queue to store tokens, results and errors
     sub_queries = []
-
-    # LLM streaming: immediately sends each token to the client.
-    async for token_obj in chain.astream({"input": query}):
-        token = token_obj.content
-        if token:
-            # Immediately send the token
-            yield f"data: {json.dumps({'chunk': token})}\n\n"
-            buffer += token
-
-        # Extract subqueries from the buffer when a newline ("\n") is found.
-        while "\n" in buffer:
-            sub_query, buffer = buffer.split("\n", 1)
-            sub_query = sub_query.strip()
-            if sub_query:
-                sub_queries.append(sub_query)
-
-    if buffer:
-        sub_query = buffer.strip()
-        if sub_query:
-            sub_queries.append(sub_query)
-
-    # At this point, the LLM streaming has completed.
-    # If any subqueries were generated, perform a DB search.
-
-    if sub_queries:
-        k_per_query = max(1, k // len(sub_queries))
-        queue = asyncio.Queue() # Queue to store results and errors
-
-        async def worker(sub_query):
-            try:
-                results = await search_stories(sub_query, k_per_query)
-                await queue.put((sub_query, results, None))
-            except Exception as e:
-                await queue.put((sub_query, None, str(e)))
-
-        # Launch all database search tasks concurrently
-        tasks = [asyncio.create_task(worker(sub_query)) for sub_query in sub_queries]
-
-        # Process results as they become available
-        for _ in range(len(tasks)):
-            sub_query, results, error = await queue.get()
-            if error:
-                yield f"data: {json.dumps({'error': f'DB error on {sub_query}: {error}'})}\n\n"
+    search_tasks = []
+
+    async def worker(batch):
+        try:
+            with metrics.stage("subquery_search", " | ".join(batch)):
+                hits = await search_stories_many(batch, k)
+        except Exception as e:
+            for sub_query in batch:
+                await events.put(("error", sub_query, str(e)))
+            return
+        for sub_query, query_hits in zip(batch, hits):
+            await events.put(("results", sub_query, with_scores(query_hits)))
+
+    def dispatch(lines):
+        # Lines completed by the same token are searched together in one multi-query call
+        batch = [line.strip() for line in lines if line.strip()]
+        if batch:
+            sub_queries.extend(batch)
+            search_tasks.append(asyncio.create_task(worker(batch)))
+
+    async def expand():
+        buffer = ""
+        try:
+            # Reuse the expansion of an identical or similar bio, skipping the LLM
+            with metrics.stage("expansion_cache"):
+                cached = expansion_cache.lookup_exact(query) if EXPANSION_CACHE_SIZE > 0 else None
+                bio_vector = None
+                if cached is None and EXPANSION_CACHE_SIZE > 0:
+                    bio_vector = await embedder.aembed_query(query)
+                    match = expansion_cache.lookup(query, bio_vector)
+                    cached = match[0] if match else None
+            if cached is not None:
+                await events.put(("chunk", "\n".join(cached), None))
+                dispatch(cached)
+                await events.put(("llm_done", None, None))
+                return
+
+            start = perf_counter()
+            first_token = True
+            # The racing expander reports the LLM errors to the breaker itself, and expands
+            # locally while the circuit is open
+            async with limiters["llm"].slot():
+                with breakers["llm"] if EXPANSION_ENGINE == "llm" else nullcontext():
+                    async for token_obj in chain.astream({"input": query}):
+                        token = token_obj.content
+                        if token:
+                            if first_token:
+                                metrics.record("llm_first_token", perf_counter() - start)
+                                first_token = False
+                            await events.put(("chunk", token, None))
+                            buffer += token
+
+                        # Dispatch a search whenever a newline ("\n") completes a subquery.
+                        if "\n" in buffer:
+                            *lines, buffer = buffer.split("\n")
+                            dispatch(lines)
+            dispatch([buffer])
+            metrics.record("llm_total", perf_counter() - start)
+            if bio_vector is not None:
+                expansion_cache.put(query, bio_vector, sub_queries, perf_counter() - start)
+            await events.put(("llm_done", None, None))
+        except Exception as e:
+            await events.put(("llm_error", None, e))
+
+    llm_task = asyncio.create_task(expand())
+    llm_done = False
+    received = 0
+    early_k = max(1, k // MAX_SUB_QUERIES)
+    partial = []  # (sub_query, results) sent before the subquery count was known
+    ranked_lists = []  # Full (overfetched) result list of each subquery, for the fusion
+    sent_ids = set()
+
+    def unsent(results):
+        # Stories already sent for another subquery are not sent again
+        new_results = [story for story in results if story["hn_id"] not in sent_ids]
+        sent_ids.update(story["hn_id"] for story in new_results)
+        return new_results
+
+    try:
+        while not llm_done or received < len(sub_queries):
+            kind, sub_query, payload = await events.get()
+            if kind == "chunk":
+                # Immediately send the token
+                yield {"chunk": sub_query}
+            elif kind == "llm_error":
+                if not isinstance(payload, (CircuitOpenError, OverloadedError)):
+                    raise payload
+                # The LLM is down or overloaded: report it and end the stream without results
+                yield {"error": str(payload)}
+                llm_done = True
+            elif kind == "llm_done":
+                llm_done = True
+                if sub_queries:
+                    k_per_query = max(1, k // len(sub_queries))
+                    for partial_query, results in partial:
+                        top_up = unsent(results[early_k:k_per_query])
+                        if top_up:
+                            yield {"results": top_up, "query": partial_query}
+                partial = []
+            elif kind == "error":
+                received += 1
+                yield {"error": f"DB error on {sub_query}: {payload}"}
             else:
-                yield f"data: {json.dumps({'results': results, 'query': sub_query})}\n\n"
-
-        # Ensure all tasks are completed before proceeding
-        await asyncio.gather(*tasks, return_exceptions=True)
+                received += 1
+                ranked_lists.append(payload)
+                if llm_done:
+                    results = payload[: max(1, k // len(sub_queries))]
+                else:
+                    results = payload[:early_k]
+                    partial.append((sub_query, payload))
+                yield {"results": unsent(results), "query": sub_query}
+    finally:
+        # Stop the pending work when the stream is cancelled (all its clients disconnected)
+        for task in [llm_task, *search_tasks]:
+            if not task.done():
+                task.cancel()
+
+    # Final ranking: exactly k unique stories fused from the overfetched subquery lists,
+    # with the stories that were not streamed yet
+    if ranked_lists:
+        fused = fuse_results(ranked_lists, k, method=FUSION_METHOD, rrf_k=FUSION_RRF_K)
+        yield {
+            "ranking": [story["hn_id"] for story in fused],
+            "stories": [story for story in fused if story["hn_id"] not in sent_ids],
+        }
 
     # Signal to the client that streaming is complete.
-    yield 'data: {"done": true}\n\n'
+    yield {"done": True}
+
+
+def trim_events(events: list[dict], k: int) -> list[dict]:
+    """
+    Adapt the recorded events of a /search_llm stream computed with a larger k to k:
+    the results of each subquery are merged and trimmed to k divided by the number of subqueries,
+    and the final ranking to its first k stories.
+    """
+    chunks = [event for event in events if "chunk" in event]
+    per_query = {}
+    pool = {}
+    ranking = None
+    for event in events:
+        if "results" in event:
+            per_query.setdefault(event["query"], []).extend(event["results"])
+        if "ranking" in event:
+            ranking = event["ranking"][:k]
+        for story in event.get("results", []) + event.get("stories", []):
+            pool[story["hn_id"]] = story
+    k_per_query = max(1, k // len(per_query)) if per_query else 0
+    results = [
+        {"results": results[:k_per_query], "query": sub_query}
+        for sub_query, results in per_query.items()
+    ]
+    trimmed = chunks + results
+    if ranking is not None:
+        sent_ids = {story["hn_id"] for event in results for story in event["results"]}
+        stories = [pool[hn_id] for hn_id in ranking if hn_id not in sent_ids]
+        trimmed.append({"ranking": ranking, "stories": stories})
+    return trimmed + [{"done": True}]
+
+
+async def replay_events(events: list[dict]):
+    for event in events:
+        yield event
+
+
+async def paginate_events(events, page_size: int):
+    """
+    Paginated /search_llm: subquery events only report how many new stories were found,
+    and the final ranking is replaced by its first page and the cursor of the next one.
+    """
+    pool = {}
+    async for event in events:
+        if "results" in event:
+            pool.update((story["hn_id"], story) for story in event["results"])
+            yield {"query": event["query"], "count": len(event["results"])}
+        elif "ranking" in event:
+            pool.update((story["hn_id"], story) for story in event["stories"])
+            yield first_page([pool[hn_id] for hn_id in event["ranking"]], page_size)
+        else:
+            yield event
 
 
 # Endpoint for LLM search
@@ -207,8 +981,41 @@ async def search_llm(request: Request):
 
     if not query:
         return JSONResponse({"error": "Missing query"}, status_code=400)
+    current_priority.set(PRIORITY_LLM)
+    found = result_cache.lookup("search_llm", query, k)
+    cached = found[:2] if found is not None and not found[2] else None
+    error = None
+    if cached is None:
+        error = circuit_error("vector_db", "embedder", "llm") or overload_error(
+            PRIORITY_LLM, "vector_db", "embedder", "llm"
+        )
+    if error is not None:
+        # Serve an expired result rather than an error while a dependency is down or overloaded
+        cached = found[:2] if found is not None else None
+        # Without the LLM, bios with a cached expansion can still be searched
+        if cached is None and error.name != "llm":
+            return unavailable(error)
+    if cached is not None:
+        cached_k, events = cached
+        events = replay_events(events if cached_k == k else trim_events(events, k))
+    else:
+
+        def on_complete(events):
+            if not any("error" in event for event in events):
+                result_cache.put("search_llm", query, k, events)
+
+        # Concurrent identical requests follow the same LLM expansion and searches
+        flight = search_llm_flights.join(
+            result_cache.key("search_llm", query) + (k,),
+            lambda: generate_results(query, k),
+            on_complete,
+        )
+        events = flight.follow()
+    if request.page_size:
+        events = paginate_events(events, request.page_size)
     return StreamingResponse(
-        generate_results(query, k),
+        # Timings of this request, never replayed from the cache
+        serializer.sse_stream(events, "search_llm", flush_interval=SSE_FLUSH_MS / 1000, timings=True),
         media_type="text/event-stream",
         headers={"Cache-Control": "no-transform"},
     )
@@ -0,0 +1,251 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from src.local_index import load_stories
+
+STRING_COLUMNS = ("title", "url")
+# Optional numeric columns. The HN score is stored as "points", since "score" is the
+# similarity score of the search results.
+NUMERIC_COLUMNS = {"points": np.int32, "time": np.int64}
+
+
+class MetadataWriter:
+    """
+    Append-only writer of a columnar story metadata directory:
+      - `hn_id.bin`: int64 array
+      - `title.bin` / `url.bin`: UTF-8 blobs, with `title_ends.bin` / `url_ends.bin`
+        holding the int64 end offset of each row in the blob
+      - `points.bin` / `time.bin`: optional numeric columns
+      - `metadata.json`: the optional columns and the number of committed rows
+
+    As with `IndexWriter`, rows are only visible once `flush` has updated `metadata.json`
+    and a crashed run is truncated back to the last committed row when reopened.
+    """
+
+    def __init__(self, path: str, columns: tuple[str, ...] = ()):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        meta = read_metadata(path)
+        if meta is not None:
+            self.columns, self.count = tuple(meta["columns"]), meta["count"]
+        else:
+            self.columns, self.count = tuple(columns), 0
+        self._files = {}
+        for name in self._file_names():
+            file_path = os.path.join(path, name)
+            if meta is None:
+                open(file_path, "wb").close()
+            self._files[name] = open(file_path, "r+b")
+        self._truncate()
+
+    def _file_names(self):
+        names = ["hn_id.bin"]
+        for column in STRING_COLUMNS:
+            names += [f"{column}.bin", f"{column}_ends.bin"]
+        return names + [f"{column}.bin" for column in self.columns]
+
+    def _truncate(self):
+        sizes = {"hn_id.bin": self.count * 8}
+        for column in STRING_COLUMNS:
+            ends = self._files[f"{column}_ends.bin"]
+            end = 0
+            if self.count:
+                ends.seek((self.count - 1) * 8)
+                end = int(np.frombuffer(ends.read(8), dtype=np.int64)[0])
+            sizes[f"{column}.bin"] = end
+            sizes[f"{column}_ends.bin"] = self.count * 8
+        for column in self.columns:
+            sizes[f"{column}.bin"] = self.count * np.dtype(NUMERIC_COLUMNS[column]).itemsize
+        for name, f in self._files.items():
+            f.truncate(sizes[name])
+            f.seek(0, os.SEEK_END)
+
+    def add(self, stories: list[dict]):
+        if not stories:
+            return
+        self._files["hn_id.bin"].write(np.array([s["hn_id"] for s in stories], dtype=np.int64).tobytes())
+        for column in STRING_COLUMNS:
+            blob = self._files[f"{column}.bin"]
+            encoded = [s[column].encode("utf-8") for s in stories]
+            ends = blob.tell() + np.cumsum([len(e) for e in encoded], dtype=np.int64)
+            blob.write(b"".join(encoded))
+            self._files[f"{column}_ends.bin"].write(ends.tobytes())
+        for column in self.columns:
+            values = np.array([s.get(column, 0) for s in stories], dtype=NUMERIC_COLUMNS[column])
+            self._files[f"{column}.bin"].write(values.tobytes())
+        self.count += len(stories)
+
+    def rollback(self, count: int):
+        """Drops the rows after the first `count` (e.g. written after the last checkpoint)."""
+        if count >= self.count:
+            return
+        for f in self._files.values():
+            f.flush()
+        self.count = count
+        self._truncate()
+        self.flush()
+
+    def flush(self):
+        for f in self._files.values():
+            f.flush()
+            os.fsync(f.fileno())
+        tmp_path = os.path.join(self.path, "metadata.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"columns": list(self.columns), "count": self.count}, f)
+        os.replace(tmp_path, os.path.join(self.path, "metadata.json"))
+
+    def close(self):
+        self.flush()
+        for f in self._files.values():
+            f.close()
+
+
+def read_metadata(path: str) -> dict | None:
+    meta_path = os.path.join(path, "metadata.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def _map(path: str, name: str, dtype, count: int | None = None) -> np.ndarray:
+    file_path = os.path.join(path, name)
+    if os.path.getsize(file_path) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(file_path, dtype=dtype, mode="r", shape=count)
+
+
+class MetadataStore:
+    """
+    Story metadata as columns: a row id from the vector index is turned into a story
+    with a few array lookups and two slices of the title and url blobs, and `hn_id`s are
+    resolved to rows with a binary search over a sorted copy of the `hn_id` column.
+
+    Rows appended after loading (`append`) are kept in a small in-memory tail, and
+    written through to the directory when the store was loaded from one.
+    """
+
+    def __init__(self, hn_ids, strings: dict, columns: dict, path: str | None = None):
+        self.hn_ids = hn_ids
+        self.strings = strings
+        self.columns = columns
+        self.path = path
+        self.tail = []
+        self.tail_rows = {}
+        self.order = self.sorted_ids = None
+        self.writer = None
+
+    @classmethod
+    def load(cls, path: str):
+        meta = read_metadata(path)
+        if meta is None:
+            raise FileNotFoundError(f"No metadata store found in {path}")
+        count = meta["count"]
+        strings = {
+            column: (_map(path, f"{column}.bin", np.uint8), _map(path, f"{column}_ends.bin", np.int64, count))
+            for column in STRING_COLUMNS
+        }
+        columns = {column: _map(path, f"{column}.bin", NUMERIC_COLUMNS[column], count) for column in meta["columns"]}
+        return cls(_map(path, "hn_id.bin", np.int64, count), strings, columns, path=path)
+
+    @classmethod
+    def from_stories(cls, stories: list[dict]):
+        """In-memory store, for indexes built without a metadata directory."""
+        store = cls(np.empty(0, dtype=np.int64), {}, {})
+        store.tail = list(stories)
+        store.tail_rows = {story["hn_id"]: row for row, story in enumerate(stories)}
+        return store
+
+    def __len__(self):
+        return len(self.hn_ids) + len(self.tail)
+
+    def _string(self, column: str, row: int) -> str:
+        blob, ends = self.strings[column]
+        start = int(ends[row - 1]) if row else 0
+        return bytes(blob[start : ends[row]]).decode("utf-8")
+
+    def __getitem__(self, row: int) -> dict:
+        if row >= len(self.hn_ids):
+            return self.tail[row - len(self.hn_ids)]
+        return {
+            "title": self._string("title", row),
+            "url": self._string("url", row),
+            "hn_id": int(self.hn_ids[row]),
+        }
+
+    def titles(self):
+        """Titles of all the rows, in order."""
+        for row in range(len(self.hn_ids)):
+            yield self._string("title", row)
+        for story in self.tail:
+            yield story["title"]
+
+    def rows(self, hn_ids: list[int]) -> list[int | None]:
+        """Rows of the given `hn_id`s, None for the unknown ones."""
+        if self.order is None:
+            self.order = np.argsort(self.hn_ids, kind="stable")
+            self.sorted_ids = np.asarray(self.hn_ids)[self.order]
+        rows = [None] * len(hn_ids)
+        sorted_ids = self.sorted_ids
+        if len(sorted_ids):
+            wanted = np.asarray(hn_ids, dtype=np.int64)
+            positions = np.minimum(np.searchsorted(sorted_ids, wanted), len(sorted_ids) - 1)
+            for i, (position, hn_id) in enumerate(zip(positions.tolist(), hn_ids)):
+                if sorted_ids[position] == hn_id:
+                    rows[i] = int(self.order[position])
+        for i, hn_id in enumerate(hn_ids):
+            if rows[i] is None and hn_id in self.tail_rows:
+                rows[i] = self.tail_rows[hn_id]
+        return rows
+
+    def max_hn_id(self) -> int:
+        base = int(self.hn_ids.max()) if len(self.hn_ids) else 0
+        return max([base] + list(self.tail_rows))
+
+    def append(self, stories: list[dict]):
+        if self.path is not None:
+            if self.writer is None:
+                self.writer = MetadataWriter(self.path)
+            self.writer.add(stories)
+            self.writer.flush()
+        for story in stories:
+            self.tail.append({"title": story["title"], "url": story["url"], "hn_id": story["hn_id"]})
+            self.tail_rows[story["hn_id"]] = len(self) - 1
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def load_metadata(index_path: str, metadata_path: str | None = None) -> MetadataStore:
+    """
+    Metadata of a local index: its columnar store if it was built (and is in sync with
+    the vectors), the `stories.jsonl` of the index otherwise.
+    """
+    metadata_path = metadata_path or os.path.join(index_path, "metadata")
+    meta = read_metadata(metadata_path)
+    with open(os.path.join(index_path, "meta.json")) as f:
+        count = json.load(f)["count"]
+    if meta is not None and meta["count"] == count:
+        return MetadataStore.load(metadata_path)
+    if meta is not None:
+        print(f"Metadata store {metadata_path} is out of sync with the index, reading stories.jsonl")
+    return MetadataStore.from_stories(load_stories(index_path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the metadata store of an existing local index")
+    parser.add_argument("--index", default=os.getenv("LOCAL_INDEX_PATH", "index"))
+    parser.add_argument("--out", help="Metadata directory (default: <index>/metadata)")
+    args = parser.parse_args()
+    out = args.out or os.path.join(args.index, "metadata")
+    writer = MetadataWriter(out)
+    writer.rollback(0)
+    stories = load_stories(args.index)
+    for start in range(0, len(stories), 65536):
+        writer.add(stories[start : start + 65536])
+    writer.close()
+    print(f"Wrote the metadata of {writer.count} stories to {out}")
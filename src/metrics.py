@@ -0,0 +1,208 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bounds (seconds) of the histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+ENDPOINTS = ("/search", "/search_llm", "/search_batch", "/results", "/stats", "/metrics", "/health", "/keep_alive")
+
+
+class Histogram:
+    """Prometheus histogram with one series per combination of label values."""
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...], buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series["buckets"][i] += 1
+        series["sum"] += value
+        series["count"] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self.series.items()):
+            pairs = [f'{name}="{value}"' for name, value in zip(self.label_names, labels)]
+            bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, series["buckets"] + [series["count"]]):
+                bucket_labels = ",".join(pairs + [f'le="{bound}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {count}")
+            label_text = "{" + ",".join(pairs) + "}" if pairs else ""
+            lines.append(f"{self.name}_sum{label_text} {series['sum']}")
+            lines.append(f"{self.name}_count{label_text} {series['count']}")
+        return lines
+
+
+request_seconds = Histogram("hn_search_request_seconds", "Duration of the requests.", ("endpoint",))
+stage_seconds = Histogram(
+    "hn_search_stage_seconds", "Duration of the stages of the request path.", ("endpoint", "stage")
+)
+
+
+# Functions returning more metric lines (e.g. gauges of other modules)
+collectors = []
+
+
+def render_metrics() -> str:
+    lines = request_seconds.render() + stage_seconds.render()
+    for collect in collectors:
+        lines += collect()
+    return "\n".join(lines) + "\n"
+
+
+class RequestTimings:
+    """
+    Stages timed during one request, in the order they finished. A stage may appear
+    several times (e.g. one search per subquery), with an optional description.
+    """
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.start = time.perf_counter()
+        self.stages = []
+
+    def add(self, stage: str, seconds: float, description: str | None = None):
+        self.stages.append((stage, seconds, description))
+
+    def server_timing(self) -> str:
+        entries = []
+        for stage, seconds, description in self.stages:
+            entry = f"{stage};dur={1000 * seconds:.2f}"
+            if description:
+                entry += ';desc="' + description.replace("\\", "").replace('"', "'")[:100] + '"'
+            entries.append(entry)
+        return ", ".join(entries)
+
+    def as_dict(self) -> dict:
+        return {
+            "stages": [
+                {"stage": stage, "ms": round(1000 * seconds, 3), **({"detail": description} if description else {})}
+                for stage, seconds, description in self.stages
+            ],
+            "total_ms": round(1000 * (time.perf_counter() - self.start), 3),
+        }
+
+
+current_timings: ContextVar[RequestTimings | None] = ContextVar("current_timings", default=None)
+
+
+def record(stage: str, seconds: float, description: str | None = None):
+    """Adds a stage to the timings of the current request and to the stage histogram."""
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds, description)
+    stage_seconds.observe(seconds, timings.endpoint if timings is not None else "background", stage)
+
+
+@contextmanager
+def stage(name: str, description: str | None = None):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start, description)
+
+
+def endpoint_label(path: str) -> str:
+    for endpoint in ENDPOINTS:
+        if path == endpoint or path.startswith(endpoint + "/"):
+            return endpoint
+    return "other"
+
+
+class SamplingProfiler:
+    """
+    Opt-in sampling profiler of the event loop thread: a daemon thread records its stack
+    every `interval` seconds into a bounded ring buffer, and the samples taken during a
+    slow request are written as collapsed stacks (flame graph format) to `output_dir`.
+    As all requests share the event loop, the samples cover whatever it ran meanwhile.
+    """
+
+    def __init__(self, output_dir: str = "profiles", interval: float = 0.005, max_samples: int = 60000):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.samples = deque(maxlen=max_samples)
+        self.thread_id = None
+        self.running = False
+
+    def start(self):
+        """Starts sampling the calling thread (the one running the event loop)."""
+        self.thread_id = threading.get_ident()
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def _run(self):
+        while self.running:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < 64:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            self.samples.append((time.perf_counter(), ";".join(reversed(stack))))
+            time.sleep(self.interval)
+
+    def dump(self, name: str, start: float, end: float) -> str | None:
+        stacks = Counter(stack for t, stack in list(self.samples) if start <= t <= end)
+        if not stacks:
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{name.strip('/') or 'root'}.txt")
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+class TimingMiddleware:
+    """
+    ASGI middleware that times every request: its stages are collected through a context
+    variable, sent in the `Server-Timing` header (with the stages finished when the
+    response starts, i.e. all of them for non-streaming responses) and added to the
+    histograms. Requests slower than `slow_threshold` are profiled, if a profiler is set.
+    """
+
+    def __init__(self, app, profiler: SamplingProfiler | None = None, slow_threshold: float | None = None):
+        self.app = app
+        self.profiler = profiler
+        self.slow_threshold = slow_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        timings = RequestTimings(endpoint_label(scope["path"]))
+        token = current_timings.set(timings)
+
+        async def send_with_timings(message):
+            if message["type"] == "http.response.start" and timings.stages:
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.server_timing().encode("latin-1", "replace")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            current_timings.reset(token)
+            end = time.perf_counter()
+            request_seconds.observe(end - timings.start, timings.endpoint)
+            if self.profiler is not None and self.slow_threshold is not None and end - timings.start > self.slow_threshold:
+                path = self.profiler.dump(timings.endpoint, timings.start, end)
+                if path:
+                    print(f"Slow request on {timings.endpoint} ({1000 * (end - timings.start):.0f} ms), profile: {path}")
@@ -0,0 +1,68 @@
+import base64
+import secrets
+from collections import OrderedDict
+from time import monotonic
+
+import numpy as np
+
+
+def encode_cursor(result_set: str, offset: int, page_size: int) -> str:
+    raw = f"{result_set}:{offset}:{page_size}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, int, int] | None:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        result_set, offset, page_size = raw.rsplit(":", 2)
+        offset, page_size = int(offset), int(page_size)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    # Cursors come back from the clients: reject pages that were never handed out
+    if offset < 0 or page_size < 1:
+        return None
+    return result_set, offset, page_size
+
+
+class ResultSetStore:
+    """
+    Server-side result sets for cursor pagination. Only the ranked `hn_id`s are kept,
+    as compact int64 arrays; titles and URLs are looked up for the requested page only.
+    Result sets expire after `ttl` seconds and the oldest are evicted beyond `max_bytes`.
+    """
+
+    def __init__(self, ttl: float = 600, max_bytes: int = 64 * 2**20):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[str, tuple[float, np.ndarray]] = OrderedDict()
+        self.bytes = 0
+        self.evictions = 0
+
+    def _remove(self, result_set: str):
+        _, ids = self.entries.pop(result_set)
+        self.bytes -= ids.nbytes
+
+    def _expire(self):
+        now = monotonic()
+        # Entries are in insertion order, so expired ones are at the front
+        while self.entries and next(iter(self.entries.values()))[0] < now:
+            self._remove(next(iter(self.entries)))
+
+    def put(self, hn_ids) -> str:
+        self._expire()
+        ids = np.asarray(hn_ids, dtype=np.int64)
+        result_set = secrets.token_urlsafe(12)
+        self.entries[result_set] = (monotonic() + self.ttl, ids)
+        self.bytes += ids.nbytes
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+        return result_set
+
+    def get(self, result_set: str) -> np.ndarray | None:
+        self._expire()
+        entry = self.entries.get(result_set)
+        return entry[1] if entry is not None else None
+
+    def stats(self) -> dict:
+        return {"result_sets": len(self.entries), "bytes": self.bytes, "evictions": self.evictions}
@@ -0,0 +1,186 @@
+import os
+import argparse
+from time import perf_counter
+
+import numpy as np
+
+from src.local_index import ExactIndex, load_vectors, merge_top_k, normalize_rows
+from src.ann import recall_at_k, sample_queries
+
+
+if hasattr(np, "bitwise_count"):
+    popcount = np.bitwise_count
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(values: np.ndarray) -> np.ndarray:
+        return _POPCOUNT_TABLE[values]
+
+
+class QuantizedIndex:
+    """
+    Two-stage search over compact codes of the local index.
+
+    Stage 1 scans in-memory codes: sign bits packed 8 per byte compared with the Hamming
+    distance (`binary`, 32x smaller than float32) or per-dimension scaled int8 codes scored
+    with a dot product (`int8`, 4x smaller). Stage 2 rescores the best `k * oversample`
+    candidates against the full-precision rows memory-mapped from disk.
+    Files: `codes_binary.npy`, or `codes_int8.npy` and `int8_scale.npy`.
+    """
+
+    def __init__(self, vectors, codes, kind: str, scale=None, oversample: int = 10, block_size: int = 262144):
+        self.vectors = vectors
+        self.codes = codes
+        self.kind = kind
+        self.scale = scale
+        self.oversample = oversample
+        self.block_size = block_size
+
+    @classmethod
+    def build(cls, path: str, kind: str = "binary", block_size: int = 65536):
+        vectors = load_vectors(path)
+        if kind == "binary":
+            codes = np.empty((len(vectors), (vectors.shape[1] + 7) // 8), dtype=np.uint8)
+            for start in range(0, len(vectors), block_size):
+                block = np.asarray(vectors[start : start + block_size])
+                codes[start : start + len(block)] = np.packbits(block > 0, axis=1)
+            np.save(os.path.join(path, "codes_binary.npy"), codes)
+            return cls(vectors, codes, kind)
+        if kind == "int8":
+            scale = np.zeros(vectors.shape[1], dtype=np.float32)
+            for start in range(0, len(vectors), block_size):
+                block = np.abs(np.asarray(vectors[start : start + block_size], dtype=np.float32))
+                scale = np.maximum(scale, block.max(axis=0))
+            scale[scale == 0] = 1.0
+            scale /= 127
+            codes = np.empty(vectors.shape, dtype=np.int8)
+            for start in range(0, len(vectors), block_size):
+                block = np.asarray(vectors[start : start + block_size], dtype=np.float32)
+                codes[start : start + len(block)] = np.clip(np.rint(block / scale), -127, 127)
+            np.save(os.path.join(path, "codes_int8.npy"), codes)
+            np.save(os.path.join(path, "int8_scale.npy"), scale)
+            return cls(vectors, codes, kind, scale)
+        raise ValueError(f"Unknown quantization kind: {kind}")
+
+    @classmethod
+    def load(cls, path: str, kind: str = "binary", oversample: int = 10):
+        # Codes are loaded in RAM, the float rows stay memory-mapped
+        vectors = load_vectors(path)
+        if kind == "binary":
+            return cls(vectors, np.load(os.path.join(path, "codes_binary.npy")), kind, oversample=oversample)
+        if kind == "int8":
+            return cls(
+                vectors,
+                np.load(os.path.join(path, "codes_int8.npy")),
+                kind,
+                np.load(os.path.join(path, "int8_scale.npy")),
+                oversample=oversample,
+            )
+        raise ValueError(f"Unknown quantization kind: {kind}")
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.codes.nbytes
+
+    # Rows decoded at a time by the coarse scan, so the temporary copies stay small (a few MB)
+    # whatever the block size, instead of undoing the memory savings of the codes
+    SCORE_CHUNK = 4096
+
+    def _coarse_scores(self, query: np.ndarray, start: int, stop: int) -> np.ndarray:
+        scores = np.empty(stop - start, dtype=np.float32)
+        if self.kind == "binary":
+            bits = np.packbits(query > 0)
+        else:
+            query = (query * self.scale).astype(np.float32)
+        for chunk in range(start, stop, self.SCORE_CHUNK):
+            end = min(chunk + self.SCORE_CHUNK, stop)
+            codes = self.codes[chunk:end]
+            if self.kind == "binary":
+                scores[chunk - start : end - start] = -popcount(codes ^ bits).sum(axis=1, dtype=np.int32)
+            else:
+                scores[chunk - start : end - start] = codes.astype(np.float32) @ query
+        return scores
+
+    def search(self, queries, k: int, oversample: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Same contract as `ExactIndex.search`."""
+        queries = normalize_rows(queries)
+        n_candidates = min(len(self.codes), k * (oversample or self.oversample))
+        result_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        result_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for row, query in enumerate(queries):
+            best_ids = np.empty((1, 0), dtype=np.int64)
+            best_scores = np.empty((1, 0), dtype=np.float32)
+            for start in range(0, len(self.codes), self.block_size):
+                stop = min(start + self.block_size, len(self.codes))
+                scores = self._coarse_scores(query, start, stop)[None, :]
+                ids = np.arange(start, stop)[None, :]
+                ids, scores = merge_top_k(ids, scores, n_candidates)
+                best_ids, best_scores = merge_top_k(
+                    np.concatenate([best_ids, ids], axis=1),
+                    np.concatenate([best_scores, scores], axis=1),
+                    n_candidates,
+                )
+            candidates = np.sort(best_ids[0])
+            if not len(candidates):
+                continue
+            scores = np.asarray(self.vectors[candidates], dtype=np.float32) @ query
+            ids, scores = merge_top_k(candidates[None, :], scores[None, :], k)
+            result_ids[row, : ids.shape[1]] = ids[0]
+            result_scores[row, : scores.shape[1]] = scores[0]
+        return result_ids, result_scores
+
+
+def benchmark(path: str, kinds: list[str], oversamples: list[int], k: int = 100, n_queries: int = 100) -> list[dict]:
+    """Memory, QPS and recall@k of each quantization mode against exact float search."""
+    exact = ExactIndex.load(path)
+    queries = sample_queries(exact.vectors, min(n_queries, len(exact)))
+    float32_bytes = exact.vectors.shape[0] * exact.vectors.shape[1] * 4
+    start = perf_counter()
+    truth = np.concatenate([exact.search(q[None, :], k)[0] for q in queries])
+    report = [
+        {"mode": "exact", "memory_mb": float32_bytes / 2**20, "qps": len(queries) / (perf_counter() - start), "recall": 1.0}
+    ]
+    for kind in kinds:
+        index = QuantizedIndex.load(path, kind)
+        for oversample in oversamples:
+            start = perf_counter()
+            found = np.concatenate([index.search(q[None, :], k, oversample)[0] for q in queries])
+            report.append(
+                {
+                    "mode": f"{kind} oversample={oversample}",
+                    "memory_mb": index.memory_bytes / 2**20,
+                    "qps": len(queries) / (perf_counter() - start),
+                    "recall": recall_at_k(truth, found),
+                }
+            )
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or benchmark quantized codes of a local index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build")
+    build_parser.add_argument("--index", default=os.getenv("LOCAL_INDEX_PATH", "index"))
+    build_parser.add_argument("--kind", default="binary", choices=["binary", "int8"])
+    bench_parser = subparsers.add_parser("bench")
+    bench_parser.add_argument("--index", default=os.getenv("LOCAL_INDEX_PATH", "index"))
+    bench_parser.add_argument("--kind", default="binary,int8")
+    bench_parser.add_argument("--oversample", default="2,5,10,20")
+    bench_parser.add_argument("--k", type=int, default=100)
+    bench_parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = perf_counter()
+        index = QuantizedIndex.build(args.index, args.kind)
+        print(f"Built {args.kind} codes for {len(index)} rows ({index.memory_bytes / 2**20:.1f} MB) in {perf_counter() - start:.1f}s")
+    else:
+        kinds = args.kind.split(",")
+        oversamples = [int(n) for n in args.oversample.split(",")]
+        for line in benchmark(args.index, kinds, oversamples, args.k, args.queries):
+            print(
+                f"{line['mode']:>24}  {line['memory_mb']:9.1f} MB  {line['qps']:8.1f} QPS  recall@{args.k}={line['recall']:.3f}"
+            )
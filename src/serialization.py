@@ -0,0 +1,262 @@
+import asyncio
+import gzip
+import json
+import time
+from collections import OrderedDict
+
+from starlette.responses import Response
+
+from src import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STORY_FIELDS = ("title", "url", "hn_id")
+# Event keys whose value is a list of stories
+STORY_LIST_KEYS = ("results", "stories")
+
+
+def dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+class StoryFragments:
+    """
+    Pre-encoded JSON of stories, without the closing brace so that the score of a result
+    can be appended, cached by `hn_id` (LRU).
+
+    Only used without orjson: orjson encodes a whole result list faster than Python can
+    join cached fragments, while the stdlib encoder is several times slower than both.
+    """
+
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self.fragments = OrderedDict()
+
+    def fragment(self, story: dict) -> bytes:
+        hn_id = story["hn_id"]
+        fragment = self.fragments.get(hn_id)
+        if fragment is None:
+            fragment = dumps({field: story[field] for field in STORY_FIELDS})[:-1]
+            self.fragments[hn_id] = fragment
+            if len(self.fragments) > self.max_entries:
+                self.fragments.popitem(last=False)
+        else:
+            self.fragments.move_to_end(hn_id)
+        return fragment
+
+    def encode(self, stories: list[dict]) -> bytes:
+        parts = []
+        for story in stories:
+            extra = story.keys() - STORY_FIELDS
+            if extra - {"score"}:
+                parts.append(dumps(story))
+            elif "score" in extra:
+                parts.append(self.fragment(story) + b',"score":' + repr(float(story["score"])).encode() + b"}")
+            else:
+                parts.append(self.fragment(story) + b"}")
+        return b"[" + b",".join(parts) + b"]"
+
+
+class SerializationStats:
+    """CPU time spent encoding (and compressing) the responses, per endpoint."""
+
+    def __init__(self):
+        self.endpoints = {}
+
+    def record(self, endpoint: str, seconds: float, size: int):
+        stats = self.endpoints.setdefault(endpoint, {"responses": 0, "cpu_seconds": 0.0, "bytes": 0})
+        stats["responses"] += 1
+        stats["cpu_seconds"] += seconds
+        stats["bytes"] += size
+
+    def as_dict(self) -> dict:
+        return {
+            "encoder": "orjson" if orjson is not None else "json",
+            "endpoints": {
+                endpoint: {
+                    **stats,
+                    "avg_cpu_ms": 1000 * stats["cpu_seconds"] / max(1, stats["responses"]),
+                }
+                for endpoint, stats in self.endpoints.items()
+            },
+        }
+
+
+class Serializer:
+    """
+    Encoding of the API payloads. CPU time is measured with `time.thread_time`: encoding
+    runs on the event loop thread, so other requests do not inflate it.
+    """
+
+    def __init__(self, fragments_size: int = 100000, compress_min_size: int = 1024):
+        self.fragments = StoryFragments(fragments_size) if orjson is None else None
+        self.compress_min_size = compress_min_size
+        self.stats = SerializationStats()
+
+    def _encode(self, payload: dict) -> bytes:
+        if self.fragments is None:
+            return dumps(payload)
+        parts = []
+        for key, value in payload.items():
+            if key in STORY_LIST_KEYS and isinstance(value, list):
+                encoded = self.fragments.encode(value)
+            else:
+                encoded = dumps(value)
+            parts.append(dumps(key) + b":" + encoded)
+        return b"{" + b",".join(parts) + b"}"
+
+    def encode(self, payload: dict, endpoint: str) -> bytes:
+        start = time.thread_time()
+        body = self._encode(payload)
+        self.stats.record(endpoint, time.thread_time() - start, len(body))
+        return body
+
+    def ndjson(self, payload: dict, endpoint: str) -> bytes:
+        return self.encode(payload, endpoint) + b"\n"
+
+    def sse(self, event: dict, endpoint: str) -> bytes:
+        return b"data: " + self.encode(event, endpoint) + b"\n\n"
+
+    async def _encoded(self, events, encode, timings: bool = False):
+        """
+        Encodes the events of a stream with their CPU time recorded as one `serialize` stage
+        (rather than one per event), just before the final `done` event. With `timings`, the
+        stage timings of the request, serialization included, are sent as a `timings` event
+        right before `done`.
+        """
+        cpu_seconds = 0.0
+        recorded = False
+        async for event in events:
+            if "done" in event and not recorded:
+                metrics.record("serialize", cpu_seconds)
+                recorded = True
+                request_timings = metrics.current_timings.get()
+                if timings and request_timings is not None:
+                    yield encode({"timings": request_timings.as_dict()}), event
+            start = time.thread_time()
+            data = encode(event)
+            cpu_seconds += time.thread_time() - start
+            yield data, event
+        if not recorded:
+            metrics.record("serialize", cpu_seconds)
+
+    async def ndjson_stream(self, events, endpoint: str):
+        """NDJSON lines of an event stream."""
+        async for line, _ in self._encoded(events, lambda event: self.ndjson(event, endpoint)):
+            yield line
+
+    async def sse_stream(self, events, endpoint: str, flush_interval: float = 0.02, timings: bool = False):
+        """Server-Sent Events of an event stream, with the token events batched."""
+
+        async def frames():
+            async for frame, event in self._encoded(events, lambda event: self.sse(event, endpoint), timings):
+                yield frame, "chunk" in event
+
+        if flush_interval <= 0:
+            async for frame, _ in frames():
+                yield frame
+            return
+        async for data in batch_frames(frames(), flush_interval):
+            yield data
+
+    def response(self, payload: dict, endpoint: str, accept_encoding: str = "", status_code: int = 200) -> Response:
+        """
+        JSON response compressed with brotli (if installed) or gzip when the client accepts
+        it and the body is large enough to be worth it.
+        """
+        start = time.thread_time()
+        body = self._encode(payload)
+        headers = {"Vary": "Accept-Encoding"}
+        encoding = negotiate_encoding(accept_encoding) if len(body) >= self.compress_min_size else None
+        if encoding == "br":
+            body = brotli.compress(body, quality=4)
+        elif encoding == "gzip":
+            body = gzip.compress(body, compresslevel=5)
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        seconds = time.thread_time() - start
+        self.stats.record(endpoint, seconds, len(body))
+        metrics.record("serialize", seconds)
+        return Response(body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+def negotiate_encoding(accept_encoding: str) -> str | None:
+    """Preferred supported encoding of an `Accept-Encoding` header (q=0 excludes one)."""
+    accepted = {}
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name] = quality
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+async def batch_frames(frames, flush_interval: float = 0.02, max_bytes: int = 16384):
+    """
+    Coalesce the `(frame, small)` pairs of a stream: small frames (e.g. LLM tokens) are
+    held for at most `flush_interval` seconds and sent together with the frames that
+    follow, any other frame flushes the buffer immediately.
+    Each yielded chunk is one write on the connection instead of one per token.
+    """
+    queue = asyncio.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async for frame in frames:
+                await queue.put(frame)
+        except Exception as e:
+            await queue.put(e)
+        await queue.put(done)
+
+    task = asyncio.create_task(pump())
+    buffer = []
+    size = 0
+    deadline = None
+    try:
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                frame = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield b"".join(buffer)
+                buffer, size, deadline = [], 0, None
+                continue
+            if frame is done:
+                break
+            if isinstance(frame, Exception):
+                raise frame
+            frame, small = frame
+            buffer.append(frame)
+            size += len(frame)
+            if small and size < max_bytes:
+                if deadline is None:
+                    deadline = time.monotonic() + flush_interval
+                continue
+            yield b"".join(buffer)
+            buffer, size, deadline = [], 0, None
+        if buffer:
+            yield b"".join(buffer)
+    finally:
+        if not task.done():
+            task.cancel()
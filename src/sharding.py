@@ -0,0 +1,138 @@
+import os
+import heapq
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter
+
+import numpy as np
+
+from src.local_index import ExactIndex, read_meta, normalize_rows
+from src.ann import sample_queries
+
+
+# Per-process cache of the shards opened by a worker
+_shards: dict[int, ExactIndex] = {}
+_worker_config: dict = {}
+
+
+def shard_ranges(count: int, n_shards: int) -> list[tuple[int, int]]:
+    """Split `count` rows into `n_shards` contiguous ranges of (almost) equal size."""
+    bounds = np.linspace(0, count, max(1, n_shards) + 1).astype(np.int64)
+    return [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
+def _init_worker(path: str, block_size: int):
+    _worker_config.update(path=path, block_size=block_size)
+
+
+def _open_shard(shard_id: int, start: int, stop: int) -> ExactIndex:
+    # Each shard is a memory-mapped window on the shared `vectors.bin`: the OS page cache
+    # holds one copy of the data for all the workers
+    index = _shards.get(shard_id)
+    if index is None:
+        path = _worker_config["path"]
+        meta = read_meta(path)
+        dtype = np.dtype(meta["dtype"])
+        vectors = np.memmap(
+            os.path.join(path, "vectors.bin"),
+            dtype=dtype,
+            mode="r",
+            offset=start * meta["dim"] * dtype.itemsize,
+            shape=(stop - start, meta["dim"]),
+        )
+        index = _shards[shard_id] = ExactIndex(vectors, block_size=_worker_config["block_size"])
+    return index
+
+
+def _search_shard(shard_id: int, start: int, stop: int, queries: np.ndarray, k: int):
+    ids, scores = _open_shard(shard_id, start, stop).search(queries, k)
+    return ids + start, scores
+
+
+class ShardedIndex:
+    """
+    Exact search scattered over `n_shards` row ranges of the local index, served by a pool
+    of `n_workers` processes, so scoring is not limited to one core by the GIL.
+    The per-shard top-k lists are merged with a heap.
+    """
+
+    def __init__(self, path: str, n_shards: int = 4, n_workers: int | None = None, block_size: int = 65536):
+        meta = read_meta(path)
+        if meta is None:
+            raise FileNotFoundError(f"No local index found in {path}")
+        self.count = meta["count"]
+        self.ranges = shard_ranges(self.count, n_shards)
+        self.pool = ProcessPoolExecutor(
+            max_workers=n_workers or len(self.ranges),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(path, block_size),
+        )
+
+    def __len__(self):
+        return self.count
+
+    def search(self, queries, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Same contract as `ExactIndex.search`, rows are padded with id -1 and score -inf."""
+        queries = normalize_rows(queries)
+        futures = [
+            self.pool.submit(_search_shard, shard_id, start, stop, queries, k)
+            for shard_id, (start, stop) in enumerate(self.ranges)
+        ]
+        partials = [future.result() for future in futures]
+        result_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        result_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for row in range(len(queries)):
+            # Each shard list is already sorted: a k-way heap merge keeps the global top-k
+            merged = heapq.merge(
+                *(zip(scores[row].tolist(), ids[row].tolist()) for ids, scores in partials),
+                key=lambda hit: -hit[0],
+            )
+            for col, (score, i) in enumerate(itertools.islice(merged, k)):
+                result_ids[row, col] = i
+                result_scores[row, col] = score
+        return result_ids, result_scores
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+def scaling_benchmark(path: str, n_shards: int, workers: list[int], k: int = 100, n_queries: int = 100) -> list[dict]:
+    """Latency of single queries and throughput of concurrent queries for each worker count."""
+    queries = sample_queries(ExactIndex.load(path).vectors, min(n_queries, read_meta(path)["count"]))
+    report = []
+    for n_workers in workers:
+        index = ShardedIndex(path, n_shards=n_shards, n_workers=n_workers)
+        try:
+            index.search(queries[:1], k)  # Spawn the workers and open the shards
+            start = perf_counter()
+            for query in queries:
+                index.search(query[None, :], k)
+            latency_ms = 1000 * (perf_counter() - start) / len(queries)
+            start = perf_counter()
+            with ThreadPoolExecutor(max_workers=n_workers) as clients:
+                list(clients.map(lambda query: index.search(query[None, :], k), queries))
+            qps = len(queries) / (perf_counter() - start)
+        finally:
+            index.close()
+        report.append({"workers": n_workers, "shards": n_shards, "ms_per_query": latency_ms, "qps": qps})
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scaling benchmark of the sharded local index")
+    parser.add_argument("--index", default=os.getenv("LOCAL_INDEX_PATH", "index"))
+    parser.add_argument("--shards", type=int, default=os.cpu_count())
+    parser.add_argument("--workers", default=None, help="Comma separated worker counts (default: 1, 2, 4... up to the CPU count)")
+    parser.add_argument("--k", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.workers:
+        workers = [int(n) for n in args.workers.split(",")]
+    else:
+        workers = [2**i for i in range(int(np.log2(os.cpu_count() or 1)) + 1)]
+    for line in scaling_benchmark(args.index, args.shards, workers, args.k, args.queries):
+        print(f"{line['workers']:3d} workers / {line['shards']} shards  {line['ms_per_query']:8.2f} ms/query  {line['qps']:8.1f} QPS")
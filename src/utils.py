@@ -1,9 +1,13 @@
-from time import time
+from time import time, sleep
 from abc import ABC, abstractmethod
+from contextlib import nullcontext
 from pydantic import BaseModel, Field
 from itertools import zip_longest
 from langchain_core.runnables import Runnable
 from langchain_core.embeddings import Embeddings
+import importlib.util
+import asyncio
+import random
 import httpx
 import os
 
@@ -11,13 +15,45 @@ import os
 class Request(BaseModel):
     user_input: str = Field(description="User's input")
     k: int = Field(default=500, description="Number of results to return")
+    stream: bool = Field(
+        default=False,
+        description="Stream the results of /search as NDJSON, the first page first",
+    )
+    page_size: int | None = Field(
+        default=None,
+        ge=1,
+        le=1000,
+        description="Return only the first page and a cursor for the next ones (/results/{cursor})",
+    )
+
+
+class BatchRequest(BaseModel):
+    items: list[Request] = Field(description="Searches to run, one per user bio")
 
 
 class CustomHFEmbeddings(Embeddings):
     """
     Custom class to handle the embeddings from the Hugging Face Hub API.
+
+    The async methods reuse a single long-lived `httpx.AsyncClient` (see `make_http_client`),
+    so the TCP/TLS connection to the endpoint is kept alive between queries.
+    Failed calls (network errors, 429 and 5xx) are retried with jittered exponential backoff.
+    With a circuit breaker, the async calls fail fast while the endpoint is down, and with
+    a concurrency limiter they wait for a slot (inside which each call is retried).
     """
-    def __init__(self, endpoint_url):
+
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+    def __init__(
+        self,
+        endpoint_url,
+        client: httpx.AsyncClient | None = None,
+        retries: int = 3,
+        backoff: float = 0.2,
+        timeout: float = 10.0,
+        breaker=None,
+        limiter=None,
+    ):
         super().__init__()
         self.endpoint_url = endpoint_url
         self.headers = {
@@ -25,18 +61,127 @@ class CustomHFEmbeddings(Embeddings):
             "Authorization": f"Bearer {os.getenv('HUGGINGFACEHUB_API_KEY')}",
             "Content-Type": "application/json"
         }
+        self.client = client
+        self.sync_client = httpx.Client(timeout=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker
+        self.limiter = limiter
+
+    def _should_retry(self, error: Exception, attempt: int) -> bool:
+        if attempt >= self.retries:
+            return False
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in self.RETRY_STATUS_CODES
+        return isinstance(error, httpx.TransportError)
+
+    def _backoff_delay(self, attempt: int) -> float:
+        # "Full jitter": spreads the retries of concurrent callers over the whole window
+        return random.uniform(0, self.backoff * 2**attempt)
 
     def inference(self, payload):
-        response = httpx.post(self.endpoint_url, headers=self.headers, json=payload)
+        attempt = 0
+        while True:
+            try:
+                response = self.sync_client.post(
+                    self.endpoint_url, headers=self.headers, json=payload
+                )
+                response.raise_for_status()
+                return response.json()
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                sleep(self._backoff_delay(attempt))
+                attempt += 1
+
+    async def ainference(self, payload):
+        if self.client is None:
+            raise RuntimeError("No async client configured for the embedder")
+        async with self.limiter.slot() if self.limiter is not None else nullcontext():
+            with self.breaker if self.breaker is not None else nullcontext():
+                return await self._ainference(payload)
+
+    async def _ainference(self, payload):
+        attempt = 0
+        while True:
+            try:
+                response = await self.client.post(
+                    self.endpoint_url, headers=self.headers, json=payload
+                )
+                response.raise_for_status()
+                return response.json()
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                await asyncio.sleep(self._backoff_delay(attempt))
+                attempt += 1
+
+    async def ahealth_check(self) -> bool:
+        """Embeds a short text once, bypassing the retries and the circuit breaker."""
+        response = await self.client.post(
+            self.endpoint_url, headers=self.headers, json={"inputs": "health check", "parameters": {}}
+        )
         response.raise_for_status()
-        return response.json()
+        return True
+
+    @staticmethod
+    def _check_batch(texts, output):
+        if not isinstance(output, list) or len(output) != len(texts):
+            raise ValueError(
+                f"Embedder returned {len(output) if isinstance(output, list) else 0} vectors for {len(texts)} inputs"
+            )
+        return output
 
     def embed_query(self, text):
         output = self.inference({"inputs": text, "parameters": {}})
         return output[0] if output else None
 
     def embed_documents(self, texts):
-        return [self.embed_query(text) for text in texts]
+        if not texts:
+            return []
+        output = self.inference({"inputs": list(texts), "parameters": {}})
+        return self._check_batch(texts, output)
+
+    async def aembed_query(self, text):
+        output = await self.ainference({"inputs": text, "parameters": {}})
+        return output[0] if output else None
+
+    async def aembed_documents(self, texts):
+        if not texts:
+            return []
+        output = await self.ainference({"inputs": list(texts), "parameters": {}})
+        return self._check_batch(texts, output)
+
+    async def aclose(self):
+        self.sync_client.close()
+        if self.client is not None:
+            await self.client.aclose()
+
+
+def make_http_client(
+    http2: bool = False,
+    max_connections: int = 100,
+    max_keepalive_connections: int = 20,
+    keepalive_expiry: float = 30.0,
+    timeout: float = 10.0,
+    connect_timeout: float = 5.0,
+) -> httpx.AsyncClient:
+    """
+    Create a pooled `httpx.AsyncClient` meant to live for the whole application lifespan.
+    HTTP/2 is only enabled if the optional `h2` package is installed.
+    """
+    if http2 and importlib.util.find_spec("h2") is None:
+        print("HTTP/2 requested but the 'h2' package is not installed, using HTTP/1.1")
+        http2 = False
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(timeout, connect=connect_timeout),
+    )
 
 
 class StdOutHandler:
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The tests import the service modules as `src.*`, like `uvicorn src.main:app`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.local_index import IndexWriter, normalize_rows
+
+
+@pytest.fixture(scope="session")
+def vector_index(tmp_path_factory):
+    """Local index of 4000 clustered vectors (like topics of stories), without metadata store."""
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((40, 32)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), 4000)] + rng.normal(0, 0.4, (4000, 32)).astype(np.float32)
+    path = str(tmp_path_factory.mktemp("vector_index"))
+    writer = IndexWriter(path, dtype="float32")
+    writer.add(normalize_rows(vectors), [{"title": f"story {i}", "url": "", "hn_id": i} for i in range(len(vectors))])
+    writer.close()
+    return path
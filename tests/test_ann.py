@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from src.ann import IVFIndex, recall_at_k, sample_queries
+from src.local_index import ExactIndex
+
+
+@pytest.fixture(scope="module")
+def ivf(vector_index):
+    IVFIndex.build(vector_index, nlist=64)
+    return IVFIndex.load(vector_index, nprobe=8)
+
+
+def test_ivf_recall(vector_index, ivf):
+    exact = ExactIndex.load(vector_index)
+    queries = sample_queries(exact.vectors, 50)
+    truth, _ = exact.search(queries, 10)
+    assert recall_at_k(truth, ivf.search(queries, 10)[0]) >= 0.9
+    # Probing every list is an exact search
+    ids, scores = ivf.search(queries, 10, nprobe=64)
+    assert recall_at_k(truth, ids) == 1.0
+    assert np.all(np.diff(scores, axis=1) <= 0)
+
+
+def test_ivf_pads_short_lists(ivf):
+    ids, scores = ivf.search(sample_queries(ivf.vectors, 5), len(ivf), nprobe=1)
+    assert np.all((ids >= 0) == np.isfinite(scores))
+    assert np.all((ids < 0).any(axis=1))
@@ -0,0 +1,29 @@
+import asyncio
+
+import numpy as np
+
+from src.backends import LocalBackend
+from src.local_index import IndexWriter, normalize_rows
+
+
+def build_backend(path, n=500, dim=16):
+    vectors = normalize_rows(np.random.default_rng(0).standard_normal((n, dim)).astype(np.float32))
+    writer = IndexWriter(str(path), dtype="float32")
+    writer.add(vectors, [{"title": f"story {i}", "url": "", "hn_id": i} for i in range(n)])
+    writer.close()
+    return LocalBackend.load(str(path)), vectors
+
+
+def test_search_skips_deleted_stories(tmp_path):
+    backend, vectors = build_backend(tmp_path)
+    query = vectors[:1]
+    ranking = np.argsort(-(vectors @ query[0]), kind="stable")
+    # Tombstones of most of the top results, and of many stories the query does not reach
+    deleted = ranking[:45].tolist() + ranking[-200:].tolist()
+
+    async def run():
+        await backend.delete(deleted)
+        return await backend.search(["query"], query, 10)
+
+    hits = asyncio.run(run())[0]
+    assert [story["hn_id"] for story, _ in hits] == ranking[45:55].tolist()
@@ -0,0 +1,71 @@
+import json
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("EMBEDDER_ENDPOINT_URL", "http://127.0.0.1:9/")
+
+from src import main
+from src.cache import ResultCache
+
+BIOS = ["I like the world of AI research", "Rust and databases", "Gardening, hiking and film photography"]
+
+
+class FakeEmbedder:
+    def __init__(self):
+        self.texts = 0
+
+    async def aembed_documents(self, texts):
+        self.texts += len(texts)
+        return [[float(len(text))] for text in texts]
+
+
+class FakeBackend:
+    async def search(self, queries, vectors, k, offset=0):
+        results = []
+        for vector in vectors:
+            ranking = sorted(range(300), key=lambda i: (i * int(vector[0])) % 307)
+            stories = [{"title": f"story {i}", "url": "", "hn_id": i} for i in ranking]
+            results.append([(story, 1.0 / (1 + rank)) for rank, story in enumerate(stories)][offset : offset + k])
+        return results
+
+
+@pytest.fixture
+def embedder(monkeypatch):
+    embedder = FakeEmbedder()
+    monkeypatch.setattr(main, "backend", FakeBackend())
+    monkeypatch.setattr(main, "embedder", embedder)
+    monkeypatch.setattr(main, "result_cache", ResultCache(ttl=300))
+    return embedder
+
+
+def search_batch(client, items):
+    response = client.post("/search_batch", json={"items": items})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[-1]["done"] and lines[-1]["items"] == len(items)
+    return {line["index"]: line for line in lines[:-1]}
+
+
+def test_batch_results_match_search(embedder):
+    # Without the lifespan: no dependency is started
+    client = TestClient(main.app)
+    items = [{"user_input": bio, "k": k} for bio, k in zip(BIOS, [10, 50, 5])] + [{"user_input": "", "k": 10}]
+    results = search_batch(client, items)
+    assert results[3] == {"index": 3, "error": "Missing query"}
+    main.result_cache = ResultCache(ttl=0)
+    for index, item in enumerate(items[:3]):
+        assert results[index]["results"] == client.post("/search", json=item).json()["results"]
+
+
+def test_batch_results_are_cached(embedder):
+    client = TestClient(main.app)
+    items = [{"user_input": bio, "k": 10} for bio in BIOS]
+    first = search_batch(client, items)
+    texts = embedder.texts
+    assert search_batch(client, items) == first
+    assert embedder.texts == texts
+    # Shared with /search
+    assert client.post("/search", json=items[0]).json()["results"] == first[0]["results"]
+    assert embedder.texts == texts
@@ -0,0 +1,84 @@
+import asyncio
+
+import numpy as np
+
+from src.cache import CachedEmbeddings, DiskTier, EmbeddingCache, ResultCache
+
+
+class FakeEmbedder:
+    def __init__(self):
+        self.calls = 0
+
+    async def aembed_documents(self, texts):
+        self.calls += 1
+        return [[float(len(text)), 1.0, -1.0] for text in texts]
+
+    async def aclose(self):
+        pass
+
+
+def embed_all(cache: EmbeddingCache, texts: list[str]) -> FakeEmbedder:
+    embedder = FakeEmbedder()
+
+    async def run():
+        cached = CachedEmbeddings(embedder, cache)
+        for text in texts:
+            await cached.aembed_documents([text])
+        await cached.aclose()
+
+    asyncio.run(run())
+    return embedder
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    embed_all(EmbeddingCache("model", disk_path=str(tmp_path), disk_capacity=10), ["rust", "databases"])
+
+    cache = EmbeddingCache("model", disk_path=str(tmp_path), disk_capacity=10)
+    assert len(cache.disk) == 2
+    np.testing.assert_array_equal(cache.get("rust"), [4.0, 1.0, -1.0])
+    assert cache.disk_hits == 1
+    # Keys include the model id
+    assert EmbeddingCache("other-model", disk_path=str(tmp_path), disk_capacity=10).get("rust") is None
+
+
+def test_disk_tier_evicts_the_oldest_entries(tmp_path):
+    texts = [f"query {i}" for i in range(6)]
+    embed_all(EmbeddingCache("model", disk_path=str(tmp_path), disk_capacity=4), texts)
+
+    cache = EmbeddingCache("model", disk_path=str(tmp_path), disk_capacity=4)
+    assert len(cache.disk) == 4
+    assert cache.get("query 0") is None and cache.get("query 1") is None
+    assert all(cache.get(text) is not None for text in texts[2:])
+
+
+def test_default_dtypes_match(tmp_path):
+    # A cache warmed with the defaults must be readable by the server with its defaults
+    embed_all(EmbeddingCache("model", disk_path=str(tmp_path), disk_capacity=10), ["rust"])
+    assert DiskTier(str(tmp_path), 10).dtype == np.float32
+    assert len(DiskTier(str(tmp_path), 10)) == 1
+
+
+def test_dtype_mismatch_starts_empty(tmp_path):
+    embed_all(EmbeddingCache("model", dtype="float16", disk_path=str(tmp_path), disk_capacity=10), ["rust"])
+
+    assert len(DiskTier(str(tmp_path), 10, dtype="float16")) == 1
+    assert len(DiskTier(str(tmp_path), 10, dtype="float32")) == 0
+
+
+def test_hits_skip_the_embedder(tmp_path):
+    cache = EmbeddingCache("model", disk_path=str(tmp_path), disk_capacity=10)
+    embedder = embed_all(cache, ["rust", " rust ", "rust"])
+    assert embedder.calls == 1
+    assert cache.hits == 2
+
+
+def test_expired_results_are_kept_for_the_stale_fallback():
+    cache = ResultCache(ttl=60)
+    cache.put("search", "rust ", 10, ["a", "b"])
+    assert cache.get("search", "rust", 5) == (10, ["a", "b"])
+    key, (expiry, k, value) = next(iter(cache.entries.items()))
+    cache.entries[key] = (expiry - 61, k, value)
+    assert cache.get("search", "rust", 10) is None
+    # One lookup: the expired entry is still there, counted as a single miss
+    assert cache.lookup("search", "rust", 10) == (10, ["a", "b"], True)
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
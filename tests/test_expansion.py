@@ -0,0 +1,65 @@
+import asyncio
+
+from langchain_core.messages import AIMessageChunk
+
+from src.expansion import LocalExpander, RacingExpander
+from src.health import CircuitBreaker
+
+BIO = "I write Rust compilers and tune Postgres databases"
+
+
+class FakeLLM:
+    def __init__(self, chunks, error=None, stall_after=None):
+        self.chunks = chunks
+        self.error = error
+        self.stall_after = stall_after
+        self.calls = 0
+
+    async def astream(self, input):
+        self.calls += 1
+        for i, chunk in enumerate(self.chunks):
+            if i == self.stall_after:
+                await asyncio.sleep(10)
+            yield AIMessageChunk(content=chunk)
+        if self.error is not None:
+            raise self.error
+
+
+def expand(expander: RacingExpander) -> str:
+    async def run():
+        return "".join([chunk.content async for chunk in expander.astream({"input": BIO})])
+
+    return asyncio.run(run())
+
+
+def racing(llm, breaker):
+    return RacingExpander(llm, LocalExpander(None), deadline=0.5, chunk_timeout=0.05, breaker=breaker)
+
+
+def test_llm_errors_open_the_circuit():
+    breaker = CircuitBreaker("llm", failure_threshold=2)
+    llm = FakeLLM([], error=RuntimeError("down"))
+    expander = racing(llm, breaker)
+    local = expand(racing(FakeLLM([]), None))
+    for _ in range(2):
+        assert expand(expander) == local
+    assert breaker.state == "open" and expander.fallbacks == 2
+    # While the circuit is open the LLM is not called
+    assert expand(expander) == local
+    assert llm.calls == 2 and expander.fallbacks == 3
+
+
+def test_stalled_llm_is_completed_locally():
+    breaker = CircuitBreaker("llm", failure_threshold=1)
+    expander = racing(FakeLLM(["rust compiler\n", "post", "gres"], stall_after=2), breaker)
+    lines = expand(expander).split("\n")
+    assert lines[:2] == ["rust compiler", "post"] and len(lines) > 2
+    assert expander.interruptions == 1 and breaker.state == "open"
+
+
+def test_llm_success_closes_the_circuit():
+    breaker = CircuitBreaker("llm", failure_threshold=5)
+    breaker.failures = 3
+    expander = racing(FakeLLM(["rust\n", "postgres"]), breaker)
+    assert expand(expander) == "rust\npostgres"
+    assert breaker.failures == 0 and expander.stats() == {"fallbacks": 0, "interruptions": 0}
@@ -0,0 +1,128 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("EMBEDDER_ENDPOINT_URL", "http://127.0.0.1:9/")
+
+from src import main
+from src.cache import ResultCache
+from src.health import CircuitBreaker, CircuitOpenError, HealthMonitor
+
+
+def fail(breaker: CircuitBreaker, error: Exception):
+    with pytest.raises(type(error)):
+        with breaker:
+            raise error
+
+
+def http_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://embedder")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("embedder", failure_threshold=3, reset_timeout=30)
+    for _ in range(3):
+        fail(breaker, httpx.ConnectError("connection refused\nmore details"))
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError) as error:
+        with breaker:
+            pass
+    # Short error name, not the multi-line message
+    assert "ConnectError" in str(error.value) and "\n" not in str(error.value)
+
+
+def test_half_open_trial():
+    breaker = CircuitBreaker("embedder", failure_threshold=1, reset_timeout=30)
+    fail(breaker, RuntimeError("down"))
+    breaker.opened_at -= 31
+    assert breaker.state == "half_open"
+    with breaker:
+        # Only one trial call at a time
+        assert breaker.is_open
+    assert breaker.state == "closed"
+
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker("embedder", failure_threshold=5, reset_timeout=30)
+    breaker.trip("down")
+    breaker.opened_at -= 31
+    fail(breaker, RuntimeError("still down"))
+    assert breaker.state == "open"
+
+
+def test_client_errors_are_not_failures():
+    breaker = CircuitBreaker("embedder", failure_threshold=2)
+    for _ in range(3):
+        fail(breaker, http_error(400))
+    assert breaker.state == "closed" and breaker.failures == 0
+    for _ in range(2):
+        fail(breaker, http_error(429))
+    assert breaker.state == "open"
+
+
+def test_open_circuit_is_probed_after_a_recent_success():
+    breaker = CircuitBreaker("embedder", failure_threshold=2, reset_timeout=30)
+    healthy = False
+
+    async def probe():
+        return healthy
+
+    monitor = HealthMonitor({"embedder": breaker}, {"embedder": probe}, interval=10)
+    breaker.record_success()
+    for _ in range(2):
+        fail(breaker, RuntimeError("down"))
+    asyncio.run(monitor.check_all())
+    assert not monitor.is_ready("embedder")
+    healthy = True
+    asyncio.run(monitor.check_all())
+    assert monitor.is_ready("embedder")
+
+
+def test_closed_circuit_with_traffic_is_not_probed():
+    breaker = CircuitBreaker("embedder")
+    probes = []
+
+    async def probe():
+        probes.append(1)
+        return True
+
+    breaker.record_success()
+    asyncio.run(HealthMonitor({"embedder": breaker}, {"embedder": probe}, interval=10).check_all())
+    assert probes == []
+
+
+def test_probe_timeout_opens_the_circuit():
+    breaker = CircuitBreaker("vector_db")
+
+    async def probe():
+        await asyncio.sleep(1)
+
+    monitor = HealthMonitor({"vector_db": breaker}, {"vector_db": probe}, timeout=0.01)
+    asyncio.run(monitor.check_all())
+    assert breaker.state == "open"
+
+
+def test_open_circuit_serves_stale_results(monkeypatch):
+    cache = ResultCache(ttl=60)
+    monkeypatch.setattr(main, "result_cache", cache)
+    breaker = CircuitBreaker("vector_db")
+    breaker.trip("down")
+    monkeypatch.setitem(main.breakers, "vector_db", breaker)
+    # Without the lifespan: no dependency is started
+    client = TestClient(main.app)
+
+    stories = [{"title": f"story {i}", "url": "", "hn_id": i} for i in range(3)]
+    cache.put("search", "rust", 3, stories)
+    key, (expiry, k, value) = next(iter(cache.entries.items()))
+    cache.entries[key] = (expiry - 61, k, value)
+    response = client.post("/search", json={"user_input": "rust", "k": 2})
+    assert response.status_code == 200
+    assert response.json()["results"] == stories[:2]
+
+    response = client.post("/search", json={"user_input": "databases", "k": 2})
+    assert response.status_code == 503
+    assert "vector_db" in response.json()["error"]
@@ -0,0 +1,141 @@
+import asyncio
+import csv
+import os
+
+import pytest
+
+from src.ingest import Checkpoint, CsvSource, LocalSink, StoryFilter, ingest
+from src.local_index import ExactIndex
+from src.metadata import MetadataStore, MetadataWriter
+
+FIELDS = ["id", "title", "url", "score", "time", "comments", "author"]
+
+
+def write_dump(path, n_rows: int):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, FIELDS)
+        writer.writeheader()
+        for i in range(1, n_rows + 1):
+            writer.writerow(
+                {
+                    "id": i,
+                    "title": f"Story {i}",
+                    # Every 7th row has a plain http url, every 11th a duplicated url
+                    "url": f"http://example.com/{i}" if i % 7 == 0 else f"https://example.com/{i - (i % 11 == 0)}",
+                    "score": 1 + i % 5,
+                    "time": 1700000000 + i,
+                    "comments": 0,
+                    "author": "pg",
+                }
+            )
+
+
+class FakeEmbedder:
+    def __init__(self, fail_after: int | None = None):
+        self.fail_after = fail_after
+        self.calls = 0
+
+    async def aembed_documents(self, texts):
+        self.calls += 1
+        if self.fail_after is not None and self.calls > self.fail_after:
+            raise RuntimeError("embedder went away")
+        return [[float(text.split()[-1]), 1.0, 0.0, 0.0] for text in texts]
+
+
+def run_ingest(csv_path, index_path, embedder):
+    async def run():
+        sink = LocalSink(index_path, dtype="float32")
+        metadata = MetadataWriter(os.path.join(index_path, "metadata"), columns=("points", "time"))
+        try:
+            await ingest(
+                CsvSource(csv_path),
+                sink,
+                embedder,
+                Checkpoint(os.path.join(index_path, "checkpoint.json")),
+                batch_size=4,
+                concurrency=2,
+                report_interval=1000,
+                metadata=metadata,
+            )
+        finally:
+            metadata.close()
+            await sink.close()
+
+    asyncio.run(run())
+
+
+def indexed_ids(index_path) -> list[int]:
+    store = MetadataStore.load(os.path.join(index_path, "metadata"))
+    assert len(ExactIndex.load(index_path)) == len(store)
+    return [store[row]["hn_id"] for row in range(len(store))]
+
+
+def test_filters():
+    story_filter = StoryFilter()
+    row = {"id": "1", "title": "Show HN", "url": "https://a.com", "score": "3", "time": "10", "comments": "0", "author": "x"}
+    assert story_filter(row) == {"title": "Show HN", "url": "https://a.com", "hn_id": 1, "points": 3, "time": 10}
+    assert story_filter({**row, "id": "2"}) is None  # Duplicated url
+    assert story_filter({**row, "url": "http://b.com"}) is None
+    assert story_filter({**row, "url": "https://c.com", "score": "0"}) is None
+    assert story_filter({**row, "url": "https://d.com", "author": ""}) is None
+
+
+def test_resume_after_a_failure(tmp_path):
+    csv_path = tmp_path / "story.csv"
+    write_dump(csv_path, 100)
+    expected_path = str(tmp_path / "expected")
+    run_ingest(csv_path, expected_path, FakeEmbedder())
+    expected = indexed_ids(expected_path)
+
+    index_path = str(tmp_path / "index")
+    with pytest.raises(RuntimeError):
+        # Windows are 8 stories (2 batches of 4): the third window fails
+        run_ingest(csv_path, index_path, FakeEmbedder(fail_after=5))
+    checkpoint = Checkpoint(os.path.join(index_path, "checkpoint.json")).load()
+    assert 0 < checkpoint["written"] < len(expected)
+
+    embedder = FakeEmbedder()
+    run_ingest(csv_path, index_path, embedder)
+    assert indexed_ids(index_path) == expected
+    # Only the stories after the checkpoint were embedded again
+    assert embedder.calls == -(-(len(expected) - checkpoint["written"]) // 4)
+
+
+class SlowSink:
+    def __init__(self):
+        self.written = 0
+        self.closed = False
+
+    async def resume(self, written):
+        self.written = written
+
+    async def write(self, vectors, stories):
+        await asyncio.sleep(0.05)
+        if self.closed:
+            raise ValueError("write to closed sink")
+        self.written += len(stories)
+
+    async def commit(self):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+
+def test_embed_failure_waits_for_the_write_in_flight(tmp_path):
+    csv_path = tmp_path / "story.csv"
+    write_dump(csv_path, 100)
+    sink = SlowSink()
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"))
+
+    async def run():
+        try:
+            # The first window is being written when the second one fails to embed
+            await ingest(CsvSource(csv_path), sink, FakeEmbedder(fail_after=2), checkpoint, batch_size=4, concurrency=2)
+        finally:
+            await sink.close()
+
+    with pytest.raises(RuntimeError, match="embedder went away"):
+        asyncio.run(run())
+    assert sink.written == 8
+    assert checkpoint.load()["written"] == 8
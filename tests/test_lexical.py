@@ -0,0 +1,130 @@
+import asyncio
+import json
+import math
+import os
+import random
+from collections import Counter
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("EMBEDDER_ENDPOINT_URL", "http://127.0.0.1:9/")
+
+from src import main
+from src.cache import ResultCache
+from src.expansion import STOPWORDS, tokenize
+from src.lexical import LexicalIndex, build_lexical_index, decode_varints, encode_varints
+from src.metadata import MetadataStore, MetadataWriter
+
+WORDS = ["rust", "python", "compiler", "database", "gpu", "kernel", "startup", "crispr", "llm", "sqlite"]
+
+
+@pytest.fixture(scope="module")
+def titles():
+    rng = random.Random(0)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(2, 7))).capitalize() for _ in range(2000)]
+
+
+@pytest.fixture(scope="module")
+def index(titles, tmp_path_factory):
+    path = tmp_path_factory.mktemp("index")
+    writer = MetadataWriter(str(path / "metadata"))
+    writer.add([{"title": title, "url": f"https://example.com/{i}", "hn_id": i} for i, title in enumerate(titles)])
+    writer.close()
+    store = MetadataStore.load(str(path / "metadata"))
+    meta = build_lexical_index(store.titles(), str(path / "lexical"))
+    assert meta["documents"] == len(titles)
+    return LexicalIndex(str(path / "lexical"), store)
+
+
+def brute_force_bm25(titles, query, k1=1.2, b=0.75):
+    docs = [Counter(tokenize(title)) for title in titles]
+    lengths = [sum(doc.values()) for doc in docs]
+    avg_length = sum(lengths) / len(lengths)
+    scores = np.zeros(len(docs))
+    for term in dict.fromkeys(t for t in tokenize(query) if t not in STOPWORDS):
+        df = sum(term in doc for doc in docs)
+        if not df:
+            continue
+        idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+        for i, doc in enumerate(docs):
+            tf = doc[term]
+            if tf:
+                scores[i] += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[i] / avg_length))
+    return scores
+
+
+def test_varint_round_trip():
+    values = np.array([0, 1, 127, 128, 300, 16383, 16384, 2**31, 2**35 + 7], dtype=np.int64)
+    encoded = encode_varints(values)
+    assert len(encoded) == 1 + 1 + 1 + 2 + 2 + 2 + 3 + 5 + 6
+    np.testing.assert_array_equal(decode_varints(encoded), values)
+    assert len(decode_varints(encode_varints(np.array([], dtype=np.int64)))) == 0
+
+
+@pytest.mark.parametrize("query", ["rust", "rust compiler", "the gpu kernel for llm", "unknown words"])
+def test_bm25_matches_brute_force(index, titles, query):
+    expected = brute_force_bm25(titles, query)
+    rows, scores = index.search_rows(query, 20)
+    assert len(rows) == min(20, int((expected > 0).sum()))
+    np.testing.assert_allclose(scores, expected[rows], rtol=1e-4)
+    # Same scores as the true top 20 (ties may be ordered differently)
+    np.testing.assert_allclose(scores, np.sort(expected)[::-1][: len(rows)], rtol=1e-4)
+
+
+def test_pages_and_excluded_rows(index):
+    rows, _ = index.search_rows("sqlite database", 30)
+    pages = index.search("sqlite database", 10, 10)
+    assert [story["hn_id"] for story, _ in pages] == rows[10:20].tolist()
+    excluded = set(rows[:5].tolist())
+    remaining, _ = index.search_rows("sqlite database", 25, exclude=excluded)
+    assert remaining.tolist() == rows[5:30].tolist()
+
+
+def test_keyword_queries(index):
+    assert index.is_keyword_query("Rust", 2)
+    assert index.is_keyword_query("the crispr startup", 2)
+    assert not index.is_keyword_query("rust compiler database", 2)
+    assert not index.is_keyword_query("rust haskell", 2)
+    assert index.max_df("rust haskell") == index.df[index.vocabulary["rust"]]
+
+
+def test_fast_path_pages_come_from_one_ranking(index, monkeypatch):
+    class NoEmbedder:
+        async def aembed_documents(self, texts):
+            raise AssertionError("keyword queries skip the embedder")
+
+    monkeypatch.setattr(main, "lexical_index", index)
+    monkeypatch.setattr(main, "embedder", NoEmbedder())
+    monkeypatch.setattr(main, "LEXICAL_FAST_PATH_TERMS", 2)
+
+    async def run():
+        whole = await main.search_stories("rust", 60)
+        pages = []
+        for offset in range(0, 60, 20):
+            pages += await main.search_stories("rust", 20, offset, total=60)
+        return whole, pages
+
+    whole, pages = asyncio.run(run())
+    assert len(whole) == 60
+    assert [story["hn_id"] for story in pages] == [story["hn_id"] for story in whole]
+
+
+def test_batch_uses_the_search_mode_of_search(index, monkeypatch):
+    class NoVectorSearch:
+        async def search(self, queries, vectors, k, offset=0):
+            raise AssertionError("keyword queries skip the vector search")
+
+    monkeypatch.setattr(main, "lexical_index", index)
+    monkeypatch.setattr(main, "backend", NoVectorSearch())
+    monkeypatch.setattr(main, "result_cache", ResultCache(ttl=0))
+    monkeypatch.setattr(main, "LEXICAL_FAST_PATH_TERMS", 2)
+    # Without the lifespan: no dependency is started
+    client = TestClient(main.app)
+
+    response = client.post("/search_batch", json={"items": [{"user_input": "rust", "k": 10}]})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[-1]["done"]
+    search = client.post("/search", json={"user_input": "rust", "k": 10}).json()
+    assert lines[0]["results"] == search["results"]
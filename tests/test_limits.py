@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from src.limits import PRIORITY_BACKGROUND, PRIORITY_LLM, PRIORITY_SEARCH, ConcurrencyLimiter, OverloadedError
+
+
+async def hold(limiter: ConcurrencyLimiter, priority: int, order: list, release: asyncio.Event, name: str):
+    async with limiter.slot(priority):
+        order.append(name)
+        await release.wait()
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_waiters_are_served_by_priority():
+    async def run():
+        limiter = ConcurrencyLimiter("vector_db", limit=1, max_queue=10)
+        order, release = [], asyncio.Event()
+        tasks = [asyncio.create_task(hold(limiter, PRIORITY_SEARCH, order, release, "first"))]
+        await settle()
+        for name, priority in [("background", PRIORITY_BACKGROUND), ("llm", PRIORITY_LLM), ("search", PRIORITY_SEARCH)]:
+            tasks.append(asyncio.create_task(hold(limiter, priority, order, release, name)))
+        await settle()
+        assert len(limiter.waiters) == 3
+        release.set()
+        await asyncio.gather(*tasks)
+        return order, limiter
+
+    order, limiter = asyncio.run(run())
+    assert order == ["first", "search", "llm", "background"]
+    assert limiter.active == 0 and limiter.admitted == 4 and limiter.waited == 3
+
+
+def test_full_queue_rejects_and_sheds():
+    async def run():
+        limiter = ConcurrencyLimiter("embedder", limit=1, max_queue=2)
+        order, release = [], asyncio.Event()
+        tasks = [asyncio.create_task(hold(limiter, PRIORITY_LLM, order, release, "active"))]
+        await settle()
+        tasks += [asyncio.create_task(hold(limiter, PRIORITY_LLM, order, release, f"llm {i}")) for i in range(2)]
+        await settle()
+
+        # Same priority as every waiter: nothing to shed
+        assert not limiter.admits(PRIORITY_LLM)
+        with pytest.raises(OverloadedError):
+            await limiter.acquire(PRIORITY_LLM)
+
+        # A search call takes the place of the newest LLM waiter
+        assert limiter.admits(PRIORITY_SEARCH)
+        tasks.append(asyncio.create_task(hold(limiter, PRIORITY_SEARCH, order, release, "search")))
+        await settle()
+        release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return order, results, limiter
+
+    order, results, limiter = asyncio.run(run())
+    assert order == ["active", "search", "llm 0"]
+    assert isinstance(results[2], OverloadedError) and "shed" in str(results[2])
+    assert limiter.rejected == {"queue_full": 1, "shed": 1, "timeout": 0}
+    assert limiter.active == 0 and not limiter.waiters
+
+
+def test_queue_timeout():
+    async def run():
+        limiter = ConcurrencyLimiter("llm", limit=1, max_queue=5, queue_timeout=0.01)
+        release = asyncio.Event()
+        task = asyncio.create_task(hold(limiter, PRIORITY_SEARCH, [], release, "active"))
+        await settle()
+        with pytest.raises(OverloadedError, match="queue timeout"):
+            async with limiter.slot(PRIORITY_SEARCH):
+                pass
+        release.set()
+        await task
+        return limiter
+
+    limiter = asyncio.run(run())
+    assert limiter.rejected["timeout"] == 1
+    assert limiter.active == 0 and not limiter.waiters
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def run():
+        limiter = ConcurrencyLimiter("vector_db", limit=1, max_queue=5)
+        order, release = [], asyncio.Event()
+        active = asyncio.create_task(hold(limiter, PRIORITY_SEARCH, order, release, "active"))
+        await settle()
+        waiter = asyncio.create_task(hold(limiter, PRIORITY_SEARCH, order, release, "cancelled"))
+        await settle()
+        waiter.cancel()
+        await settle()
+        assert not limiter.waiters
+        release.set()
+        await active
+        # The slot is free again
+        async with limiter.slot(PRIORITY_SEARCH):
+            assert limiter.active == 1
+        return order, limiter
+
+    order, limiter = asyncio.run(run())
+    assert order == ["active"]
+    assert limiter.active == 0
@@ -0,0 +1,100 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("EMBEDDER_ENDPOINT_URL", "http://127.0.0.1:9/")
+
+from src import main
+from src.cache import ResultCache
+from src.pagination import ResultSetStore, decode_cursor, encode_cursor
+
+
+def story(hn_id):
+    return {"title": f"story {hn_id}", "url": f"https://example.com/{hn_id}", "hn_id": hn_id}
+
+
+class FakeEmbedder:
+    async def aembed_documents(self, texts):
+        return [[float(len(text))] for text in texts]
+
+
+class FakeBackend:
+    async def search(self, queries, vectors, k, offset=0):
+        # A ranking of 500 stories that depends on the query
+        results = []
+        for vector in vectors:
+            ranking = sorted(range(500), key=lambda i: (i * int(vector[0])) % 503)
+            results.append([(story(i), 1.0 / (1 + rank)) for rank, i in enumerate(ranking)][offset : offset + k])
+        return results
+
+    async def fetch(self, hn_ids):
+        return [story(i) for i in hn_ids]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, "backend", FakeBackend())
+    monkeypatch.setattr(main, "embedder", FakeEmbedder())
+    monkeypatch.setattr(main, "result_cache", ResultCache(ttl=0))
+    # Without the lifespan: no dependency is started
+    return TestClient(main.app)
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor("abc", 40, 20)) == ("abc", 40, 20)
+
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", encode_cursor("abc", -20, 20), encode_cursor("abc", 0, 0)])
+def test_invalid_cursors(cursor):
+    assert decode_cursor(cursor) is None
+
+
+def test_result_set_store_evicts_the_oldest():
+    store = ResultSetStore(max_bytes=3 * 100 * 8)
+    result_sets = [store.put(range(100)) for _ in range(4)]
+    assert store.get(result_sets[0]) is None
+    assert list(store.get(result_sets[-1])) == list(range(100))
+
+
+def test_pages_follow_the_ranking(client):
+    ranking = [{"title": "", "url": "", "hn_id": hn_id} for hn_id in range(1000, 1045)]
+    page = main.first_page(ranking, 20)
+    seen = [story["hn_id"] for story in page["results"]]
+    assert page["total"] == 45
+    pages = 1
+    while page["next_cursor"] is not None:
+        response = client.get(f"/results/{page['next_cursor']}")
+        assert response.status_code == 200
+        page = response.json()
+        seen += [story["hn_id"] for story in page["results"]]
+        pages += 1
+    assert pages == 3
+    assert seen == list(range(1000, 1045))
+
+
+def test_unknown_cursor(client):
+    assert client.get(f"/results/{encode_cursor('missing', 20, 20)}").status_code == 404
+
+
+@pytest.mark.parametrize("page_size", [0, -5, 100000])
+def test_invalid_page_size(client, page_size):
+    response = client.post("/search", json={"user_input": "rust", "page_size": page_size})
+    assert response.status_code == 422
+
+
+def test_cursors_walk_the_ranking_of_search(client):
+    request = {"user_input": "rust and databases", "k": 100}
+    ranking = [story["hn_id"] for story in client.post("/search", json=request).json()["results"]]
+    page = client.post("/search", json={**request, "page_size": 30}).json()
+    assert page["total"] == 100
+    seen = [story["hn_id"] for story in page["results"]]
+    cursors = set()
+    while page["next_cursor"] is not None:
+        cursors.add(page["next_cursor"])
+        page = client.get(f"/results/{page['next_cursor']}").json()
+        seen += [story["hn_id"] for story in page["results"]]
+    assert seen == ranking and len(cursors) == 3
+    # A cursor can be read again
+    cursor = cursors.pop()
+    assert client.get(f"/results/{cursor}").json() == client.get(f"/results/{cursor}").json()
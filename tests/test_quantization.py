@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from src.ann import recall_at_k, sample_queries
+from src.local_index import ExactIndex
+from src.quantization import QuantizedIndex
+
+
+@pytest.mark.parametrize("kind,min_recall", [("binary", 0.9), ("int8", 0.99)])
+def test_quantized_recall(vector_index, kind, min_recall):
+    exact = ExactIndex.load(vector_index)
+    QuantizedIndex.build(vector_index, kind)
+    index = QuantizedIndex.load(vector_index, kind, oversample=10)
+    queries = sample_queries(exact.vectors, 50)
+    truth, truth_scores = exact.search(queries, 10)
+    ids, scores = index.search(queries, 10)
+    assert recall_at_k(truth, ids) >= min_recall
+    # Candidates are rescored at full precision
+    np.testing.assert_allclose(scores[:, 0], truth_scores[:, 0], rtol=1e-5)
+
+
+@pytest.mark.parametrize("kind", ["binary", "int8"])
+def test_coarse_scores_do_not_depend_on_the_chunks(vector_index, kind):
+    QuantizedIndex.build(vector_index, kind)
+    index = QuantizedIndex.load(vector_index, kind)
+    queries = sample_queries(index.vectors, 5)
+    ids, scores = index.search(queries, 20)
+    index.SCORE_CHUNK = 7
+    chunked_ids, chunked_scores = index.search(queries, 20)
+    np.testing.assert_array_equal(chunked_ids, ids)
+    np.testing.assert_allclose(chunked_scores, scores)
@@ -0,0 +1,59 @@
+import asyncio
+import gzip
+import json
+
+import pytest
+
+from src import serialization
+from src.serialization import Serializer, StoryFragments, batch_frames, negotiate_encoding
+
+RESULTS = [
+    {"title": f"Story é {i}", "url": f"https://example.com/{i}", "hn_id": i, "score": 1 / (1 + i)} for i in range(100)
+]
+
+
+@pytest.mark.parametrize(
+    "header,encoding",
+    [
+        ("", None),
+        ("gzip, deflate", "gzip"),
+        ("gzip;q=0", None),
+        ("*", "br" if serialization.brotli is not None else "gzip"),
+        ("br;q=0, gzip;q=0.5", "gzip"),
+        ("identity", None),
+    ],
+)
+def test_negotiate_encoding(header, encoding):
+    assert negotiate_encoding(header) == encoding
+
+
+def test_large_responses_are_compressed():
+    serializer = Serializer(compress_min_size=1024)
+    response = serializer.response({"results": RESULTS}, "search", "gzip")
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(response.body)) == {"results": RESULTS}
+
+    small = serializer.response({"results": RESULTS[:2]}, "search", "gzip")
+    assert "Content-Encoding" not in small.headers
+    assert json.loads(small.body) == {"results": RESULTS[:2]}
+
+
+def test_story_fragments_encode_like_json():
+    fragments = StoryFragments(max_entries=10)
+    stories = RESULTS[:20] + [{**RESULTS[0], "extra": True}, {k: v for k, v in RESULTS[1].items() if k != "score"}]
+    for _ in range(2):
+        assert json.loads(fragments.encode(stories)) == stories
+    assert len(fragments.fragments) == 10
+
+
+def test_small_frames_are_batched():
+    async def frames():
+        for token in ["a", "b", "c"]:
+            yield token.encode(), True
+        yield b"results", False
+        yield b"d", True
+
+    async def run():
+        return [chunk async for chunk in batch_frames(frames(), flush_interval=1.0)]
+
+    assert asyncio.run(run()) == [b"abcresults", b"d"]
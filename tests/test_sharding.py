@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from src.ann import sample_queries
+from src.local_index import ExactIndex
+from src.sharding import ShardedIndex, shard_ranges
+
+
+def test_shard_ranges_cover_the_rows():
+    ranges = shard_ranges(10, 4)
+    assert ranges[0][0] == 0 and ranges[-1][1] == 10
+    assert all(stop == start for (_, stop), (start, _) in zip(ranges, ranges[1:]))
+    assert shard_ranges(2, 4) == [(0, 1), (1, 2)]
+
+
+@pytest.mark.parametrize("k", [10, 1500])
+def test_sharded_search_matches_exact_search(vector_index, k):
+    exact = ExactIndex.load(vector_index)
+    queries = sample_queries(exact.vectors, 20)
+    index = ShardedIndex(vector_index, n_shards=3, n_workers=2)
+    try:
+        ids, scores = index.search(queries, k)
+    finally:
+        index.close()
+    truth_ids, truth_scores = exact.search(queries, k)
+    np.testing.assert_allclose(scores, truth_scores, rtol=1e-6)
+    assert np.mean(ids == truth_ids) > 0.99